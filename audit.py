@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, select
+
+from database import engine, get_db, ActivityLog
+import config
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+ARCHIVE_PATTERN = "activity-*.jsonl.gz"
+
+_COLUMNS = (
+    ActivityLog.id, ActivityLog.group_id, ActivityLog.user_id, ActivityLog.action,
+    ActivityLog.details, ActivityLog.success, ActivityLog.error_message, ActivityLog.created_at,
+)
+
+
+class Cursor(NamedTuple):
+    """موضع في السجل بمفتاح (created_at, id)، يُرمّز كأعداد صحيحة داخل أزرار الصفحات"""
+    created_at: datetime
+    id: int
+
+    def encode(self) -> Tuple[int, int]:
+        return (self.created_at - EPOCH) // timedelta(microseconds=1), self.id
+
+    @classmethod
+    def decode(cls, micros: int, row_id: int) -> "Cursor":
+        return cls(EPOCH + timedelta(microseconds=micros), row_id)
+
+
+class Page(NamedTuple):
+    rows: List[Any]
+    older: Optional[Cursor]
+    newer: Optional[Cursor]
+
+
+def _row_to_dict(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "group_id": row.group_id,
+        "user_id": row.user_id,
+        "action": row.action,
+        "details": row.details,
+        "success": row.success,
+        "error": row.error_message,
+        "created_at": row.created_at.isoformat(),
+    }
+
+
+class AuditLog:
+    """سجل نشاط للإضافة فقط: الإدخالات تُجمع في الذاكرة وتُكتب دفعة واحدة
+
+    القراءة بترقيم المفتاح على الفهرس (group_id, created_at, id) فتكلفة أي
+    صفحة ثابتة، والأجزاء القديمة تُنقل شهرياً إلى ملفات JSONL مضغوطة.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def append(self, entry: Dict[str, Any]) -> bool:
+        """إضافة إدخال وإرجاع True إذا امتلأت الدفعة"""
+        with self._lock:
+            self._buffer.append(entry)
+            return len(self._buffer) >= self.batch_size
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        try:
+            with get_db() as db:
+                db.execute(insert(ActivityLog), rows)
+        except Exception as e:
+            logger.error(f"فشل في كتابة سجل النشاط: {e}")
+            with self._lock:
+                self._buffer[:0] = rows
+            return 0
+        return len(rows)
+
+    def page(self, group_id: int, cursor: Optional[Cursor] = None, newer: bool = False,
+             limit: int = config.AUDIT_PAGE_SIZE) -> Page:
+        """صفحة من السجل الأحدث أولاً، قبل المؤشر أو بعده"""
+        query = select(*_COLUMNS).where(ActivityLog.group_id == group_id)
+        if cursor is not None:
+            if newer:
+                query = query.where(or_(
+                    ActivityLog.created_at > cursor.created_at,
+                    and_(ActivityLog.created_at == cursor.created_at, ActivityLog.id > cursor.id),
+                ))
+            else:
+                query = query.where(or_(
+                    ActivityLog.created_at < cursor.created_at,
+                    and_(ActivityLog.created_at == cursor.created_at, ActivityLog.id < cursor.id),
+                ))
+        if newer:
+            query = query.order_by(ActivityLog.created_at.asc(), ActivityLog.id.asc())
+        else:
+            query = query.order_by(ActivityLog.created_at.desc(), ActivityLog.id.desc())
+
+        with get_db() as db:
+            rows = db.execute(query.limit(limit + 1)).all()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if newer:
+            rows.reverse()
+            has_newer, has_older = more, True
+        else:
+            has_newer, has_older = cursor is not None, more
+        if not rows:
+            return Page(rows, None, None)
+        first, last = rows[0], rows[-1]
+        return Page(
+            rows,
+            Cursor(last.created_at, last.id) if has_older else None,
+            Cursor(first.created_at, first.id) if has_newer else None,
+        )
+
+    def _stream(self, query) -> Iterator[Any]:
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=config.MEMBER_STREAM_BATCH).execute(query)
+            for partition in result.partitions():
+                yield from partition
+
+    def archive(self, cutoff: datetime, directory: str = config.AUDIT_ARCHIVE_PATH) -> int:
+        """نقل الإدخالات الأقدم من cutoff إلى ملف مضغوط لكل شهر ثم حذفها من الجدول"""
+        os.makedirs(directory, exist_ok=True)
+        query = select(*_COLUMNS) \
+            .where(ActivityLog.created_at < cutoff) \
+            .order_by(ActivityLog.created_at, ActivityLog.id)
+
+        archived = 0
+        month, out = None, None
+        try:
+            for row in self._stream(query):
+                row_month = row.created_at.strftime("%Y-%m")
+                if row_month != month:
+                    if out is not None:
+                        out.close()
+                    month = row_month
+                    # الإلحاق بملف gzip ينشئ عضواً جديداً ويبقى الملف صالحاً للقراءة المتصلة
+                    out = gzip.open(os.path.join(directory, f"activity-{month}.jsonl.gz"), "ab")
+                out.write(json.dumps(_row_to_dict(row), ensure_ascii=False).encode("utf-8") + b"\n")
+                archived += 1
+        finally:
+            if out is not None:
+                out.close()
+
+        if archived:
+            with get_db() as db:
+                db.execute(delete(ActivityLog).where(ActivityLog.created_at < cutoff))
+        return archived
+
+    def export(self, out: BinaryIO, group_id: Optional[int] = None,
+               directory: str = config.AUDIT_ARCHIVE_PATH) -> int:
+        """كتابة السجل كاملاً بصيغة JSONL: الأرشيف أولاً ثم الجدول، دون تحميله في الذاكرة"""
+        written = 0
+        for path in sorted(glob.glob(os.path.join(directory, ARCHIVE_PATTERN))):
+            with gzip.open(path, "rb") as archive:
+                for line in archive:
+                    if group_id is not None and json.loads(line)["group_id"] != group_id:
+                        continue
+                    out.write(line)
+                    written += 1
+
+        query = select(*_COLUMNS).order_by(ActivityLog.created_at, ActivityLog.id)
+        if group_id is not None:
+            query = query.where(ActivityLog.group_id == group_id)
+        for row in self._stream(query):
+            out.write(json.dumps(_row_to_dict(row), ensure_ascii=False).encode("utf-8") + b"\n")
+            written += 1
+        return written
+
+
+audit_log = AuditLog(config.AUDIT_BATCH_SIZE)
+
+
+async def log_activity(user_id: int, chat_id: int, action: str, details: Optional[Dict[str, Any]] = None,
+                       success: bool = True, error: Optional[str] = None) -> None:
+    """تسجيل نشاط في السجل؛ الكتابة الفعلية تتم على دفعات"""
+    full = audit_log.append({
+        "group_id": chat_id,
+        "user_id": user_id,
+        "action": action[:50],
+        "details": details or None,
+        "success": success,
+        "error_message": error,
+        "created_at": datetime.utcnow(),
+    })
+    if full:
+        await asyncio.to_thread(audit_log.flush)
+
+
+def export_activity(path: str, group_id: Optional[int] = None) -> int:
+    """تصدير السجل إلى ملف JSONL مضغوط"""
+    audit_log.flush()
+    with gzip.open(path, "wb") as out:
+        return audit_log.export(out, group_id)
+
+
+def flush_audit_log() -> None:
+    """وظيفة الجدولة لكتابة إدخالات السجل المتراكمة"""
+    audit_log.flush()
+
+
+def archive_audit_log() -> None:
+    """وظيفة الجدولة لأرشفة الإدخالات الأقدم من مدة الاحتفاظ"""
+    audit_log.flush()
+    cutoff = datetime.utcnow() - timedelta(days=config.AUDIT_RETENTION_DAYS)
+    try:
+        archived = audit_log.archive(cutoff)
+    except Exception as e:
+        logger.error(f"فشل في أرشفة سجل النشاط: {e}")
+        return
+    if archived:
+        logger.info(f"تم أرشفة {archived} إدخال من سجل النشاط")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="أرشفة وتصدير سجل نشاط البوت")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="تصدير السجل كاملاً إلى JSONL مضغوط")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--group", type=int, default=None)
+    archive_parser = subparsers.add_parser("archive", help="أرشفة الإدخالات القديمة الآن")
+    archive_parser.add_argument("--days", type=int, default=config.AUDIT_RETENTION_DAYS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL))
+    if args.command == "export":
+        result = {"path": args.path, "entries": export_activity(args.path, args.group)}
+    else:
+        result = {"archived": audit_log.archive(datetime.utcnow() - timedelta(days=args.days))}
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import argparse
+import base64
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from sqlalchemy import DateTime, LargeBinary, delete, insert, select
+
+from database import Base, engine, reset_sequences
+import config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+DUMP_BATCH_SIZE = 1000
+
+
+def _compression() -> str:
+    """تحديد نوع الضغط المتاح (zstd عند توفر المكتبة وإلا gzip)"""
+    if config.BACKUP_COMPRESSION == "zstd" and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def _open_writer(path: str, compression: str) -> BinaryIO:
+    """فتح ملف للكتابة المضغوطة المتدفقة"""
+    if compression == "zstd":
+        raw = open(path, "wb")
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+    return gzip.open(path, "wb", compresslevel=6)
+
+
+def _open_reader(path: str) -> BinaryIO:
+    """فتح ملف نسخة احتياطية للقراءة حسب امتداده"""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("مكتبة zstandard غير مثبتة لفك ضغط النسخة")
+        raw = open(path, "rb")
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    return gzip.open(path, "rb")
+
+
+def _backup_filename(kind: str, compression: str) -> str:
+    suffix = ".zst" if compression == "zstd" else ".gz"
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    return f"backup-{stamp}.{kind}{suffix}"
+
+
+def _sqlite_path() -> Optional[str]:
+    """مسار ملف قاعدة البيانات إذا كانت SQLite على القرص"""
+    if engine.url.get_backend_name() != "sqlite":
+        return None
+    database = engine.url.database
+    if not database or database == ":memory:":
+        return None
+    return database
+
+
+def _copy_stream(source: BinaryIO, target: BinaryIO) -> int:
+    written = 0
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            return written
+        target.write(chunk)
+        written += len(chunk)
+
+
+def _backup_sqlite(db_path: str, target_path: str, compression: str) -> None:
+    """نسخ SQLite عبر واجهة النسخ المباشر على خطوات صغيرة ثم ضغطها تدفقياً"""
+    fd, snapshot_path = tempfile.mkstemp(suffix=".db", dir=config.BACKUP_PATH)
+    os.close(fd)
+    try:
+        source = sqlite3.connect(db_path)
+        snapshot = sqlite3.connect(snapshot_path)
+        try:
+            # كل خطوة تنسخ عدداً محدوداً من الصفحات ثم تحرر القفل حتى لا يتعطل الكُتّاب
+            source.backup(
+                snapshot,
+                pages=config.BACKUP_PAGES_PER_STEP,
+                sleep=config.BACKUP_STEP_SLEEP,
+            )
+        finally:
+            snapshot.close()
+            source.close()
+
+        with open(snapshot_path, "rb") as raw, _open_writer(target_path, compression) as out:
+            _copy_stream(raw, out)
+    finally:
+        os.remove(snapshot_path)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # JSON لا يحمل بايتات؛ تُفك في _decode_row حسب نوع العمود
+        return base64.b64encode(bytes(value)).decode("ascii")
+    return value
+
+
+def _backup_logical(target_path: str, compression: str) -> int:
+    """تفريغ منطقي للجداول جدولاً بجدول على دفعات بأسطر JSON"""
+    rows = 0
+    with _open_writer(target_path, compression) as out, engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, yield_per=DUMP_BATCH_SIZE)
+        for table in Base.metadata.sorted_tables:
+            result = conn.execute(select(table))
+            for partition in result.mappings().partitions():
+                lines = [
+                    json.dumps(
+                        {"table": table.name, "row": {k: _encode_value(v) for k, v in row.items()}},
+                        ensure_ascii=False,
+                    )
+                    for row in partition
+                ]
+                out.write(("\n".join(lines) + "\n").encode("utf-8"))
+                rows += len(lines)
+    return rows
+
+
+def rotate_backups() -> List[str]:
+    """حذف النسخ القديمة مع الإبقاء على أحدث BACKUP_KEEP نسخة"""
+    if config.BACKUP_KEEP <= 0 or not os.path.isdir(config.BACKUP_PATH):
+        return []
+    backups = sorted(
+        name for name in os.listdir(config.BACKUP_PATH) if name.startswith("backup-")
+    )
+    removed = backups[:-config.BACKUP_KEEP]
+    for name in removed:
+        try:
+            os.remove(os.path.join(config.BACKUP_PATH, name))
+        except OSError as e:
+            logger.error(f"فشل في حذف النسخة القديمة {name}: {e}")
+    return removed
+
+
+def create_backup() -> Dict[str, Any]:
+    """إنشاء نسخة احتياطية مضغوطة وإرجاع مدتها وحجمها"""
+    os.makedirs(config.BACKUP_PATH, exist_ok=True)
+    compression = _compression()
+    started = time.monotonic()
+    db_path = _sqlite_path()
+    rows = None
+
+    if db_path:
+        target_path = os.path.join(config.BACKUP_PATH, _backup_filename("sqlite", compression))
+        _backup_sqlite(db_path, target_path, compression)
+    else:
+        target_path = os.path.join(config.BACKUP_PATH, _backup_filename("jsonl", compression))
+        rows = _backup_logical(target_path, compression)
+
+    result = {
+        "path": target_path,
+        "compression": compression,
+        "bytes_written": os.path.getsize(target_path),
+        "duration": time.monotonic() - started,
+        "rows": rows,
+        "removed": rotate_backups(),
+    }
+    logger.info(
+        f"تم إنشاء نسخة احتياطية {target_path} "
+        f"({result['bytes_written']} بايت في {result['duration']:.2f} ثانية)"
+    )
+    return result
+
+
+def scheduled_backup() -> None:
+    """وظيفة الجدولة للنسخ الاحتياطي الدوري"""
+    try:
+        create_backup()
+    except Exception as e:
+        logger.error(f"فشل في النسخ الاحتياطي: {e}")
+
+
+def _restore_sqlite(backup_path: str, db_path: str) -> None:
+    fd, snapshot_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(db_path)))
+    os.close(fd)
+    try:
+        with _open_reader(backup_path) as source, open(snapshot_path, "wb") as raw:
+            _copy_stream(source, raw)
+        engine.dispose()
+        snapshot = sqlite3.connect(snapshot_path)
+        target = sqlite3.connect(db_path)
+        try:
+            snapshot.backup(target, pages=config.BACKUP_PAGES_PER_STEP)
+        finally:
+            target.close()
+            snapshot.close()
+    finally:
+        os.remove(snapshot_path)
+
+
+def _decode_row(table, row: Dict[str, Any]) -> Dict[str, Any]:
+    for column in table.columns:
+        value = row.get(column.name)
+        if value is None:
+            continue
+        if isinstance(column.type, DateTime):
+            row[column.name] = datetime.fromisoformat(value)
+        elif isinstance(column.type, LargeBinary):
+            row[column.name] = base64.b64decode(value)
+    return row
+
+
+def _restore_logical(backup_path: str) -> int:
+    order = {table.name: rank for rank, table in enumerate(Base.metadata.sorted_tables)}
+    tables = {table.name: table for table in Base.metadata.sorted_tables}
+    rows = 0
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(delete(table))
+
+        # الآباء تُدرج كاملة قبل الأبناء كي لا تُكسر المفاتيح الأجنبية (Postgres)
+        current = None
+        batch: List[Dict[str, Any]] = []
+        with _open_reader(backup_path) as raw:
+            for line in raw:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                table = tables[record["table"]]
+                if table is not current:
+                    if current is not None and order[table.name] < order[current.name]:
+                        raise ValueError(f"النسخة غير مرتبة حسب اعتمادية الجداول: {table.name} بعد {current.name}")
+                    if batch:
+                        conn.execute(insert(current), batch)
+                        rows += len(batch)
+                        batch = []
+                    current = table
+                batch.append(_decode_row(table, record["row"]))
+                if len(batch) >= DUMP_BATCH_SIZE:
+                    conn.execute(insert(table), batch)
+                    rows += len(batch)
+                    batch = []
+        if batch:
+            conn.execute(insert(current), batch)
+            rows += len(batch)
+        # المفاتيح أُدرجت بقيم صريحة
+        reset_sequences(conn, Base.metadata.sorted_tables)
+    return rows
+
+
+def restore_backup(backup_path: str) -> Dict[str, Any]:
+    """استعادة قاعدة البيانات من ملف نسخة احتياطية"""
+    started = time.monotonic()
+    rows = None
+    if ".sqlite." in os.path.basename(backup_path):
+        db_path = _sqlite_path()
+        if not db_path:
+            raise RuntimeError("لا يمكن استعادة نسخة SQLite إلى قاعدة بيانات غير SQLite")
+        _restore_sqlite(backup_path, db_path)
+    else:
+        rows = _restore_logical(backup_path)
+
+    result = {
+        "path": backup_path,
+        "bytes_read": os.path.getsize(backup_path),
+        "duration": time.monotonic() - started,
+        "rows": rows,
+    }
+    logger.info(f"تمت استعادة النسخة {backup_path} في {result['duration']:.2f} ثانية")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="النسخ الاحتياطي لقاعدة بيانات البوت")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backup", help="إنشاء نسخة احتياطية الآن")
+    restore_parser = subparsers.add_parser("restore", help="استعادة نسخة احتياطية")
+    restore_parser.add_argument("path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL))
+    if args.command == "backup":
+        result = create_backup()
+    else:
+        result = restore_backup(args.path)
+    print(json.dumps(result, ensure_ascii=False, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import config
+
+
+class ApiBudget:
+    """دلو رموز مشترك لميزانية طلبات Bot API
+
+    الأعمال الخلفية تطلب الرموز مع احتياطي محجوز، فلا تستهلك آخر الرموز
+    المتاحة وتبقى هناك سعة للردود التفاعلية.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def configure(self, rate: float, capacity: float) -> None:
+        """تغيير المعدل والسعة أثناء التشغيل مع احتساب الرموز المتراكمة بالمعدل السابق"""
+        self._refill()
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = min(self._tokens, capacity)
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def try_acquire(self, tokens: float = 1.0, reserve: float = 0.0) -> bool:
+        self._refill()
+        if self._tokens - tokens < reserve:
+            return False
+        self._tokens -= tokens
+        return True
+
+    async def acquire(self, tokens: float = 1.0, reserve: float = 0.0) -> None:
+        """انتظار توفر الرموز المطلوبة فوق الاحتياطي المحجوز"""
+        while not self.try_acquire(tokens, reserve):
+            missing = tokens + reserve - self._tokens
+            await asyncio.sleep(max(missing / self.rate, 0.01))
+
+
+api_budget = ApiBudget(config.API_BUDGET_PER_SECOND, config.API_BUDGET_BURST)
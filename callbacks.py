@@ -0,0 +1,134 @@
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+CALLBACK_VERSION = "1"
+SEPARATOR = ":"
+MAX_CALLBACK_DATA = 64
+
+# اسم الإجراء -> (الرمز المختصر, أنواع المعاملات)
+ACTIONS: Dict[str, Tuple[str, Tuple[type, ...]]] = {
+    "main_menu": ("m", ()),
+    "mention_all": ("ma", ()),
+    "scheduling": ("sc", ()),
+    "settings": ("st", ()),
+    "stats": ("ss", ()),
+    "set_time": ("t", ()),
+    "hour": ("h", (int,)),
+    "minute": ("mi", (int, int)),
+    "confirm_time": ("ct", (int, int)),
+    "toggle_scheduling": ("ts", ()),
+    "set_message": ("sm", ()),
+    "check_permissions": ("cp", ()),
+    "update_group_info": ("ug", ()),
+    "edit_member": ("em", ()),
+    "check_member_permissions": ("mp", ()),
+    "day": ("d", (int,)),
+    "set_language": ("sl", ()),
+    "set_lang": ("l", (str,)),
+    "toggle_bot": ("tb", ()),
+    "activity_page": ("ap", (int, int, int)),
+}
+
+_BY_CODE: Dict[str, Tuple[str, Tuple[type, ...]]] = {
+    code: (name, types) for name, (code, types) in ACTIONS.items()
+}
+
+# صيغ البيانات القديمة الموجودة في رسائل أُرسلت قبل الترميز المختصر
+_LEGACY_EXACT: Dict[str, str] = {
+    name: name for name, (_, types) in ACTIONS.items() if not types
+}
+_LEGACY_EXACT["custom_message"] = "set_message"
+_LEGACY_PREFIXES: Tuple[Tuple[str, str], ...] = (
+    ("confirm_time_", "confirm_time"),
+    ("minute_", "minute"),
+    ("hour_", "hour"),
+    ("day_", "day"),
+    ("set_lang_", "set_lang"),
+    ("lang_", "set_lang"),
+)
+
+
+class CallbackData(NamedTuple):
+    action: str
+    args: Tuple[Any, ...]
+
+
+def encode(action: str, *args: Any) -> str:
+    """ترميز إجراء ومعاملاته في callback_data مختصرة ضمن حد 64 بايت"""
+    code, types = ACTIONS[action]
+    if len(args) != len(types):
+        raise ValueError(f"الإجراء {action} يتوقع {len(types)} معامل")
+    data = SEPARATOR.join((CALLBACK_VERSION, code, *(str(arg) for arg in args)))
+    if len(data.encode("utf-8")) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data أطول من {MAX_CALLBACK_DATA} بايت: {data}")
+    return data
+
+
+def _convert(types: Tuple[type, ...], raw_args) -> Optional[Tuple[Any, ...]]:
+    if len(raw_args) != len(types):
+        return None
+    try:
+        return tuple(kind(value) for kind, value in zip(types, raw_args))
+    except ValueError:
+        return None
+
+
+def decode(data: Optional[str]) -> Optional[CallbackData]:
+    """فك ترميز callback_data إلى إجراء ومعاملات مطابقة للأنواع"""
+    if not data:
+        return None
+
+    parts = data.split(SEPARATOR)
+    if len(parts) >= 2 and parts[0] == CALLBACK_VERSION:
+        entry = _BY_CODE.get(parts[1])
+        if entry is None:
+            return None
+        args = _convert(entry[1], parts[2:])
+        return CallbackData(entry[0], args) if args is not None else None
+
+    action = _LEGACY_EXACT.get(data)
+    if action is not None:
+        return CallbackData(action, ())
+    for prefix, action in _LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            args = _convert(ACTIONS[action][1], data[len(prefix):].split("_"))
+            return CallbackData(action, args) if args is not None else None
+    return None
+
+
+CallbackHandler = Callable[..., Awaitable[None]]
+
+
+class Route(NamedTuple):
+    handler: CallbackHandler
+    admin_only: bool
+    # False: المعالج يجيب الاستعلام بنفسه (مثلاً بتنبيه نصي)، فتيليجرام لا يقبل إلا إجابة واحدة
+    answer: bool = True
+
+
+class CallbackRouter:
+    """توجيه استعلامات الأزرار بجدول مباشر بدلاً من سلسلة if/elif"""
+
+    def __init__(self):
+        self._routes: Dict[str, Route] = {}
+
+    def route(self, action: str, admin_only: bool = True, answer: bool = True):
+        if action not in ACTIONS:
+            raise KeyError(f"إجراء غير معروف: {action}")
+
+        def decorator(func: CallbackHandler) -> CallbackHandler:
+            self._routes[action] = Route(func, admin_only, answer)
+            return func
+
+        return decorator
+
+    def resolve(self, data: Optional[str]) -> Optional[Tuple[Route, CallbackData]]:
+        decoded = decode(data)
+        if decoded is None:
+            return None
+        route = self._routes.get(decoded.action)
+        if route is None:
+            return None
+        return route, decoded
+
+
+router = CallbackRouter()
@@ -0,0 +1,94 @@
+import logging
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import List, Sequence
+
+from sqlalchemy import delete, insert, select
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from database import get_db, ScheduledDeletion
+from outbound import Priority, priority
+import config
+
+logger = logging.getLogger(__name__)
+
+# الحد الأقصى لعدد الرسائل في طلب deleteMessages واحد
+DELETE_CHUNK = 100
+# حجم دفعات حذف السجلات المنفذة حتى لا تتجاوز حد معاملات SQLite
+ROW_DELETE_BATCH = 500
+
+
+def schedule_deletions(chat_id: int, message_ids: Sequence[int], ttl_minutes: int) -> None:
+    """تسجيل رسائل ليحذفها عامل التنظيف بعد انتهاء المهلة"""
+    if not message_ids:
+        return
+    delete_after = datetime.utcnow() + timedelta(minutes=ttl_minutes)
+    try:
+        with get_db() as db:
+            db.execute(
+                insert(ScheduledDeletion),
+                [{"chat_id": chat_id, "message_id": message_id, "delete_after": delete_after}
+                 for message_id in message_ids],
+            )
+    except Exception as e:
+        logger.error(f"فشل في جدولة حذف رسائل المجموعة {chat_id}: {e}")
+
+
+async def delete_messages(bot: Bot, chat_id: int, message_ids: List[int]) -> bool:
+    """حذف حتى 100 رسالة بطلب واحد"""
+    if hasattr(bot, "delete_messages"):
+        return await bot.delete_messages(chat_id, message_ids)
+    # الإصدار المثبت من المكتبة يسبق دعم deleteMessages، فيُرسل الطلب مباشرة
+    # عبر نفس مسار الطلبات (ومنه جدولة الأولوية والميزانية)
+    return await bot._post("deleteMessages", {"chat_id": chat_id, "message_ids": message_ids})
+
+
+async def cleanup_messages(bot: Bot) -> int:
+    """حذف الرسائل المستحقة مجمعة حسب المحادثة بطلبات deleteMessages"""
+    with get_db() as db:
+        rows = db.execute(
+            select(ScheduledDeletion.id, ScheduledDeletion.chat_id, ScheduledDeletion.message_id)
+            .where(ScheduledDeletion.delete_after <= datetime.utcnow())
+            .order_by(ScheduledDeletion.chat_id, ScheduledDeletion.message_id)
+            .limit(config.CLEANUP_BATCH)
+        ).all()
+
+    done: List[int] = []
+    calls = 0
+    for chat_id, chat_rows in groupby(rows, key=lambda row: row.chat_id):
+        chat_rows = list(chat_rows)
+        for start in range(0, len(chat_rows), DELETE_CHUNK):
+            chunk = chat_rows[start:start + DELETE_CHUNK]
+            try:
+                with priority(Priority.BACKGROUND):
+                    await delete_messages(bot, chat_id, [row.message_id for row in chunk])
+                calls += 1
+            except RetryAfter:
+                # تبقى الرسائل مسجلة وتُعاد المحاولة في الجولة التالية
+                logger.warning(f"تأجيل حذف رسائل المجموعة {chat_id} بسبب حد الطلبات")
+                break
+            except (BadRequest, Forbidden) as e:
+                # رسائل أقدم من 48 ساعة أو محذوفة أو البوت خارج المجموعة: لا فائدة من الإعادة
+                logger.warning(f"تعذر حذف رسائل المجموعة {chat_id}: {e}")
+            except TelegramError as e:
+                logger.error(f"فشل في حذف رسائل المجموعة {chat_id}: {e}")
+                break
+            done.extend(row.id for row in chunk)
+
+    if done:
+        with get_db() as db:
+            for start in range(0, len(done), ROW_DELETE_BATCH):
+                db.execute(delete(ScheduledDeletion).where(
+                    ScheduledDeletion.id.in_(done[start:start + ROW_DELETE_BATCH])
+                ))
+        logger.info(f"تم حذف {len(done)} رسالة إشارة بـ {calls} طلب")
+    return len(done)
+
+
+async def scheduled_cleanup(bot: Bot) -> None:
+    """وظيفة الجدولة لتنظيف رسائل الإشارة المنتهية"""
+    try:
+        await cleanup_messages(bot)
+    except Exception as e:
+        logger.error(f"فشل في تنظيف رسائل الإشارة: {e}")
@@ -2,6 +2,8 @@ import os
 from dotenv import load_dotenv
 from typing import List, Optional
 
+# المتغيرات المعرفة في بيئة العملية نفسها؛ load_dotenv لا يستبدلها، وإعادة التحميل تتبع نفس الأولوية
+PROCESS_ENV_KEYS = frozenset(os.environ)
 load_dotenv()
 
 # تحميل المتغيرات الأساسية
@@ -13,7 +15,10 @@ DB_URL = os.getenv("DB_URL", "sqlite:///bot_data.db")
 DEFAULT_BATCH_SIZE = int(os.getenv("DEFAULT_BATCH_SIZE", "7"))
 MENTION_DELAY = float(os.getenv("MENTION_DELAY", "0.5"))
 MENTION_FORMAT = os.getenv("MENTION_FORMAT", "username").lower()
+DEFAULT_MENTION_MESSAGE = os.getenv("DEFAULT_MENTION_MESSAGE", "📢 تنبيه للجميع")
+PIPELINE_CHUNK_SIZE = int(os.getenv("PIPELINE_CHUNK_SIZE", "100"))
 MAX_MENTIONS_PER_DAY = int(os.getenv("MAX_MENTIONS_PER_DAY", "0"))
+QUOTA_FLUSH_INTERVAL = int(os.getenv("QUOTA_FLUSH_INTERVAL", "30"))
 
 # إعدادات الأمان
 MAX_MESSAGE_LENGTH = int(os.getenv("MAX_MESSAGE_LENGTH", "4000"))
@@ -25,25 +30,79 @@ DEFAULT_MENTION_HOUR = int(os.getenv("DEFAULT_MENTION_HOUR", "9"))
 DEFAULT_MENTION_MINUTE = int(os.getenv("DEFAULT_MENTION_MINUTE", "0"))
 TIMEZONE = os.getenv("TIMEZONE", "Asia/Riyadh")
 
+# ميزانية طلبات Bot API المشتركة
+API_BUDGET_PER_SECOND = float(os.getenv("API_BUDGET_PER_SECOND", "25"))
+API_BUDGET_BURST = float(os.getenv("API_BUDGET_BURST", "30"))
+INTERACTIVE_API_RESERVE = float(os.getenv("INTERACTIVE_API_RESERVE", "10"))
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "8"))
+INTERACTIVE_LATENCY_SLO = float(os.getenv("INTERACTIVE_LATENCY_SLO", "0.2"))
+CHAT_MESSAGES_PER_MINUTE = int(os.getenv("CHAT_MESSAGES_PER_MINUTE", "20"))
+SCHEDULED_RUN_LANES = int(os.getenv("SCHEDULED_RUN_LANES", "4"))
+
+# إعدادات مطابقة قوائم الأعضاء
+RECONCILE_ENABLED = os.getenv("RECONCILE_ENABLED", "True").lower() == "true"
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "3600"))
+RECONCILE_STALE_AFTER = int(os.getenv("RECONCILE_STALE_AFTER", "24"))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "200"))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "5"))
+
 # إعدادات التخزين المؤقت
 CACHE_TIMEOUT = int(os.getenv("CACHE_TIMEOUT", "300"))
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL", "")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "state.snapshot")
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", "3600"))
 
 # إعدادات التخصيص
 DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", "ar")
 SUPPORTED_LANGUAGES = ["ar", "en"]
 
+# إعدادات حفظ حالة المحادثات
+PERSISTENCE_UPDATE_INTERVAL = int(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "30"))
+PERSISTENCE_FLUSH_INTERVAL = int(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "30"))
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", "900"))
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", "1000"))
+RUN_LEDGER_RETENTION_DAYS = int(os.getenv("RUN_LEDGER_RETENTION_DAYS", "3"))
+
 # إعدادات الشبكة
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "10"))
+CONNECT_TIMEOUT = float(os.getenv("CONNECT_TIMEOUT", "5"))
+POOL_TIMEOUT = float(os.getenv("POOL_TIMEOUT", "3"))
+SEND_MESSAGE_TIMEOUT = float(os.getenv("SEND_MESSAGE_TIMEOUT", str(REQUEST_TIMEOUT)))
+GET_CHAT_MEMBER_TIMEOUT = float(os.getenv("GET_CHAT_MEMBER_TIMEOUT", "5"))
+GET_UPDATES_TIMEOUT = float(os.getenv("GET_UPDATES_TIMEOUT", str(REQUEST_TIMEOUT)))
+CONNECTION_POOL_SIZE = int(os.getenv("CONNECTION_POOL_SIZE", "64"))
+HTTP_VERSION = os.getenv("HTTP_VERSION", "1.1")
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
 
 # إعدادات السجل والتصحيح
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+RECORD_UPDATES_PATH = os.getenv("RECORD_UPDATES_PATH", "")
+RECORD_ANONYMIZE = os.getenv("RECORD_ANONYMIZE", "True").lower() == "true"
+RECORD_SALT = os.getenv("RECORD_SALT", "")
+PROFILE_PATH = os.getenv("PROFILE_PATH", "profiles")
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
 
 # إعدادات النسخ الاحتياطي
 BACKUP_ENABLED = os.getenv("BACKUP_ENABLED", "False").lower() == "true"
 BACKUP_PATH = os.getenv("BACKUP_PATH", "backups")
 BACKUP_INTERVAL = int(os.getenv("BACKUP_INTERVAL", "24"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_COMPRESSION = os.getenv("BACKUP_COMPRESSION", "zstd").lower()
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.05"))
 
 # إعدادات إضافية
 DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
-MAX_GROUP_MEMBERS = int(os.getenv("MAX_GROUP_MEMBERS", "200"))
\ No newline at end of file
+MAX_GROUP_MEMBERS = int(os.getenv("MAX_GROUP_MEMBERS", "200"))
+MEMBER_STREAM_BATCH = int(os.getenv("MEMBER_STREAM_BATCH", "1000"))
+MEMBER_IMPORT_BATCH = int(os.getenv("MEMBER_IMPORT_BATCH", "10000"))
+TAG_REFRESH_INTERVAL = int(os.getenv("TAG_REFRESH_INTERVAL", "3600"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL = int(os.getenv("AUDIT_FLUSH_INTERVAL", "5"))
+AUDIT_PAGE_SIZE = int(os.getenv("AUDIT_PAGE_SIZE", "10"))
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "90"))
+AUDIT_ARCHIVE_PATH = os.getenv("AUDIT_ARCHIVE_PATH", "audit_archive")
+CLEANUP_INTERVAL = int(os.getenv("CLEANUP_INTERVAL", "60"))
+CLEANUP_BATCH = int(os.getenv("CLEANUP_BATCH", "5000"))
\ No newline at end of file
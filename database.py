@@ -1,9 +1,10 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Enum, JSON
+from sqlalchemy import create_engine, func, insert, select, text, Column, BigInteger, Integer, String, DateTime, Boolean, ForeignKey, Enum, JSON, Index, LargeBinary
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.exc import IntegrityError
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 import logging
-from typing import List, Dict, Any, Optional, Generator
+from typing import List, Dict, Any, Optional, Generator, Iterator, NamedTuple, Tuple
 import config
 
 logger = logging.getLogger(__name__)
@@ -22,10 +23,11 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 class Group(Base):
     __tablename__ = "groups"
-    group_id = Column(Integer, primary_key=True, index=True)
+    # معرفات تيليجرام (مثل -100XXXXXXXXXX) لا تتسع في INTEGER بطول 32 بت في PostgreSQL
+    group_id = Column(BigInteger, primary_key=True, autoincrement=False, index=True)
     group_name = Column(String(255), nullable=True)
     group_type = Column(String(50), nullable=True)
-    group_language = Column(Enum(*config.SUPPORTED_LANGUAGES), default=config.DEFAULT_LANGUAGE)
+    group_language = Column(Enum(*config.SUPPORTED_LANGUAGES, name="group_language"), default=config.DEFAULT_LANGUAGE)
     mention_hour = Column(Integer, default=config.DEFAULT_MENTION_HOUR)
     mention_minute = Column(Integer, default=config.DEFAULT_MENTION_MINUTE)
     is_active = Column(Boolean, default=True)
@@ -40,24 +42,11 @@ class Group(Base):
     members = relationship("Member", back_populates="group", cascade="all, delete-orphan")
     mention_logs = relationship("MentionLog", back_populates="group", cascade="all, delete-orphan")
 
-    def can_mention_today(self) -> bool:
-        if config.MAX_MENTIONS_PER_DAY == 0:
-            return True
-        if self.last_mention_date.date() < datetime.utcnow().date():
-            self.mention_count_today = 0
-            self.last_mention_date = datetime.utcnow()
-            return True
-        return self.mention_count_today < config.MAX_MENTIONS_PER_DAY
-
-    def increment_mention_count(self) -> None:
-        self.mention_count_today += 1
-        self.last_mention_date = datetime.utcnow()
-
 class Member(Base):
     __tablename__ = "members"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False, index=True)
-    group_id = Column(Integer, ForeignKey("groups.group_id"), nullable=False, index=True)
+    user_id = Column(BigInteger, nullable=False, index=True)
+    group_id = Column(BigInteger, ForeignKey("groups.group_id"), nullable=False, index=True)
     username = Column(String(100), nullable=True)
     first_name = Column(String(100), nullable=True)
     last_name = Column(String(100), nullable=True)
@@ -66,17 +55,25 @@ class Member(Base):
     is_admin = Column(Boolean, default=False)
     is_active = Column(Boolean, default=True)
     joined_date = Column(DateTime, default=datetime.utcnow)
+    last_verified = Column(DateTime, nullable=True)
     settings = Column(JSON, default={})
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     group = relationship("Group", back_populates="members")
+    
+    __table_args__ = (
+        Index('ix_members_group_verified', 'group_id', 'last_verified'),
+        Index('ix_members_group_user', 'group_id', 'user_id', unique=True),
+        # قراءة أعضاء المجموعة على دفعات بترتيب المفتاح (keyset)
+        Index('ix_members_group_id_id', 'group_id', 'id'),
+    )
 
 class MentionLog(Base):
     __tablename__ = "mention_logs"
     id = Column(Integer, primary_key=True, index=True)
-    group_id = Column(Integer, ForeignKey("groups.group_id"), nullable=False, index=True)
-    user_id = Column(Integer, nullable=False)
+    group_id = Column(BigInteger, ForeignKey("groups.group_id"), nullable=False, index=True)
+    user_id = Column(BigInteger, nullable=False)
     mention_type = Column(String(50), nullable=False)
     mention_count = Column(Integer, default=0)
     mentioned_members = Column(JSON, default=[])
@@ -90,8 +87,8 @@ class MentionLog(Base):
 class RateLimitRecord(Base):
     __tablename__ = "rate_limit_records"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False, index=True)
-    group_id = Column(Integer, ForeignKey("groups.group_id"), nullable=False, index=True)
+    user_id = Column(BigInteger, nullable=False, index=True)
+    group_id = Column(BigInteger, ForeignKey("groups.group_id"), nullable=False, index=True)
     command = Column(String(50), nullable=False)
     count = Column(Integer, default=1)
     last_used = Column(DateTime, default=datetime.utcnow)
@@ -100,6 +97,70 @@ class RateLimitRecord(Base):
     
     __table_args__ = (Index('ix_user_rate_limits', 'user_id', 'group_id', 'command'),)
 
+class PersistentData(Base):
+    __tablename__ = "persistent_data"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    key = Column(String(100), nullable=False)
+    data = Column(JSON, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (Index('ix_persistent_data_kind_key', 'kind', 'key', unique=True),)
+
+class MentionRun(Base):
+    __tablename__ = "mention_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(BigInteger, ForeignKey("groups.group_id"), nullable=False)
+    trigger = Column(String(64), nullable=False)
+    scheduled_for = Column(DateTime, nullable=False)
+    status = Column(String(20), default="started")
+    mention_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (Index('ix_mention_runs_key', 'group_id', 'trigger', 'scheduled_for', unique=True),)
+
+class MemberTag(Base):
+    __tablename__ = "member_tags"
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(BigInteger, ForeignKey("groups.group_id"), nullable=False)
+    name = Column(String(32), nullable=False)
+    members = Column(LargeBinary, nullable=False)
+    member_count = Column(Integer, default=0)
+    rule = Column(String(50), nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (Index('ix_member_tags_group_name', 'group_id', 'name', unique=True),)
+
+class ActivityLog(Base):
+    __tablename__ = "activity_logs"
+    id = Column(Integer, primary_key=True)
+    group_id = Column(BigInteger, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    action = Column(String(50), nullable=False)
+    details = Column(JSON, nullable=True)
+    success = Column(Boolean, default=True)
+    error_message = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (Index('ix_activity_logs_keyset', 'group_id', 'created_at', 'id'),)
+
+class ScheduledDeletion(Base):
+    __tablename__ = "scheduled_deletions"
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(Integer, nullable=False)
+    delete_after = Column(DateTime, nullable=False)
+    
+    __table_args__ = (Index('ix_scheduled_deletions_due', 'delete_after', 'chat_id'),)
+
+class MemberRow(NamedTuple):
+    """صف مختصر بالأعمدة التي يحتاجها مسار الإشارة فقط"""
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+
 def init_db():
     try:
         Base.metadata.create_all(bind=engine)
@@ -107,6 +168,74 @@ def init_db():
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
         raise
+    _create_missing_indexes()
+
+def _create_missing_indexes():
+    """create_all لا يضيف الفهارس الجديدة إلى جداول موجودة مسبقاً، فتُنشأ هنا"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                # فهرس فريد على بيانات مكررة قديمة: يبقى الجدول يعمل دون الفهرس
+                logger.error(f"تعذر إنشاء الفهرس {index.name}: {e}")
+
+def _dialect_insert(model, dialect=None):
+    if (dialect or engine.dialect.name) == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(model)
+
+def insert_ignore(model):
+    """عبارة INSERT تتجاهل الصفوف المتعارضة مع فهرس فريد (PostgreSQL و SQLite فقط)"""
+    return _dialect_insert(model).on_conflict_do_nothing()
+
+def insert_or_ignore(db, model, **values) -> bool:
+    """إدراج صف وتجاهله إن تعارض مع فهرس فريد، وإرجاع True إن أُدرج
+
+    db جلسة أو اتصال. قواعد البيانات التي لا تدعم ON CONFLICT تُدرج داخل
+    نقطة حفظ ويُعامل IntegrityError كتعارض.
+    """
+    if engine.dialect.name in ("postgresql", "sqlite"):
+        return db.execute(insert_ignore(model).values(**values)).rowcount == 1
+    try:
+        with db.begin_nested():
+            db.execute(insert(model).values(**values))
+    except IntegrityError:
+        return False
+    return True
+
+def upsert(model, index_elements, keep_existing=(), overwrite=(), expressions=None, dialect=None):
+    """عبارة INSERT ... ON CONFLICT DO UPDATE حسب نوع قاعدة البيانات
+
+    أعمدة keep_existing تُحدث فقط عندما تحمل القيمة الجديدة شيئاً (COALESCE)،
+    وأعمدة overwrite تُستبدل دائماً، وexpressions تعابير تحديث مخصصة.
+    dialect يحدد نوع قاعدة بيانات غير قاعدة البوت (مثل هدف الترحيل).
+    """
+    stmt = _dialect_insert(model, dialect)
+    table = getattr(model, "__table__", model)
+    updates = {name: func.coalesce(stmt.excluded[name], table.c[name]) for name in keep_existing}
+    updates.update({name: stmt.excluded[name] for name in overwrite})
+    updates.update(expressions or {})
+    return stmt.on_conflict_do_update(index_elements=list(index_elements), set_=updates)
+
+def reset_sequences(conn, tables) -> None:
+    """تحريك تسلسلات المفاتيح في PostgreSQL بعد إدراج صفوف بمفاتيح صريحة
+
+    بدونها يعيد أول إدراج عادي مفتاحاً موجوداً. setval تتجاهل المفاتيح التي لا تسلسل لها (NULL).
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    quote = conn.dialect.identifier_preparer.quote
+    for table in tables:
+        columns = list(table.primary_key.columns)
+        if len(columns) != 1 or not isinstance(columns[0].type, Integer):
+            continue
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence(:table, :column), COALESCE(MAX({quote(columns[0].name)}), 0) + 1, false) "
+            f"FROM {quote(table.name)}"
+        ), {"table": table.name, "column": columns[0].name})
 
 @contextmanager
 def get_db():
@@ -137,13 +266,44 @@ def get_member(user_id: int, group_id: int) -> Optional[Member]:
         logger.error(f"Failed to get member {user_id} in group {group_id}: {e}")
         return None
 
-def get_group_members(group_id: int, active_only: bool = True) -> List[Member]:
+def fetch_member_rows(group_id: int, after_id: int, limit: int, active_only: bool = True,
+                      include_bots: bool = True, seen_since: Optional[datetime] = None) -> Tuple[List[MemberRow], int]:
+    """دفعة من الأعضاء بعد المعرف after_id بترتيب المفتاح مع آخر معرف فيها
+
+    كل دفعة استعلام قصير يعيد الاتصال إلى المجمع فوراً، فلا تبقى معاملة قراءة
+    مفتوحة بين الدفعات تحجب الكتابة في SQLite.
+    """
+    query = select(Member.id, Member.user_id, Member.username, Member.first_name, Member.last_name) \
+        .where(Member.group_id == group_id, Member.id > after_id) \
+        .order_by(Member.id) \
+        .limit(limit)
+    if active_only:
+        query = query.where(Member.is_active == True)
+    if not include_bots:
+        query = query.where(Member.is_bot == False)
+    if seen_since is not None:
+        query = query.where(Member.last_seen >= seen_since)
+    
+    with engine.connect() as conn:
+        rows = conn.execute(query).all()
+    if not rows:
+        return [], after_id
+    return [MemberRow._make(row[1:]) for row in rows], rows[-1].id
+
+def iter_member_rows(group_id: int, active_only: bool = True, include_bots: bool = True,
+                     seen_since: Optional[datetime] = None) -> Iterator[MemberRow]:
+    """قراءة الأعضاء كصفوف مختصرة على دفعات دون تحميل كائنات ORM"""
+    after_id = 0
+    while True:
+        rows, after_id = fetch_member_rows(group_id, after_id, config.MEMBER_STREAM_BATCH,
+                                           active_only, include_bots, seen_since)
+        yield from rows
+        if len(rows) < config.MEMBER_STREAM_BATCH:
+            return
+
+def get_group_members(group_id: int, active_only: bool = True) -> List[MemberRow]:
     try:
-        with get_db() as db:
-            query = db.query(Member).filter(Member.group_id == group_id)
-            if active_only:
-                query = query.filter(Member.is_active == True)
-            return query.all()
+        return list(iter_member_rows(group_id, active_only=active_only))
     except Exception as e:
         logger.error(f"Failed to get members of group {group_id}: {e}")
         return []
@@ -192,36 +352,6 @@ def get_group_stats(group_id: int) -> Dict[str, Any]:
         logger.error(f"Failed to get group stats for group {group_id}: {e}")
         return {}
 
-def check_rate_limit(user_id: int, group_id: int, command: str) -> bool:
-    try:
-        with get_db() as db:
-            one_minute_ago = datetime.utcnow() - timedelta(minutes=1)
-            record = db.query(RateLimitRecord).filter(
-                RateLimitRecord.user_id == user_id,
-                RateLimitRecord.group_id == group_id,
-                RateLimitRecord.command == command,
-                RateLimitRecord.last_used >= one_minute_ ago
-            ).first()
-            
-            if record:
-                if record.count >= config.RATE_LIMIT_PER_USER:
-                    return False
-                record.count += 1
-                record.last_used = datetime.utcnow()
-            else:
-                record = RateLimitRecord(
-                    user_id=user_id,
-                    group_id=group_id,
-                    command=command,
-                    count=1,
-                    last_used=datetime.utcnow()
-                )
-                db.add(record)
-            return True
-    except Exception as e:
-        logger.error(f"Rate limit check failed: {e}")
-        return True
-
 def log_mention(group_id: int, user_id: int, mention_type: str, mention_count: int, mentioned_members: List[int]) -> None:
     try:
         with get_db() as db:
@@ -233,12 +363,6 @@ def log_mention(group_id: int, user_id: int, mention_type: str, mention_count: i
                 mentioned_members=mentioned_members
             )
             db.add(mention_log)
-            
-            group = db.query(Group).filter(Group.group_id == group_id).first()
-            if group:
-                if group.last_mention_date.date() != datetime.utcnow().date():
-                    group.mention_count_today = 0
-                group.increment_mention_count()
             db.commit()
     except Exception as e:
         logger.error(f"Failed to log mention: {e}")
@@ -253,17 +377,10 @@ def cleanup_cache() -> None:
     except Exception as e:
         logger.error(f"Cache cleanup failed: {e}")
 
-def get_active_members(group_id: int, days: int = 7) -> List[Member]:
+def get_active_members(group_id: int, days: int = 7) -> List[MemberRow]:
     try:
-        with get_db() as db:
-            cutoff_date = datetime.utcnow() - timedelta(days=days)
-            members = db.query(Member).filter(
-                Member.group_id == group_id,
-                Member.last_seen >= cutoff_date,
-                Member.is_active == True,
-                Member.is_bot == False
-            ).all()
-            return members
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        return list(iter_member_rows(group_id, include_bots=False, seen_since=cutoff_date))
     except Exception as e:
         logger.error(f"Failed to get active members for group {group_id}: {e}")
         return []
\ No newline at end of file
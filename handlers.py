@@ -1,15 +1,49 @@
+import asyncio
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import os
+import tempfile
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters, CallbackQueryHandler
 from telegram.constants import ChatType, ChatMemberStatus, ParseMode
 
-from database import get_db, Group, Member, log_activity, log_mention
-from utils import update_member_activity, update_group_info, get_chat_members_safe, mention_all_members
-from security import admin_required, rate_limit
+from sqlalchemy import select
+
+from database import get_db, Group, Member, log_mention, get_group_stats
+from utils import (
+    update_member_activity, update_group_info, mention_all_members, get_admin_rows, invalidate_group_settings,
+    invalidate_members_cache, get_group_settings,
+    is_user_group_admin, is_bot_admin, has_bot_permissions
+)
+from security import admin_required, bot_admin_required, rate_limit
+from quota import mention_quota, is_valid_timezone
+from callbacks import router
+from persistence import set_pending_input, get_pending_input, clear_pending_input
+from profiling import profiler, install_handler_hooks
+from outbound import Priority, priority
+from idempotency import run_ledger
+from tags import tag_store, resolve_user_refs, validate_name, TagError
+from audit import audit_log, log_activity, export_activity, Cursor
+from planner import plan_run, format_plan
+from i18n import translator
+from roster import roster_format, import_file, export_file
+from runtime import KNOBS, runtime_config, apply_changes, reload_from_environment
+from keyboards import (
+    main_menu, scheduling_menu, settings_menu, time_selection_menu, back_button_menu,
+    group_admin_keyboard, member_settings_menu, language_selection_menu, activity_log_keyboard, compile_keyboards
+)
 import config
 
 logger = logging.getLogger(__name__)
 
+WAITING_FOR_TIME = "waiting_for_time"
+WAITING_FOR_MESSAGE = "waiting_for_message"
+
+# أقل فاصل بين تحديثات رسالة تقدم الاستيراد حتى لا تستهلك حد التعديلات
+IMPORT_PROGRESS_INTERVAL = 5
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """بدء استخدام البوت"""
     user = update.effective_user
@@ -21,45 +55,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         is_admin = await is_user_group_admin(context.bot, chat.id, user.id)
         await update_member_activity(context.bot, user.id, chat.id, is_admin)
     
-    welcome_text = (
-        "مرحباً! 👋 أنا بوت الذكر الجماعي الذكي.\n\n"
-        "يمكنني مساعدتك في ذكر أعضاء المجموعة بطرق مختلفة:\n"
-        "• ذكر جميع الأعضاء\n"
-        "• ذكر المشرفين فقط\n"
-        "• ذكر الأعضاء النشطين\n"
-        "• ذكر الأعضاء الجدد\n"
-        "• ذكر الأعضاء غير النشطين\n\n"
-        "استخدم /help لرؤية جميع الأوامر المتاحة."
-    )
-    
-    await update.message.reply_text(welcome_text)
+    t = await translator(chat.id)
+    await update.message.reply_text(t("start.welcome"))
     await log_activity(user.id, chat.id, "start")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """عرض رسالة المساعدة"""
-    help_text = (
-        "🎯 **أوامر البوت المتاحة:**\n\n"
-        "👥 **أوامر الذكر:**\n"
-        "/mention_all - ذكر جميع الأعضاء\n"
-        "/mention_admins - ذكر المشرفين فقط\n"
-        "/mention_active - ذكر الأعضاء النشطين\n"
-        "/mention_recent - ذكر الأعضاء الجدد\n"
-        "/mention_inactive - ذكر الأعضاء غير النشطين\n\n"
-        "⚙️ **أوامر الإعدادات:**\n"
-        "/settings - عرض إعدادات البوت\n"
-        "/set_language [ar/en] - تغيير لغة البوت\n"
-        "/set_message [نص] - تعيين رسالة مخصصة\n"
-        "/set_time [HH:MM] - تعيين وقت الذكر التلقائي\n\n"
-        "📊 **أوامر إدارية:**\n"
-        "/stats - إحصائيات المجموعة\n"
-        "/admin_list - قائمة المشرفين\n"
-        "/activity_log - سجل النشاط\n\n"
-        "🛡 **ملاحظات مهمة:**\n"
-        "- البوت يحتاج إلى صلاحية المشرف ليعمل بشكل صحيح\n"
-        "- بعض الأوامر متاحة فقط لمشرفي المجموعة"
-    )
-    
-    await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
+    t = await translator(update.effective_chat.id)
+    await update.message.reply_text(t("help.text"), parse_mode=ParseMode.MARKDOWN)
     await log_activity(update.effective_user.id, update.effective_chat.id, "help")
 
 @admin_required
@@ -68,36 +71,45 @@ async def mention_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ذكر جميع الأعضاء"""
     user = update.effective_user
     chat = update.effective_chat
+    t = await translator(chat.id)
     
     # التحقق من صلاحيات البوت
     if not await is_bot_admin(context.bot, chat.id):
-        await update.message.reply_text("❌ البوت ليس مشرفاً في المجموعة. يرجى ترقيته أولاً.")
+        await update.message.reply_text(t("error.bot_not_admin"))
         return
     
-    # إعلام المستخدم بأن العملية بدأت
-    status_message = await update.message.reply_text("⏳ جاري جمع معلومات الأعضاء...")
-    
-    # جلب الأعضاء
-    members = await get_chat_members_safe(context.bot, chat.id)
+    # الفحص والحجز معاً حتى لا يتجاوز أمران متزامنان الحد اليومي
+    reservation = mention_quota.try_acquire(chat.id)
+    if reservation is None:
+        await update.message.reply_text(t("error.quota_reached"))
+        return
     
-    if not members:
-        await status_message.edit_text("❌ لا يمكن العثور على أعضاء في هذه المجموعة.")
+    # تسليم نفس الأمر مرة أخرى لا يكرر الإشارة
+    run_key = run_ledger.claim(chat.id, f"command:{update.message.message_id}", update.message.date)
+    if run_key is None:
+        mention_quota.release(chat.id, reservation)
         return
     
-    # إرسال الإشارات
+    # إعلام المستخدم بأن العملية بدأت
+    status_message = await update.message.reply_text(t("mention.members_progress"))
+    
+    # إرسال الإشارات أثناء قراءة الأعضاء دون تحميل القائمة كاملة
     mentioned_count, successful_batches = await mention_all_members(context.bot, chat.id)
+    run_ledger.finish(run_key, mentioned_count, success=bool(mentioned_count))
+    
+    if not mentioned_count:
+        mention_quota.release(chat.id, reservation)
+        with priority(Priority.STATUS):
+            await status_message.edit_text(t("mention.no_members"))
+        return
     
     # تسجيل العملية
-    mentioned_ids = [member["id"] for member in members[:mentioned_count]]
-    await log_mention(
-        chat.id, user.id, "manual", "all", 
-        mentioned_count, mentioned_ids, 
-        "ذكر جميع الأعضاء"
-    )
+    log_mention(chat.id, user.id, "all", mentioned_count, [])
     
     # إرسال رسالة النجاح
-    success_text = f"✅ تم ذكر {mentioned_count} من الأعضاء بنجاح! ({successful_batches} دفعة)"
-    await status_message.edit_text(success_text)
+    success_text = t("mention.members_done", count=mentioned_count, batches=successful_batches)
+    with priority(Priority.STATUS):
+        await status_message.edit_text(success_text)
 
 @admin_required
 @rate_limit("user")
@@ -105,144 +117,652 @@ async def mention_admins(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ذكر المشرفين فقط"""
     user = update.effective_user
     chat = update.effective_chat
+    t = await translator(chat.id)
     
     # التحقق من صلاحيات البوت
     if not await is_bot_admin(context.bot, chat.id):
-        await update.message.reply_text("❌ البوت ليس مشرفاً في المجموعة. يرجى ترقيته أولاً.")
+        await update.message.reply_text(t("error.bot_not_admin"))
+        return
+    
+    reservation = mention_quota.try_acquire(chat.id)
+    if reservation is None:
+        await update.message.reply_text(t("error.quota_reached"))
+        return
+    
+    # تسليم نفس الأمر مرة أخرى لا يكرر الإشارة
+    run_key = run_ledger.claim(chat.id, f"command:{update.message.message_id}", update.message.date)
+    if run_key is None:
+        mention_quota.release(chat.id, reservation)
         return
     
     # إعلام المستخدم بأن العملية بدأت
-    status_message = await update.message.reply_text("⏳ جاري جمع معلومات المشرفين...")
+    status_message = await update.message.reply_text(t("mention.admins_progress"))
     
     # جلب المشرفين
     try:
-        admins = await context.bot.get_chat_administrators(chat.id)
-        admin_members = []
-        
-        for admin in admins:
-            user_obj = admin.user
-            if not user_obj.is_bot:
-                admin_members.append({
-                    "id": user_obj.id,
-                    "username": user_obj.username,
-                    "first_name": user_obj.first_name,
-                    "last_name": user_obj.last_name,
-                    "is_bot": user_obj.is_bot,
-                    "is_admin": True
-                })
+        admin_members = await get_admin_rows(context.bot, chat.id)
     except Exception as e:
         logger.error(f"فشل في جلب المشرفين: {e}")
         admin_members = []
     
     if not admin_members:
-        await status_message.edit_text("❌ لا يوجد مشرفين للاشارة إليهم.")
+        run_ledger.finish(run_key, 0, success=False)
+        mention_quota.release(chat.id, reservation)
+        with priority(Priority.STATUS):
+            await status_message.edit_text(t("mention.no_admins"))
         return
     
     # إرسال الإشارات
     mentioned_count, successful_batches = await mention_all_members(context.bot, chat.id, admin_members)
+    run_ledger.finish(run_key, mentioned_count, success=bool(mentioned_count))
+    if not mentioned_count:
+        mention_quota.release(chat.id, reservation)
     
     # تسجيل العملية
-    mentioned_ids = [member["id"] for member in admin_members[:mentioned_count]]
-    await log_mention(
-        chat.id, user.id, "manual", "admins", 
-        mentioned_count, mentioned_ids, 
-        "ذكر المشرفين"
-    )
+    mentioned_ids = [member.user_id for member in admin_members[:mentioned_count]]
+    log_mention(chat.id, user.id, "admins", mentioned_count, mentioned_ids)
     
     # إرسال رسالة النجاح
-    success_text = f"✅ تم ذكر {mentioned_count} من المشرفين بنجاح! ({successful_batches} دفعة)"
-    await status_message.edit_text(success_text)
+    success_text = t("mention.admins_done", count=mentioned_count, batches=successful_batches)
+    with priority(Priority.STATUS):
+        await status_message.edit_text(success_text)
 
 @admin_required
-async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """عرض إعدادات البوت"""
+@rate_limit("user")
+async def mention_tags(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ذكر أعضاء وسوم محددة، مثال: /mention #devs -#bots"""
+    user = update.effective_user
     chat = update.effective_chat
+    t = await translator(chat.id)
+    
+    if not context.args:
+        await update.message.reply_text(t("mention.tags_usage"))
+        return
+    
+    try:
+        member_ids = await asyncio.to_thread(tag_store.resolve, chat.id, context.args)
+    except TagError as e:
+        await update.message.reply_text(t("error.generic", error=e))
+        return
+    
+    if not member_ids:
+        await update.message.reply_text(t("mention.tags_empty"))
+        return
+    
+    if not await is_bot_admin(context.bot, chat.id):
+        await update.message.reply_text(t("error.bot_not_admin"))
+        return
+    
+    reservation = mention_quota.try_acquire(chat.id)
+    if reservation is None:
+        await update.message.reply_text(t("error.quota_reached"))
+        return
+    
+    run_key = run_ledger.claim(chat.id, f"command:{update.message.message_id}", update.message.date)
+    if run_key is None:
+        mention_quota.release(chat.id, reservation)
+        return
+    
+    status_message = await update.message.reply_text(t("mention.tags_progress", count=len(member_ids)))
+    
+    # معرفات الوسوم تُطبق كمرشح على نفس خط الإرسال المتدفق
+    mentioned_count, successful_batches = await mention_all_members(context.bot, chat.id, include_ids=member_ids)
+    run_ledger.finish(run_key, mentioned_count, success=bool(mentioned_count))
+    
+    if not mentioned_count:
+        mention_quota.release(chat.id, reservation)
+        with priority(Priority.STATUS):
+            await status_message.edit_text(t("mention.tags_inactive"))
+        return
+    
+    log_mention(chat.id, user.id, "tag", mentioned_count, [])
+    
+    success_text = t("mention.members_done", count=mentioned_count, batches=successful_batches)
+    with priority(Priority.STATUS):
+        await status_message.edit_text(success_text)
+
+@admin_required
+async def mention_plan(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض خطة الإشارة المتوقعة دون إرسال: /mention_plan أو /mention_plan #devs -#bots"""
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    
+    include_ids = None
+    if context.args:
+        try:
+            include_ids = await asyncio.to_thread(tag_store.resolve, chat.id, context.args)
+        except TagError as e:
+            await update.message.reply_text(t("error.generic", error=e))
+            return
+    
+    plan = await plan_run(context.bot, chat.id, include_ids=include_ids)
+    await update.message.reply_text(format_plan(plan, t))
+
+@admin_required
+async def tag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """إدارة وسوم الأعضاء: add / remove / rule / delete / list"""
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    args = context.args or []
+    action = args[0].lower() if args else "list"
+    
+    # الوسوم وتقييم القواعد استعلامات متزامنة قد تشمل كل أعضاء المجموعة، فتعمل في خيط منفصل
+    try:
+        if action == "list":
+            tags = await asyncio.to_thread(tag_store.list, chat.id)
+            if tags:
+                lines = [
+                    t("tag.list_item_rule", name=name, count=count, rule=rule) if rule
+                    else t("tag.list_item", name=name, count=count)
+                    for name, count, rule in tags
+                ]
+                text = t("tag.list_header") + "\n" + "\n".join(lines)
+            else:
+                text = t("tag.none")
+        elif action in ("add", "remove") and len(args) > 1:
+            name = validate_name(args[1])
+            user_ids, unknown = await asyncio.to_thread(resolve_user_refs, chat.id, args[2:])
+            reply = update.message.reply_to_message
+            if reply and reply.from_user:
+                user_ids.append(reply.from_user.id)
+            if not user_ids:
+                raise TagError(t("tag.no_members"))
+            if action == "add":
+                count = await asyncio.to_thread(tag_store.add, chat.id, name, user_ids)
+            else:
+                count = await asyncio.to_thread(tag_store.remove, chat.id, name, user_ids)
+            text = t("tag.updated", name=name, count=count)
+            if unknown:
+                text += "\n" + t("tag.unknown_refs", refs=" ".join(unknown))
+        elif action == "rule" and len(args) > 2:
+            name = validate_name(args[1])
+            count = await asyncio.to_thread(tag_store.set_rule, chat.id, name, args[2].lower())
+            text = t("tag.rule_set", name=name, rule=args[2].lower(), count=count)
+        elif action == "delete" and len(args) > 1:
+            name = validate_name(args[1])
+            deleted = await asyncio.to_thread(tag_store.delete, chat.id, name)
+            text = t("tag.deleted", name=name) if deleted else t("tag.missing", name=name)
+        else:
+            text = t("tag.usage")
+    except TagError as e:
+        text = t("error.generic", error=e)
+    
+    await update.message.reply_text(text[:config.MAX_MESSAGE_LENGTH])
+
+def format_activity_page(rows, t) -> str:
+    lines = [t("activity.header")]
+    for row in rows:
+        mark = "✅" if row.success else "❌"
+        line = f"{mark} {row.created_at:%Y-%m-%d %H:%M} • {row.user_id} • {row.action}"
+        if row.error_message:
+            line += f" ({row.error_message})"
+        lines.append(line)
+    return "\n".join(lines)[:config.MAX_MESSAGE_LENGTH]
+
+@admin_required
+async def activity_log_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض أحدث إدخالات سجل النشاط مع أزرار الصفحات"""
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    
+    # كتابة الإدخالات المتراكمة أولاً حتى تظهر في الصفحة الأولى
+    await asyncio.to_thread(audit_log.flush)
+    page = await asyncio.to_thread(audit_log.page, chat.id)
+    if not page.rows:
+        await update.message.reply_text(t("activity.empty"))
+        return
+    
+    await update.message.reply_text(
+        format_activity_page(page.rows, t),
+        reply_markup=activity_log_keyboard(page.older.encode() if page.older else None, lang=t.language)
+    )
+
+@admin_required
+async def activity_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تصدير سجل نشاط المجموعة كاملاً كملف JSONL مضغوط"""
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    status_message = await update.message.reply_text(t("activity.exporting"))
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"activity-{chat.id}.jsonl.gz")
+        entries = await asyncio.to_thread(export_activity, path, chat.id)
+        with open(path, "rb") as document:
+            await update.message.reply_document(document, caption=t("activity.export_caption", count=entries))
+    
+    with priority(Priority.STATUS):
+        await status_message.delete()
+
+async def _edit_status(message, text: str) -> None:
+    try:
+        with priority(Priority.STATUS):
+            await message.edit_text(text)
+    except Exception as e:
+        logger.warning(f"تعذر تحديث رسالة الحالة: {e}")
+
+@admin_required
+async def members_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """استيراد قائمة أعضاء من ملف CSV أو JSONL بالرد على الملف"""
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    source = update.message.reply_to_message or update.message
+    document = source.document
+    
+    if document is None:
+        await update.message.reply_text(t("roster.import_usage"))
+        return
+    try:
+        roster_format(document.file_name or "")
+    except ValueError as e:
+        await update.message.reply_text(t("error.generic", error=e))
+        return
+    
+    status_message = await update.message.reply_text(t("roster.importing"))
+    loop = asyncio.get_running_loop()
+    last_report = time.monotonic()
+    
+    def report(imported: int, rejected: int) -> None:
+        # يُستدعى من خيط الاستيراد بعد كل دفعة
+        nonlocal last_report
+        if time.monotonic() - last_report < IMPORT_PROGRESS_INTERVAL:
+            return
+        last_report = time.monotonic()
+        text = t("roster.progress", imported=imported, rejected=rejected)
+        asyncio.run_coroutine_threadsafe(_edit_status(status_message, text), loop)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, os.path.basename(document.file_name))
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_drive(path)
+        try:
+            result = await asyncio.to_thread(import_file, chat.id, path, report)
+        except ValueError as e:
+            await _edit_status(status_message, t("error.generic", error=e))
+            return
+    await invalidate_members_cache(chat.id)
+    
+    await _edit_status(status_message, t(
+        "roster.imported", imported=result.imported, rejected=result.rejected, seconds=result.seconds
+    ))
+    await log_activity(update.effective_user.id, chat.id, "members_import", result._asdict())
+
+@admin_required
+async def members_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تصدير قائمة أعضاء المجموعة كملف CSV أو JSONL مضغوط"""
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in ("csv", "jsonl"):
+        fmt = "csv"
+    status_message = await update.message.reply_text(t("roster.exporting"))
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"members-{chat.id}.{fmt}.gz")
+        count = await asyncio.to_thread(export_file, chat.id, path)
+        with open(path, "rb") as document:
+            await update.message.reply_document(document, caption=t("roster.export_caption", count=count))
+    
+    with priority(Priority.STATUS):
+        await status_message.delete()
+
+@admin_required
+async def set_autodelete(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تعيين مدة الحذف التلقائي لرسائل الإشارة بالدقائق أو off لإيقافه"""
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    value = context.args[0].lower() if context.args else ""
+    
+    if value == "off":
+        minutes = None
+    elif value.isdigit() and 1 <= int(value) <= 2880:
+        minutes = int(value)
+    else:
+        await update.message.reply_text(t("autodelete.usage"))
+        return
     
     with get_db() as db:
         group = db.query(Group).filter(Group.group_id == chat.id).first()
+        if not group:
+            group = Group(group_id=chat.id, settings={})
+            db.add(group)
+        group.settings = {**(group.settings or {}), "auto_delete_minutes": minutes}
+    await invalidate_group_settings(chat.id)
+    
+    if minutes:
+        await update.message.reply_text(t("autodelete.enabled", minutes=minutes))
+    else:
+        await update.message.reply_text(t("autodelete.disabled"))
+
+@admin_required
+async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """تعيين المنطقة الزمنية للمجموعة التي يبدأ بها يوم الحد اليومي للإشارات"""
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    name = context.args[0] if context.args else ""
     
-    if not group:
-        group = Group(group_id=chat.id)
-    
-    settings_text = (
-        f"⚙️ **إعدادات البوت للمجموعة**\n\n"
-        f"• اللغة: {group.group_language}\n"
-        f"• وقت الذكر التلقائي: {group.mention_time or 'غير محدد'}\n"
-        f"• الرسالة المخصصة: {group.custom_message[:50] + '...' if len(group.custom_message) > 50 else group.custom_message}\n"
-        f"• عدد الإشارات اليوم: {group.mention_count_today}/{config.MAX_MENTIONS_PER_DAY if config.MAX_MENTIONS_PER_DAY > 0 else '∞'}\n"
-        f"• حالة البوت: {'✅ نشط' if group.is_active else '❌ غير نشط'}\n"
-        f"• صلاحية البوت: {'✅ مشرف' if group.is_bot_admin else '❌ ليس مشرف'}"
-    )
+    if not name or not is_valid_timezone(name):
+        current = (await get_group_settings(chat.id)).get("timezone") or config.TIMEZONE
+        await update.message.reply_text(t("timezone.usage", current=current))
+        return
     
-    keyboard = [
-        [InlineKeyboardButton("تغيير اللغة", callback_data="set_language")],
-        [InlineKeyboardButton("تغيير وقت الذكر", callback_data="set_time")],
-        [InlineKeyboardButton("تغيير الرسالة", callback_data="set_message")],
-        [InlineKeyboardButton("تفعيل/تعطيل البوت", callback_data="toggle_bot")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    with get_db() as db:
+        group = db.query(Group).filter(Group.group_id == chat.id).first()
+        if not group:
+            group = Group(group_id=chat.id, settings={})
+            db.add(group)
+        group.settings = {**(group.settings or {}), "timezone": name}
+    await invalidate_group_settings(chat.id)
+    mention_quota.set_timezone(chat.id, name)
+    
+    await update.message.reply_text(t("timezone.set", timezone=name))
+
+@admin_required
+async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض إعدادات البوت"""
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    
+    # القيم تُقرأ داخل الجلسة؛ الكائن لا يُقرأ بعد إغلاقها
+    with get_db() as db:
+        row = db.execute(
+            select(Group.mention_hour, Group.mention_minute, Group.settings, Group.is_active, Group.is_bot_admin)
+            .where(Group.group_id == chat.id)
+        ).first()
+    hour, minute, group_settings, is_active, is_bot_admin = row or (0, 0, {}, False, False)
+    
+    custom_message = (group_settings or {}).get("custom_message") or ""
+    
+    settings_text = t(
+        "settings.text",
+        language=t("language.name"),
+        hour=hour or 0,
+        minute=minute or 0,
+        message=custom_message[:50] + '...' if len(custom_message) > 50 else custom_message,
+        count=mention_quota.count(chat.id),
+        limit=config.MAX_MENTIONS_PER_DAY if config.MAX_MENTIONS_PER_DAY > 0 else '∞',
+        status=t("settings.active") if is_active else t("settings.inactive"),
+        permission=t("settings.bot_admin") if is_bot_admin else t("settings.bot_not_admin"),
+    )
     
-    await update.message.reply_text(settings_text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+    await update.message.reply_text(settings_text, parse_mode=ParseMode.MARKDOWN, reply_markup=settings_menu(t.language))
     await log_activity(update.effective_user.id, chat.id, "settings")
 
 async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة استعلامات الأزرار"""
     query = update.callback_query
-    await query.answer()
-    
-    data = query.data
     user_id = query.from_user.id
     chat_id = query.message.chat.id
     
+    # فك الترميز أولاً حتى لا نستهلك طلبات API على بيانات غير معروفة
+    resolved = router.resolve(query.data)
+    if resolved is None:
+        await query.answer((await translator(chat_id))("error.stale_button"))
+        return
+    route, decoded = resolved
+    if route.answer:
+        await query.answer()
+    
     # التحقق من أن المستخدم مشرف
-    is_admin = await is_user_group_admin(context.bot, chat_id, user_id)
-    if not is_admin and user_id not in config.ADMIN_IDS:
-        await query.edit_message_text("❌ تحتاج إلى صلاحية المشرف لتغيير الإعدادات.")
+    if route.admin_only and user_id not in config.ADMIN_IDS:
+        if not await is_user_group_admin(context.bot, chat_id, user_id):
+            if not route.answer:
+                await query.answer()
+            await query.edit_message_text((await translator(chat_id))("error.settings_admin_required"))
+            return
+    
+    await route.handler(update, context, *decoded.args)
+    await log_activity(user_id, chat_id, f"callback_{decoded.action}")
+
+@router.route("main_menu")
+async def callback_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    t = await translator(update.callback_query.message.chat.id)
+    await update.callback_query.edit_message_text(t("menu.choose"), reply_markup=main_menu(t.language))
+
+@router.route("scheduling")
+async def callback_scheduling(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    t = await translator(update.callback_query.message.chat.id)
+    await update.callback_query.edit_message_text(t("menu.scheduling"), reply_markup=scheduling_menu(t.language))
+
+@router.route("settings")
+async def callback_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    t = await translator(update.callback_query.message.chat.id)
+    await update.callback_query.edit_message_text(t("menu.settings"), reply_markup=settings_menu(t.language))
+
+@router.route("stats")
+async def callback_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.callback_query.message.chat.id
+    t = await translator(chat_id)
+    stats = get_group_stats(chat_id)
+    if not stats:
+        await update.callback_query.edit_message_text(t("stats.empty"), reply_markup=back_button_menu("main_menu", t.language))
         return
     
-    if data == "set_language":
-        keyboard = [
-            [InlineKeyboardButton("العربية", callback_data="lang_ar")],
-            [InlineKeyboardButton("English", callback_data="lang_en")],
-            [InlineKeyboardButton("Français", callback_data="lang_fr")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text("اختر اللغة:", reply_markup=reply_markup)
-    
-    elif data.startswith("lang_"):
-        lang = data.split("_")[1]
-        with get_db() as db:
-            group = db.query(Group).filter(Group.group_id == chat_id).first()
-            if group:
-                group.group_language = lang
-            else:
-                group = Group(group_id=chat_id, group_language=lang)
-                db.add(group)
-        
-        await query.edit_message_text(f"✅ تم تغيير اللغة إلى {lang}")
+    stats_text = t(
+        "stats.text",
+        total_members=stats['total_members'],
+        active_members=stats['active_members'],
+        admin_members=stats['admin_members'],
+        mentions_today=stats['mentions_today'],
+        total_mentions=stats['total_mentions'],
+        mention_time=stats['mention_time'],
+    )
+    await update.callback_query.edit_message_text(
+        stats_text, parse_mode=ParseMode.MARKDOWN, reply_markup=back_button_menu("main_menu", t.language)
+    )
+
+@router.route("activity_page", answer=False)
+async def callback_activity_page(update: Update, context: ContextTypes.DEFAULT_TYPE, newer: int, micros: int, row_id: int):
+    chat_id = update.callback_query.message.chat.id
+    t = await translator(chat_id)
+    page = await asyncio.to_thread(audit_log.page, chat_id, Cursor.decode(micros, row_id), newer=bool(newer))
+    if not page.rows:
+        await update.callback_query.answer(t("activity.no_more"))
+        return
+    await update.callback_query.answer()
+    await update.callback_query.edit_message_text(
+        format_activity_page(page.rows, t),
+        reply_markup=activity_log_keyboard(
+            page.older.encode() if page.older else None,
+            page.newer.encode() if page.newer else None,
+            t.language,
+        )
+    )
+
+@router.route("mention_all")
+async def callback_mention_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.message.chat.id
+    t = await translator(chat_id)
     
-    elif data == "set_time":
-        await query.edit_message_text("أرسل وقت الذكر بالتنسيق HH:MM (مثال: 09:30)")
-        context.user_data["waiting_for_time"] = True
+    reservation = mention_quota.try_acquire(chat_id)
+    if reservation is None:
+        await query.edit_message_text(t("error.quota_reached"))
+        return
     
-    elif data == "set_message":
-        await query.edit_message_text("أرسل الرسالة المخصصة التي تريد استخدامها عند الذكر:")
-        context.user_data["waiting_for_message"] = True
+    run_key = run_ledger.claim(chat_id, f"callback:{query.id}", query.message.date)
+    if run_key is None:
+        mention_quota.release(chat_id, reservation)
+        return
     
-    elif data == "toggle_bot":
-        with get_db() as db:
-            group = db.query(Group).filter(Group.group_id == chat_id).first()
-            if group:
-                group.is_active = not group.is_active
-                status = "مفعل" if group.is_active else "معطل"
-            else:
-                group = Group(group_id=chat_id, is_active=True)
-                db.add(group)
-                status = "مفعل"
-        
-        await query.edit_message_text(f"✅ تم {status} البوت بنجاح")
+    await query.edit_message_text(t("mention.members_progress"))
+    mentioned_count, successful_batches = await mention_all_members(context.bot, chat_id)
+    run_ledger.finish(run_key, mentioned_count, success=bool(mentioned_count))
+    if not mentioned_count:
+        mention_quota.release(chat_id, reservation)
+    log_mention(chat_id, query.from_user.id, "all", mentioned_count, [])
+    await query.edit_message_text(t("mention.members_done", count=mentioned_count, batches=successful_batches))
+
+@router.route("set_language")
+async def callback_set_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    t = await translator(update.callback_query.message.chat.id)
+    await update.callback_query.edit_message_text(t("language.choose"), reply_markup=language_selection_menu())
+
+@router.route("set_lang")
+async def callback_set_lang(update: Update, context: ContextTypes.DEFAULT_TYPE, lang: str):
+    query = update.callback_query
+    chat_id = query.message.chat.id
+    
+    if lang not in config.SUPPORTED_LANGUAGES:
+        await query.edit_message_text((await translator(chat_id))("language.unsupported"))
+        return
+    
+    with get_db() as db:
+        group = db.query(Group).filter(Group.group_id == chat_id).first()
+        if group:
+            group.group_language = lang
+        else:
+            group = Group(group_id=chat_id, group_language=lang)
+            db.add(group)
+    # اللغة جزء من الإعدادات المخزنة مؤقتاً فيجب إبطالها ليظهر التغيير فوراً
+    await invalidate_group_settings(chat_id)
+    
+    t = await translator(chat_id)
+    await query.edit_message_text(t("language.changed", language=t("language.name")))
+
+@router.route("set_time")
+async def callback_set_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    t = await translator(update.callback_query.message.chat.id)
+    await update.callback_query.edit_message_text(t("time.prompt"), reply_markup=time_selection_menu(lang=t.language))
+    set_pending_input(context.chat_data, update.effective_user.id, WAITING_FOR_TIME)
+
+@router.route("hour")
+async def callback_hour(update: Update, context: ContextTypes.DEFAULT_TYPE, hour: int):
+    if not 0 <= hour <= 23:
+        return
+    t = await translator(update.callback_query.message.chat.id)
+    await update.callback_query.edit_message_text(
+        t("time.choose_minute", hour=hour), reply_markup=time_selection_menu(hour, lang=t.language)
+    )
+
+@router.route("minute")
+async def callback_minute(update: Update, context: ContextTypes.DEFAULT_TYPE, hour: int, minute: int):
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return
+    t = await translator(update.callback_query.message.chat.id)
+    await update.callback_query.edit_message_text(
+        t("time.confirm", hour=hour, minute=minute),
+        reply_markup=time_selection_menu(hour, minute, lang=t.language)
+    )
+
+@router.route("confirm_time")
+async def callback_confirm_time(update: Update, context: ContextTypes.DEFAULT_TYPE, hour: int, minute: int):
+    query = update.callback_query
+    chat_id = query.message.chat.id
+    
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return
+    
+    with get_db() as db:
+        group = db.query(Group).filter(Group.group_id == chat_id).first()
+        if group:
+            group.mention_hour = hour
+            group.mention_minute = minute
+        else:
+            group = Group(group_id=chat_id, mention_hour=hour, mention_minute=minute)
+            db.add(group)
+    
+    clear_pending_input(context.chat_data, update.effective_user.id)
+    await query.edit_message_text((await translator(chat_id))("time.set", hour=hour, minute=minute))
+
+@router.route("day")
+async def callback_day(update: Update, context: ContextTypes.DEFAULT_TYPE, days: int):
+    query = update.callback_query
+    chat_id = query.message.chat.id
     
-    await log_activity(user_id, chat_id, f"callback_{data}")
+    if not 1 <= days <= 30:
+        return
+    
+    with get_db() as db:
+        group = db.query(Group).filter(Group.group_id == chat_id).first()
+        if not group:
+            group = Group(group_id=chat_id, settings={})
+            db.add(group)
+        # يوم الاختيار هو بداية التكرار
+        today = datetime.now(ZoneInfo(config.TIMEZONE)).date().isoformat()
+        group.settings = {**(group.settings or {}), "mention_every_days": days, "mention_every_days_since": today}
+    await invalidate_group_settings(chat_id)
+    
+    t = await translator(chat_id)
+    await query.edit_message_text(t("schedule.every_days", days=days), reply_markup=back_button_menu("scheduling", t.language))
+
+@router.route("toggle_scheduling")
+async def callback_toggle_scheduling(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.message.chat.id
+    
+    with get_db() as db:
+        group = db.query(Group).filter(Group.group_id == chat_id).first()
+        if not group:
+            group = Group(group_id=chat_id, settings={})
+            db.add(group)
+        enabled = not (group.settings or {}).get("scheduling_enabled", True)
+        group.settings = {**(group.settings or {}), "scheduling_enabled": enabled}
+    await invalidate_group_settings(chat_id)
+    
+    t = await translator(chat_id)
+    text = t("schedule.enabled") if enabled else t("schedule.disabled")
+    await query.edit_message_text(text, reply_markup=back_button_menu("scheduling", t.language))
+
+@router.route("set_message")
+async def callback_set_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    t = await translator(update.callback_query.message.chat.id)
+    await update.callback_query.edit_message_text(t("message.prompt"))
+    set_pending_input(context.chat_data, update.effective_user.id, WAITING_FOR_MESSAGE)
+
+@router.route("toggle_bot")
+async def callback_toggle_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.callback_query.message.chat.id
+    
+    with get_db() as db:
+        group = db.query(Group).filter(Group.group_id == chat_id).first()
+        if group:
+            group.is_active = not group.is_active
+            enabled = group.is_active
+        else:
+            group = Group(group_id=chat_id, is_active=True)
+            db.add(group)
+            enabled = True
+    
+    t = await translator(chat_id)
+    await update.callback_query.edit_message_text(t("bot.enabled") if enabled else t("bot.disabled"))
+
+@router.route("check_permissions")
+async def callback_check_permissions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.callback_query.message.chat.id
+    t = await translator(chat_id)
+    
+    if not await is_bot_admin(context.bot, chat_id):
+        text = t("error.bot_not_admin")
+    elif not await has_bot_permissions(context.bot, chat_id, ["can_delete_messages", "can_pin_messages"]):
+        text = t("permissions.missing")
+    else:
+        text = t("permissions.ok")
+    await update.callback_query.edit_message_text(text, reply_markup=back_button_menu("main_menu", t.language))
+
+@router.route("update_group_info")
+async def callback_update_group_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.callback_query.message.chat.id
+    group = await update_group_info(context.bot, chat_id)
+    t = await translator(chat_id)
+    text = t("group_info.updated") if group else t("group_info.failed")
+    await update.callback_query.edit_message_text(text, reply_markup=group_admin_keyboard(t.language))
+
+@router.route("edit_member", admin_only=False)
+async def callback_edit_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.message.chat.id
+    is_admin = await is_user_group_admin(context.bot, chat_id, query.from_user.id)
+    await update_member_activity(context.bot, query.from_user.id, chat_id, is_admin)
+    t = await translator(chat_id)
+    await query.edit_message_text(t("member.updated"), reply_markup=member_settings_menu(t.language))
+
+@router.route("check_member_permissions", admin_only=False)
+async def callback_check_member_permissions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    is_admin = await is_user_group_admin(context.bot, query.message.chat.id, query.from_user.id)
+    t = await translator(query.message.chat.id)
+    text = t("member.is_admin") if is_admin else t("member.is_member")
+    await query.edit_message_text(text, reply_markup=member_settings_menu(t.language))
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالجة الرسائل النصية"""
@@ -250,7 +770,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     text = update.message.text
     
-    if "waiting_for_time" in context.user_data:
+    pending = get_pending_input(context.chat_data, user.id)
+    if pending is not None:
+        t = await translator(chat.id)
+    
+    if pending == WAITING_FOR_TIME:
         # معالجة وقت الذكر
         try:
             time_parts = text.split(":")
@@ -263,49 +787,151 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if hour < 0 or hour > 23 or minute < 0 or minute > 59:
                 raise ValueError
                 
-            time_str = f"{hour:02d}:{minute:02d}"
-            
             with get_db() as db:
                 group = db.query(Group).filter(Group.group_id == chat.id).first()
                 if group:
-                    group.mention_time = time_str
+                    group.mention_hour = hour
+                    group.mention_minute = minute
                 else:
-                    group = Group(group_id=chat.id, mention_time=time_str)
+                    group = Group(group_id=chat.id, mention_hour=hour, mention_minute=minute)
                     db.add(group)
             
-            await update.message.reply_text(f"✅ تم تعيين وقت الذكر إلى {time_str}")
-            del context.user_data["waiting_for_time"]
+            await update.message.reply_text(t("time.set", hour=hour, minute=minute))
+            clear_pending_input(context.chat_data, user.id)
             
         except ValueError:
-            await update.message.reply_text("❌ تنسوق الوقت غير صحيح. يرجى استخدام الصيغة HH:MM (مثال: 09:30)")
+            await update.message.reply_text(t("time.invalid"))
     
-    elif "waiting_for_message" in context.user_data:
+    elif pending == WAITING_FOR_MESSAGE:
         # معالجة الرسالة المخصصة
         if len(text) > 1000:
-            await update.message.reply_text("❌ الرسالة طويلة جداً. الحد الأقصى هو 1000 حرف.")
+            await update.message.reply_text(t("message.too_long", limit=1000))
             return
             
         with get_db() as db:
             group = db.query(Group).filter(Group.group_id == chat.id).first()
-            if group:
-                group.custom_message = text
-            else:
-                group = Group(group_id=chat.id, custom_message=text)
+            if not group:
+                group = Group(group_id=chat.id, settings={})
                 db.add(group)
+            group.settings = {**(group.settings or {}), "custom_message": text}
+        await invalidate_group_settings(chat.id)
         
-        await update.message.reply_text("✅ تم حفظ الرسالة المخصصة بنجاح")
-        del context.user_data["waiting_for_message"]
+        await update.message.reply_text(t("message.saved"))
+        clear_pending_input(context.chat_data, user.id)
     
     await log_activity(user.id, chat.id, "message", {"text": text})
 
+@bot_admin_required
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """التحكم في أدوات قياس الأداء أثناء التشغيل"""
+    t = await translator(update.effective_chat.id)
+    args = context.args or []
+    action = args[0] if args else "status"
+    option = args[1] if len(args) > 1 else None
+    
+    try:
+        if action == "sample":
+            if option == "stop":
+                path = profiler.stop_sampling()
+                lines = profiler.sampler.top()
+                text = t("profile.stacks_saved", path=path) + "\n" + "\n".join(lines) if path else t("profile.sampling_off")
+            else:
+                interval_ms = float(option) if option else 10
+                profiler.start_sampling(interval_ms / 1000)
+                text = t("profile.sampling_started", interval=interval_ms)
+        elif action == "handler" and option:
+            invocations = int(args[2]) if len(args) > 2 else 5
+            profiler.arm_capture(option.lstrip("/"), invocations)
+            text = t("profile.capture_armed", count=invocations, command=option.lstrip("/"))
+        elif action == "report":
+            if not profiler.finished:
+                text = t("profile.no_captures")
+            else:
+                capture = profiler.finished[-1]
+                text = f"📄 {capture.path}\n{capture.summary()}"
+        elif action == "memory":
+            if option == "stop":
+                profiler.stop_memory()
+                text = t("profile.memory_stopped")
+            else:
+                lines = profiler.memory_snapshot()
+                text = "\n".join(lines) if lines else t("profile.memory_started")
+        elif action == "slow":
+            if option == "stop":
+                profiler.disable_slow_callbacks()
+                text = t("profile.slow_stopped")
+            else:
+                threshold_ms = float(option) if option else 100
+                profiler.enable_slow_callbacks(threshold_ms / 1000)
+                text = t("profile.slow_started", threshold=threshold_ms)
+        elif action == "stop":
+            path = profiler.stop_all()
+            text = t("profile.all_stopped") + ("\n" + t("profile.stacks", path=path) if path else "")
+        else:
+            text = t("profile.status") + "\n" + "\n".join(profiler.status())
+    except ValueError:
+        text = t("profile.invalid")
+    
+    await update.message.reply_text(text[:config.MAX_MESSAGE_LENGTH])
+
+@bot_admin_required
+async def config_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض إعدادات الأداء أو تعديلها أثناء التشغيل دون إعادة تشغيل البوت"""
+    user = update.effective_user
+    chat = update.effective_chat
+    t = await translator(chat.id)
+    args = context.args or []
+    action = args[0].lower() if args else "show"
+    
+    try:
+        if action == "show":
+            current = runtime_config.current
+            lines = [
+                t("config.item", name=name, value=getattr(current, name), minimum=knob.minimum, maximum=knob.maximum)
+                for name, knob in KNOBS.items()
+            ]
+            text = t("config.header") + "\n" + "\n".join(lines)
+        elif (action == "set" and len(args) >= 3 and len(args) % 2 == 1) or action == "reload":
+            if action == "set":
+                # جميع القيم تُتحقق ثم تُطبق معاً أو يُرفض الأمر كاملاً
+                changes = dict(zip((name.upper() for name in args[1::2]), args[2::2]))
+                diff = await apply_changes(changes, user.id, chat.id, "command")
+            else:
+                diff = await reload_from_environment(user.id, chat.id, "command")
+            lines = [t("config.changed", name=name, old=old, new=new) for name, (old, new) in diff.items()]
+            text = "\n".join(lines) if lines else t("config.unchanged")
+        else:
+            text = t("config.usage")
+    except ValueError as e:
+        text = t("error.generic", error=e)
+    
+    await update.message.reply_text(text[:config.MAX_MESSAGE_LENGTH])
+
 def setup_handlers(application):
     """إعداد معالجات الأوامر"""
+    # بناء لوحات المفاتيح لكل لغة قبل وصول أول تحديث
+    compile_keyboards()
+    
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("mention_all", mention_all))
     application.add_handler(CommandHandler("mention_admins", mention_admins))
+    application.add_handler(CommandHandler("mention", mention_tags))
+    application.add_handler(CommandHandler("tag", tag_command))
+    application.add_handler(CommandHandler("mention_plan", mention_plan))
     application.add_handler(CommandHandler("settings", settings))
+    application.add_handler(CommandHandler("set_autodelete", set_autodelete))
+    application.add_handler(CommandHandler("set_timezone", set_timezone))
+    application.add_handler(CommandHandler("activity_log", activity_log_command))
+    application.add_handler(CommandHandler("activity_export", activity_export))
+    application.add_handler(CommandHandler("members_import", members_import))
+    application.add_handler(CommandHandler("members_export", members_export))
     application.add_handler(CallbackQueryHandler(handle_callback_query))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("config", config_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
+    # تغليف الأوامر لدعم التقاط cProfile عند الطلب
+    install_handler_hooks(application)
+    
     return application
\ No newline at end of file
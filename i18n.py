@@ -0,0 +1,586 @@
+import logging
+from string import Formatter
+from types import MappingProxyType
+from typing import Callable, Dict, FrozenSet, Mapping, Optional
+
+from utils import get_group_settings
+import config
+
+logger = logging.getLogger(__name__)
+
+# نصوص الواجهة لكل لغة؛ الحقول بصيغة str.format وتُستبدل عند العرض فقط
+MESSAGES: Dict[str, Dict[str, str]] = {
+    "ar": {
+        "language.name": "العربية",
+
+        "start.welcome": (
+            "مرحباً! 👋 أنا بوت الذكر الجماعي الذكي.\n\n"
+            "يمكنني مساعدتك في ذكر أعضاء المجموعة بطرق مختلفة:\n"
+            "• ذكر جميع الأعضاء\n"
+            "• ذكر المشرفين فقط\n"
+            "• ذكر الأعضاء النشطين\n"
+            "• ذكر الأعضاء الجدد\n"
+            "• ذكر الأعضاء غير النشطين\n\n"
+            "استخدم /help لرؤية جميع الأوامر المتاحة."
+        ),
+        "help.text": (
+            "🎯 **أوامر البوت المتاحة:**\n\n"
+            "👥 **أوامر الذكر:**\n"
+            "/mention_all - ذكر جميع الأعضاء\n"
+            "/mention_admins - ذكر المشرفين فقط\n"
+            "/mention_active - ذكر الأعضاء النشطين\n"
+            "/mention_recent - ذكر الأعضاء الجدد\n"
+            "/mention_inactive - ذكر الأعضاء غير النشطين\n"
+            "/mention #وسم - ذكر أعضاء وسوم محددة (مثال: #devs -#bots)\n"
+            "/tag - إدارة وسوم الأعضاء\n"
+            "/mention_plan - تقدير مدة وتكلفة الإشارة دون إرسال\n\n"
+            "⚙️ **أوامر الإعدادات:**\n"
+            "/settings - عرض إعدادات البوت\n"
+            "/set_language [ar/en] - تغيير لغة البوت\n"
+            "/set_message [نص] - تعيين رسالة مخصصة\n"
+            "/set_time [HH:MM] - تعيين وقت الذكر التلقائي\n"
+            "/set_autodelete [دقائق|off] - حذف رسائل الإشارة تلقائياً\n"
+            "/set_timezone [Area/City] - المنطقة الزمنية لبداية يوم الحد اليومي\n\n"
+            "📊 **أوامر إدارية:**\n"
+            "/stats - إحصائيات المجموعة\n"
+            "/admin_list - قائمة المشرفين\n"
+            "/activity_log - سجل النشاط\n"
+            "/activity_export - تصدير سجل النشاط\n"
+            "/members_import - استيراد قائمة أعضاء (بالرد على ملف CSV أو JSONL)\n"
+            "/members_export [csv/jsonl] - تصدير قائمة الأعضاء\n\n"
+            "🛡 **ملاحظات مهمة:**\n"
+            "- البوت يحتاج إلى صلاحية المشرف ليعمل بشكل صحيح\n"
+            "- بعض الأوامر متاحة فقط لمشرفي المجموعة"
+        ),
+
+        "error.groups_only": "❌ هذا الأمر متاح فقط في المجموعات.",
+        "error.admin_required": "❌ تحتاج إلى صلاحية المشرف لاستخدام هذا الأمر.",
+        "error.bot_admins_only": "❌ هذا الأمر متاح فقط لمسؤولي البوت.",
+        "error.rate_limited": "❌ لقد تجاوزت الحد المسموح ({limit} في الدقيقة). يرجى الانتظار قليلاً.",
+        "error.bot_not_admin": "❌ البوت ليس مشرفاً في المجموعة. يرجى ترقيته أولاً.",
+        "error.quota_reached": "❌ تم الوصول إلى الحد اليومي للإشارات.",
+        "error.generic": "❌ {error}",
+        "error.stale_button": "❌ هذا الزر لم يعد صالحاً.",
+        "error.settings_admin_required": "❌ تحتاج إلى صلاحية المشرف لتغيير الإعدادات.",
+
+        "mention.members_progress": "⏳ جاري ذكر الأعضاء...",
+        "mention.admins_progress": "⏳ جاري جمع معلومات المشرفين...",
+        "mention.tags_progress": "⏳ جاري ذكر {count} عضو...",
+        "mention.no_members": "❌ لا يمكن العثور على أعضاء في هذه المجموعة.",
+        "mention.no_admins": "❌ لا يوجد مشرفين للاشارة إليهم.",
+        "mention.tags_usage": "❌ حدد الوسوم. مثال: /mention #devs -#bots &#active",
+        "mention.tags_empty": "❌ لا يوجد أعضاء يطابقون هذه الوسوم.",
+        "mention.tags_inactive": "❌ لا يمكن العثور على أعضاء نشطين لهذه الوسوم.",
+        "mention.members_done": "✅ تم ذكر {count} من الأعضاء بنجاح! ({batches} دفعة)",
+        "mention.admins_done": "✅ تم ذكر {count} من المشرفين بنجاح! ({batches} دفعة)",
+
+        "plan.header": "🧮 خطة الإشارة (بدون إرسال):",
+        "plan.members": "• الأعضاء: {members}",
+        "plan.messages": "• الرسائل: {messages} ({characters} حرف)",
+        "plan.duration": "• المدة المتوقعة: {duration}",
+        "plan.interval": "• الفاصل بين الرسائل: {interval:.2f} ثانية",
+        "plan.budget_wait": "• انتظار الميزانية المشتركة: {wait}",
+        "plan.chat_limit": "• حد المجموعة: {minutes:.1f} دقيقة من {per_minute} رسالة/دقيقة",
+        "plan.quota": "• الحصة اليومية بعد التشغيل: {used}/{limit}",
+        "plan.quota_unlimited": "• الحصة اليومية بعد التشغيل: {used} (بلا حد)",
+        "plan.quota_exhausted": "⚠️ تم الوصول إلى الحد اليومي، لن يُنفذ التشغيل",
+        "unit.seconds": "{value:.0f} ثانية",
+        "unit.minutes": "{value:.1f} دقيقة",
+        "unit.hours": "{value:.1f} ساعة",
+
+        "tag.list_header": "🏷 الوسوم:",
+        "tag.list_item": "• #{name}: {count} عضو",
+        "tag.list_item_rule": "• #{name}: {count} عضو (قاعدة {rule})",
+        "tag.none": "لا توجد وسوم بعد. مثال: /tag add devs @user1 @user2",
+        "tag.no_members": "حدد الأعضاء بـ @username أو المعرف أو بالرد على رسالة العضو",
+        "tag.updated": "✅ الوسم #{name} يضم الآن {count} عضو",
+        "tag.unknown_refs": "⚠️ لم يتم العثور على: {refs}",
+        "tag.rule_set": "✅ الوسم #{name} مرتبط بالقاعدة {rule} ويضم {count} عضو",
+        "tag.deleted": "✅ تم حذف الوسم #{name}",
+        "tag.missing": "❌ الوسم #{name} غير موجود",
+        "tag.usage": (
+            "الاستخدام:\n"
+            "/tag add اسم @user ...\n"
+            "/tag remove اسم @user ...\n"
+            "/tag rule اسم active:7\n"
+            "/tag delete اسم\n"
+            "/tag list"
+        ),
+
+        "activity.header": "📜 سجل النشاط:",
+        "activity.empty": "لا توجد إدخالات في سجل النشاط بعد.",
+        "activity.no_more": "لا توجد إدخالات أخرى",
+        "activity.exporting": "⏳ جاري تصدير سجل النشاط...",
+        "activity.export_caption": "📜 {count} إدخال",
+
+        "roster.import_usage": "❌ أرسل ملف CSV أو JSONL (يدعم .gz) ثم رد عليه بالأمر /members_import",
+        "roster.importing": "⏳ جاري استيراد قائمة الأعضاء...",
+        "roster.progress": "⏳ تم استيراد {imported} عضو ({rejected} مرفوض)...",
+        "roster.imported": "✅ تم استيراد {imported} عضو ({rejected} صف مرفوض) في {seconds:.1f} ثانية",
+        "roster.exporting": "⏳ جاري تصدير قائمة الأعضاء...",
+        "roster.export_caption": "👥 {count} عضو",
+
+        "autodelete.usage": "❌ الاستخدام: /set_autodelete [1-2880 دقيقة | off]",
+        "autodelete.enabled": "✅ سيتم حذف رسائل الإشارة بعد {minutes} دقيقة",
+        "autodelete.disabled": "✅ تم إيقاف الحذف التلقائي لرسائل الإشارة",
+
+        "timezone.usage": "❌ الاستخدام: /set_timezone [Area/City]، مثال: /set_timezone Asia/Riyadh\nالحالية: {current}",
+        "timezone.set": "✅ المنطقة الزمنية للمجموعة: {timezone}",
+
+        "settings.text": (
+            "⚙️ **إعدادات البوت للمجموعة**\n\n"
+            "• اللغة: {language}\n"
+            "• وقت الذكر التلقائي: {hour:02d}:{minute:02d}\n"
+            "• الرسالة المخصصة: {message}\n"
+            "• عدد الإشارات اليوم: {count}/{limit}\n"
+            "• حالة البوت: {status}\n"
+            "• صلاحية البوت: {permission}"
+        ),
+        "settings.active": "✅ نشط",
+        "settings.inactive": "❌ غير نشط",
+        "settings.bot_admin": "✅ مشرف",
+        "settings.bot_not_admin": "❌ ليس مشرف",
+
+        "menu.choose": "اختر أحد الخيارات:",
+        "menu.scheduling": "⏰ إعدادات الجدولة:",
+        "menu.settings": "⚙️ الإعدادات:",
+
+        "stats.empty": "❌ لا توجد إحصائيات لهذه المجموعة بعد.",
+        "stats.text": (
+            "📊 **إحصائيات المجموعة**\n\n"
+            "• إجمالي الأعضاء: {total_members}\n"
+            "• الأعضاء النشطون: {active_members}\n"
+            "• المشرفون: {admin_members}\n"
+            "• إشارات اليوم: {mentions_today}\n"
+            "• إجمالي الإشارات: {total_mentions}\n"
+            "• وقت الذكر: {mention_time}"
+        ),
+
+        "language.choose": "اختر اللغة:",
+        "language.unsupported": "❌ اللغة غير مدعومة.",
+        "language.changed": "✅ تم تغيير اللغة إلى {language}",
+
+        "time.prompt": "اختر الساعة أو أرسل وقت الذكر بالتنسيق HH:MM (مثال: 09:30)",
+        "time.choose_minute": "اختر الدقيقة للساعة {hour:02d}:",
+        "time.confirm": "تأكيد وقت الذكر {hour:02d}:{minute:02d}؟",
+        "time.set": "✅ تم تعيين وقت الذكر إلى {hour:02d}:{minute:02d}",
+        "time.invalid": "❌ تنسوق الوقت غير صحيح. يرجى استخدام الصيغة HH:MM (مثال: 09:30)",
+        "schedule.every_days": "✅ سيتم الذكر التلقائي كل {days} يوم",
+        "schedule.enabled": "✅ الجدولة الآن مفعلة",
+        "schedule.disabled": "✅ الجدولة الآن معطلة",
+
+        "message.prompt": "أرسل الرسالة المخصصة التي تريد استخدامها عند الذكر:",
+        "message.too_long": "❌ الرسالة طويلة جداً. الحد الأقصى هو {limit} حرف.",
+        "message.saved": "✅ تم حفظ الرسالة المخصصة بنجاح",
+
+        "bot.enabled": "✅ تم مفعل البوت بنجاح",
+        "bot.disabled": "✅ تم معطل البوت بنجاح",
+
+        "permissions.missing": "⚠️ البوت مشرف لكن تنقصه بعض الصلاحيات (حذف الرسائل، تثبيت الرسائل).",
+        "permissions.ok": "✅ البوت يملك جميع الصلاحيات المطلوبة.",
+        "group_info.updated": "✅ تم تحديث معلومات المجموعة",
+        "group_info.failed": "❌ فشل في تحديث معلومات المجموعة",
+        "member.updated": "✅ تم تحديث بياناتك من Telegram",
+        "member.is_admin": "🛡 أنت مشرف في هذه المجموعة",
+        "member.is_member": "👤 أنت عضو عادي في هذه المجموعة",
+
+        "profile.stacks_saved": "✅ تم حفظ المكدسات في {path}",
+        "profile.sampling_off": "❌ أخذ العينات غير مفعل",
+        "profile.sampling_started": "✅ بدأ أخذ العينات كل {interval:g} مللي ثانية",
+        "profile.capture_armed": "✅ سيتم التقاط الاستدعاءات الـ {count} التالية للأمر /{command}",
+        "profile.no_captures": "❌ لا توجد نتائج التقاط بعد",
+        "profile.memory_stopped": "✅ تم إيقاف تتبع الذاكرة",
+        "profile.memory_started": "✅ بدأ تتبع الذاكرة، أرسل الأمر مرة أخرى للمقارنة",
+        "profile.slow_stopped": "✅ تم إيقاف كشف الاستدعاءات البطيئة",
+        "profile.slow_started": "✅ سيتم تسجيل الاستدعاءات التي تتجاوز {threshold:g} مللي ثانية",
+        "profile.all_stopped": "✅ تم إيقاف جميع أدوات القياس",
+        "profile.stacks": "المكدسات: {path}",
+        "profile.status": "📈 حالة أدوات القياس:",
+        "profile.invalid": "❌ قيمة غير صحيحة. مثال: /profile sample 10 (1 مللي ثانية على الأقل)",
+
+        "config.header": "🎛 إعدادات الأداء الحالية:",
+        "config.item": "• {name} = {value} ({minimum:g} - {maximum:g})",
+        "config.changed": "✅ {name}: {old} ← {new}",
+        "config.unchanged": "لم يتغير أي إعداد.",
+        "config.usage": (
+            "الاستخدام:\n"
+            "/config - عرض الإعدادات الحالية\n"
+            "/config set اسم قيمة [اسم قيمة ...]\n"
+            "/config reload - إعادة التحميل من البيئة وملف .env"
+        ),
+
+        "kb.mention_all": "👥 ذكر الجميع",
+        "kb.scheduling": "⏰ جدولة الذكر",
+        "kb.settings": "⚙️ الإعدادات",
+        "kb.stats": "📊 الإحصائيات",
+        "kb.set_time": "🕒 تعيين وقت الذكر",
+        "kb.toggle_scheduling": "🔔 تفعيل/تعطيل الجدولة",
+        "kb.back": "↩️ العودة",
+        "kb.previous": "↩️ رجوع",
+        "kb.cancel": "↩️ إلغاء",
+        "kb.confirm": "✅ تأكيد",
+        "kb.reset": "↩️ إعادة تعيين",
+        "kb.main_menu": "↩️ القائمة الرئيسية",
+        "kb.set_language": "🌐 تغيير اللغة",
+        "kb.change_time": "🕒 تغيير وقت الذكر",
+        "kb.set_message": "📝 تخصيص الرسالة",
+        "kb.check_permissions": "🛡 صلاحيات البوت",
+        "kb.toggle_bot": "🔔 تفعيل/تعطيل البوت",
+        "kb.verify_permissions": "🛡 تحقق من الصلاحيات",
+        "kb.update_group_info": "📊 تحديث معلومات المجموعة",
+        "kb.edit_member": "📝 تعديل بيانات العضو",
+        "kb.member_permissions": "🛡 صلاحيات العضو",
+        "kb.days": "{days} يوم",
+        "kb.newer": "➡️ أحدث",
+        "kb.older": "أقدم ⬅️",
+    },
+    "en": {
+        "language.name": "English",
+
+        "start.welcome": (
+            "Hello! 👋 I'm the smart group mention bot.\n\n"
+            "I can help you mention group members in different ways:\n"
+            "• Mention all members\n"
+            "• Mention admins only\n"
+            "• Mention active members\n"
+            "• Mention new members\n"
+            "• Mention inactive members\n\n"
+            "Use /help to see all available commands."
+        ),
+        "help.text": (
+            "🎯 **Available commands:**\n\n"
+            "👥 **Mention commands:**\n"
+            "/mention_all - mention all members\n"
+            "/mention_admins - mention admins only\n"
+            "/mention_active - mention active members\n"
+            "/mention_recent - mention new members\n"
+            "/mention_inactive - mention inactive members\n"
+            "/mention #tag - mention members of specific tags (e.g. #devs -#bots)\n"
+            "/tag - manage member tags\n"
+            "/mention_plan - estimate mention time and cost without sending\n\n"
+            "⚙️ **Settings commands:**\n"
+            "/settings - show bot settings\n"
+            "/set_language [ar/en] - change the bot language\n"
+            "/set_message [text] - set a custom message\n"
+            "/set_time [HH:MM] - set the automatic mention time\n"
+            "/set_autodelete [minutes|off] - delete mention messages automatically\n"
+            "/set_timezone [Area/City] - timezone that starts the daily mention limit\n\n"
+            "📊 **Admin commands:**\n"
+            "/stats - group statistics\n"
+            "/admin_list - list of admins\n"
+            "/activity_log - activity log\n"
+            "/activity_export - export the activity log\n"
+            "/members_import - import a member roster (reply to a CSV or JSONL file)\n"
+            "/members_export [csv/jsonl] - export the member roster\n\n"
+            "🛡 **Important notes:**\n"
+            "- The bot needs admin rights to work correctly\n"
+            "- Some commands are available to group admins only"
+        ),
+
+        "error.groups_only": "❌ This command is only available in groups.",
+        "error.admin_required": "❌ You need admin rights to use this command.",
+        "error.bot_admins_only": "❌ This command is only available to bot administrators.",
+        "error.rate_limited": "❌ You have exceeded the allowed limit ({limit} per minute). Please wait a moment.",
+        "error.bot_not_admin": "❌ The bot is not an admin in this group. Please promote it first.",
+        "error.quota_reached": "❌ The daily mention limit has been reached.",
+        "error.generic": "❌ {error}",
+        "error.stale_button": "❌ This button is no longer valid.",
+        "error.settings_admin_required": "❌ You need admin rights to change the settings.",
+
+        "mention.members_progress": "⏳ Mentioning members...",
+        "mention.admins_progress": "⏳ Collecting admin information...",
+        "mention.tags_progress": "⏳ Mentioning {count} members...",
+        "mention.no_members": "❌ No members could be found in this group.",
+        "mention.no_admins": "❌ There are no admins to mention.",
+        "mention.tags_usage": "❌ Specify the tags. Example: /mention #devs -#bots &#active",
+        "mention.tags_empty": "❌ No members match these tags.",
+        "mention.tags_inactive": "❌ No active members could be found for these tags.",
+        "mention.members_done": "✅ Mentioned {count} members successfully! ({batches} batches)",
+        "mention.admins_done": "✅ Mentioned {count} admins successfully! ({batches} batches)",
+
+        "plan.header": "🧮 Mention plan (nothing sent):",
+        "plan.members": "• Members: {members}",
+        "plan.messages": "• Messages: {messages} ({characters} characters)",
+        "plan.duration": "• Expected duration: {duration}",
+        "plan.interval": "• Interval between messages: {interval:.2f} seconds",
+        "plan.budget_wait": "• Shared budget wait: {wait}",
+        "plan.chat_limit": "• Group limit: {minutes:.1f} minutes at {per_minute} messages/minute",
+        "plan.quota": "• Daily quota after the run: {used}/{limit}",
+        "plan.quota_unlimited": "• Daily quota after the run: {used} (unlimited)",
+        "plan.quota_exhausted": "⚠️ The daily limit has been reached, the run will not execute",
+        "unit.seconds": "{value:.0f} seconds",
+        "unit.minutes": "{value:.1f} minutes",
+        "unit.hours": "{value:.1f} hours",
+
+        "tag.list_header": "🏷 Tags:",
+        "tag.list_item": "• #{name}: {count} members",
+        "tag.list_item_rule": "• #{name}: {count} members (rule {rule})",
+        "tag.none": "No tags yet. Example: /tag add devs @user1 @user2",
+        "tag.no_members": "Specify members by @username, ID or by replying to the member's message",
+        "tag.updated": "✅ Tag #{name} now has {count} members",
+        "tag.unknown_refs": "⚠️ Not found: {refs}",
+        "tag.rule_set": "✅ Tag #{name} follows rule {rule} and has {count} members",
+        "tag.deleted": "✅ Tag #{name} deleted",
+        "tag.missing": "❌ Tag #{name} does not exist",
+        "tag.usage": (
+            "Usage:\n"
+            "/tag add name @user ...\n"
+            "/tag remove name @user ...\n"
+            "/tag rule name active:7\n"
+            "/tag delete name\n"
+            "/tag list"
+        ),
+
+        "activity.header": "📜 Activity log:",
+        "activity.empty": "The activity log has no entries yet.",
+        "activity.no_more": "No more entries",
+        "activity.exporting": "⏳ Exporting the activity log...",
+        "activity.export_caption": "📜 {count} entries",
+
+        "roster.import_usage": "❌ Send a CSV or JSONL file (.gz supported), then reply to it with /members_import",
+        "roster.importing": "⏳ Importing the member roster...",
+        "roster.progress": "⏳ Imported {imported} members ({rejected} rejected)...",
+        "roster.imported": "✅ Imported {imported} members ({rejected} rows rejected) in {seconds:.1f} seconds",
+        "roster.exporting": "⏳ Exporting the member roster...",
+        "roster.export_caption": "👥 {count} members",
+
+        "autodelete.usage": "❌ Usage: /set_autodelete [1-2880 minutes | off]",
+        "autodelete.enabled": "✅ Mention messages will be deleted after {minutes} minutes",
+        "autodelete.disabled": "✅ Automatic deletion of mention messages is off",
+
+        "timezone.usage": "❌ Usage: /set_timezone [Area/City], e.g. /set_timezone Europe/London\nCurrent: {current}",
+        "timezone.set": "✅ Group timezone: {timezone}",
+
+        "settings.text": (
+            "⚙️ **Bot settings for this group**\n\n"
+            "• Language: {language}\n"
+            "• Automatic mention time: {hour:02d}:{minute:02d}\n"
+            "• Custom message: {message}\n"
+            "• Mentions today: {count}/{limit}\n"
+            "• Bot status: {status}\n"
+            "• Bot permission: {permission}"
+        ),
+        "settings.active": "✅ Active",
+        "settings.inactive": "❌ Inactive",
+        "settings.bot_admin": "✅ Admin",
+        "settings.bot_not_admin": "❌ Not an admin",
+
+        "menu.choose": "Choose an option:",
+        "menu.scheduling": "⏰ Scheduling settings:",
+        "menu.settings": "⚙️ Settings:",
+
+        "stats.empty": "❌ There are no statistics for this group yet.",
+        "stats.text": (
+            "📊 **Group statistics**\n\n"
+            "• Total members: {total_members}\n"
+            "• Active members: {active_members}\n"
+            "• Admins: {admin_members}\n"
+            "• Mentions today: {mentions_today}\n"
+            "• Total mentions: {total_mentions}\n"
+            "• Mention time: {mention_time}"
+        ),
+
+        "language.choose": "Choose the language:",
+        "language.unsupported": "❌ Unsupported language.",
+        "language.changed": "✅ Language changed to {language}",
+
+        "time.prompt": "Choose the hour or send the mention time as HH:MM (e.g. 09:30)",
+        "time.choose_minute": "Choose the minute for hour {hour:02d}:",
+        "time.confirm": "Confirm mention time {hour:02d}:{minute:02d}?",
+        "time.set": "✅ Mention time set to {hour:02d}:{minute:02d}",
+        "time.invalid": "❌ Invalid time format. Please use HH:MM (e.g. 09:30)",
+        "schedule.every_days": "✅ Automatic mentions will run every {days} days",
+        "schedule.enabled": "✅ Scheduling is now enabled",
+        "schedule.disabled": "✅ Scheduling is now disabled",
+
+        "message.prompt": "Send the custom message to use when mentioning:",
+        "message.too_long": "❌ The message is too long. The maximum is {limit} characters.",
+        "message.saved": "✅ Custom message saved",
+
+        "bot.enabled": "✅ The bot has been enabled",
+        "bot.disabled": "✅ The bot has been disabled",
+
+        "permissions.missing": "⚠️ The bot is an admin but lacks some permissions (delete messages, pin messages).",
+        "permissions.ok": "✅ The bot has all the required permissions.",
+        "group_info.updated": "✅ Group information updated",
+        "group_info.failed": "❌ Failed to update group information",
+        "member.updated": "✅ Your details were updated from Telegram",
+        "member.is_admin": "🛡 You are an admin in this group",
+        "member.is_member": "👤 You are a regular member of this group",
+
+        "profile.stacks_saved": "✅ Stacks saved to {path}",
+        "profile.sampling_off": "❌ Sampling is not running",
+        "profile.sampling_started": "✅ Sampling started every {interval:g} ms",
+        "profile.capture_armed": "✅ The next {count} invocations of /{command} will be captured",
+        "profile.no_captures": "❌ No capture results yet",
+        "profile.memory_stopped": "✅ Memory tracing stopped",
+        "profile.memory_started": "✅ Memory tracing started, send the command again to compare",
+        "profile.slow_stopped": "✅ Slow callback detection stopped",
+        "profile.slow_started": "✅ Callbacks slower than {threshold:g} ms will be logged",
+        "profile.all_stopped": "✅ All profiling tools stopped",
+        "profile.stacks": "Stacks: {path}",
+        "profile.status": "📈 Profiling status:",
+        "profile.invalid": "❌ Invalid value. Example: /profile sample 10 (at least 1 ms)",
+
+        "config.header": "🎛 Current performance settings:",
+        "config.item": "• {name} = {value} ({minimum:g} - {maximum:g})",
+        "config.changed": "✅ {name}: {old} → {new}",
+        "config.unchanged": "No setting changed.",
+        "config.usage": (
+            "Usage:\n"
+            "/config - show the current settings\n"
+            "/config set name value [name value ...]\n"
+            "/config reload - reload from the environment and the .env file"
+        ),
+
+        "kb.mention_all": "👥 Mention everyone",
+        "kb.scheduling": "⏰ Schedule mentions",
+        "kb.settings": "⚙️ Settings",
+        "kb.stats": "📊 Statistics",
+        "kb.set_time": "🕒 Set mention time",
+        "kb.toggle_scheduling": "🔔 Enable/disable scheduling",
+        "kb.back": "↩️ Back",
+        "kb.previous": "↩️ Back",
+        "kb.cancel": "↩️ Cancel",
+        "kb.confirm": "✅ Confirm",
+        "kb.reset": "↩️ Reset",
+        "kb.main_menu": "↩️ Main menu",
+        "kb.set_language": "🌐 Change language",
+        "kb.change_time": "🕒 Change mention time",
+        "kb.set_message": "📝 Customize message",
+        "kb.check_permissions": "🛡 Bot permissions",
+        "kb.toggle_bot": "🔔 Enable/disable bot",
+        "kb.verify_permissions": "🛡 Check permissions",
+        "kb.update_group_info": "📊 Update group info",
+        "kb.edit_member": "📝 Edit member details",
+        "kb.member_permissions": "🛡 Member permissions",
+        "kb.days": "{days} days",
+        "kb.newer": "➡️ Newer",
+        "kb.older": "Older ⬅️",
+    },
+}
+
+
+def _fields(template: str) -> FrozenSet[str]:
+    return frozenset(field for _, field, _, _ in Formatter().parse(template) if field is not None)
+
+
+class Catalog:
+    """قوالب لغة واحدة مترجمة مسبقاً
+
+    النصوص بلا حقول تُخزن جاهزة، وذات الحقول تُخزن كـ str.format_map مربوطة،
+    فالعرض بحث واحد في قاموس غير قابل للتعديل دون تحليل للقالب.
+    """
+
+    __slots__ = ("language", "_static", "_formats")
+
+    def __init__(self, language: str, messages: Mapping[str, str]):
+        self.language = language
+        static: Dict[str, str] = {}
+        formats: Dict[str, Callable[[Mapping[str, object]], str]] = {}
+        for key, template in messages.items():
+            if _fields(template):
+                formats[key] = template.format_map
+            else:
+                static[key] = template.format()
+        self._static: Mapping[str, str] = MappingProxyType(static)
+        self._formats: Mapping[str, Callable[[Mapping[str, object]], str]] = MappingProxyType(formats)
+
+    def __call__(self, key: str, **values) -> str:
+        if values:
+            return self._formats[key](values)
+        return self._static[key]
+
+    def __repr__(self) -> str:
+        return f"Catalog({self.language!r})"
+
+
+def compile_catalogs(messages: Mapping[str, Mapping[str, str]]) -> Mapping[str, Catalog]:
+    """التحقق من تطابق المفاتيح والحقول بين اللغات ثم بناء القوالب مرة واحدة
+
+    أي مفتاح ناقص في لغة يؤخذ من اللغة الافتراضية، وأي اختلاف في الحقول
+    يوقف التشغيل بدلاً من أن يظهر كخطأ KeyError أمام المستخدم.
+    """
+    default = messages[config.DEFAULT_LANGUAGE]
+    catalogs = {}
+    for language in config.SUPPORTED_LANGUAGES:
+        table = messages.get(language, {})
+        extra = set(table) - set(default)
+        if extra:
+            raise ValueError(f"مفاتيح غير معروفة في لغة {language}: {sorted(extra)}")
+        merged = {}
+        for key, template in default.items():
+            translated = table.get(key)
+            if translated is None:
+                logger.warning(f"النص {key} غير مترجم إلى {language}، استخدام {config.DEFAULT_LANGUAGE}")
+                translated = template
+            elif _fields(translated) != _fields(template):
+                raise ValueError(f"حقول النص {key} في لغة {language} لا تطابق {config.DEFAULT_LANGUAGE}")
+            merged[key] = translated
+        catalogs[language] = Catalog(language, merged)
+    return MappingProxyType(catalogs)
+
+
+CATALOGS = compile_catalogs(MESSAGES)
+
+
+def catalog(language: Optional[str]) -> Catalog:
+    return CATALOGS.get(language) or CATALOGS[config.DEFAULT_LANGUAGE]
+
+
+async def translator(chat_id: Optional[int]) -> Catalog:
+    """قوالب لغة المحادثة من إعدادات المجموعة المخزنة مؤقتاً"""
+    if chat_id is None:
+        return catalog(None)
+    settings = await get_group_settings(chat_id)
+    return catalog(settings.get("language"))
+
+
+def _benchmark(number: int = 200_000) -> None:
+    """مقارنة تكلفة بناء الردود باللغة المخزنة مقابل نصوص f-string المضمنة"""
+    import asyncio
+    import timeit
+
+    from keyboards import settings_menu
+    from state import set_cached_json
+
+    chat_id = -1
+    count, batches = 1234, 25
+    t = catalog("ar")
+
+    def inline():
+        return f"✅ تم ذكر {count} من الأعضاء بنجاح! ({batches} دفعة)"
+
+    def compiled():
+        return t("mention.members_done", count=count, batches=batches)
+
+    def inline_static():
+        return "❌ البوت ليس مشرفاً في المجموعة. يرجى ترقيته أولاً."
+
+    def compiled_static():
+        return t("error.bot_not_admin")
+
+    async def resolved(iterations):
+        await set_cached_json(f"settings:{chat_id}", {"language": "en"}, 3600)
+        started = asyncio.get_running_loop().time()
+        for _ in range(iterations):
+            (await translator(chat_id))("mention.members_done", count=count, batches=batches)
+        return asyncio.get_running_loop().time() - started
+
+    def report(label, seconds, iterations=number):
+        print(f"{label:<44} {seconds / iterations * 1e9:10.0f} ns")
+
+    report("f-string مضمنة (رسالة بحقول)", timeit.timeit(inline, number=number))
+    report("قالب مترجم مسبقاً (رسالة بحقول)", timeit.timeit(compiled, number=number))
+    report("نص مضمن (نص ثابت)", timeit.timeit(inline_static, number=number))
+    report("قالب مترجم مسبقاً (نص ثابت)", timeit.timeit(compiled_static, number=number))
+    iterations = number // 10
+    report("تحديد لغة المجموعة من التخزين المؤقت + العرض", asyncio.run(resolved(iterations)), iterations)
+
+    iterations = number // 100
+    report("بناء لوحة الإعدادات في كل رد", timeit.timeit(lambda: settings_menu.__wrapped__("ar"), number=iterations), iterations)
+    report("لوحة الإعدادات المبنية مسبقاً", timeit.timeit(lambda: settings_menu("ar"), number=number))
+
+
+if __name__ == "__main__":
+    _benchmark()
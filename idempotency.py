@@ -0,0 +1,194 @@
+import logging
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Optional, Set, Tuple
+
+from sqlalchemy import delete, select, update
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from database import get_db, insert_or_ignore, Group, MentionRun, PersistentData
+import config
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_KIND = "meta"
+WATERMARK_KEY = "update_high_water"
+LEDGER_CACHE_SIZE = 4096
+
+RunKey = Tuple[int, str, datetime]
+
+
+class UpdateDeduplicator:
+    """نافذة لآخر معرفات التحديثات في الذاكرة مع حد أعلى محفوظ في قاعدة البيانات
+
+    التحديث المكرر يُكتشف ببحث واحد في مجموعة، وبعد إعادة التشغيل تُرفض
+    التحديثات التي لا تتجاوز الحد الأعلى المحفوظ لأنها عولجت قبل التوقف.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._seen: Set[int] = set()
+        self._order: Deque[int] = deque()
+        self._floor = 0
+        self.high_water = 0
+        self._persisted = 0
+        self.duplicates = 0
+
+    def load(self) -> None:
+        try:
+            with get_db() as db:
+                data = db.execute(
+                    select(PersistentData.data).where(
+                        PersistentData.kind == WATERMARK_KIND, PersistentData.key == WATERMARK_KEY
+                    )
+                ).scalar_one_or_none()
+        except Exception as e:
+            logger.error(f"فشل في تحميل الحد الأعلى للتحديثات: {e}")
+            return
+        if data:
+            self._floor = self.high_water = self._persisted = int(data["update_id"])
+
+    def check(self, update_id: int) -> bool:
+        """True إذا كان التحديث جديداً، ويُسجل في النافذة"""
+        if update_id in self._seen:
+            self.duplicates += 1
+            return False
+        if update_id <= self._floor:
+            # بعد أسبوع بلا تحديثات يختار تيليجرام معرفات جديدة عشوائياً، فالقفزة
+            # الكبيرة للخلف تعني تسلسلاً جديداً وليست إعادة تسليم
+            if self._floor - update_id <= self.window:
+                self.duplicates += 1
+                return False
+            self._seen.clear()
+            self._order.clear()
+            self._floor = self.high_water = self._persisted = 0
+
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > self.window:
+            expired = self._order.popleft()
+            self._seen.discard(expired)
+            # ما خرج من النافذة لم يعد قابلاً للتمييز، فيُرفض كل ما هو أقدم منه
+            self._floor = max(self._floor, expired)
+        if update_id > self.high_water:
+            self.high_water = update_id
+        return True
+
+    def flush(self) -> bool:
+        if self.high_water <= self._persisted:
+            return False
+        high_water = self.high_water
+        try:
+            with get_db() as db:
+                insert_or_ignore(db, PersistentData, kind=WATERMARK_KIND, key=WATERMARK_KEY, data=None)
+                db.execute(
+                    update(PersistentData)
+                    .where(PersistentData.kind == WATERMARK_KIND, PersistentData.key == WATERMARK_KEY)
+                    .values(data={"update_id": high_water}, updated_at=datetime.utcnow())
+                )
+        except Exception as e:
+            logger.error(f"فشل في حفظ الحد الأعلى للتحديثات: {e}")
+            return False
+        self._persisted = high_water
+        return True
+
+
+class RunLedger:
+    """سجل تشغيلات الإشارة بمفتاح (المجموعة، المُطلق، الدقيقة المجدولة)
+
+    المطالبة بتشغيل تُدرج صفاً يحميه فهرس فريد، فالتشغيل المكرر من تحديث
+    معاد أو نسخة أخرى من البوت لا يحصل على المفتاح ويصبح بلا أثر. المفاتيح
+    المطالب بها حديثاً تبقى في الذاكرة حتى يُرفض التكرار المحلي دون قاعدة البيانات.
+    """
+
+    def __init__(self, cache_size: int = LEDGER_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._claimed: "OrderedDict[RunKey, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(group_id: int, trigger: str, scheduled_for: datetime) -> RunKey:
+        if scheduled_for.tzinfo is not None:
+            scheduled_for = scheduled_for.astimezone(timezone.utc).replace(tzinfo=None)
+        return group_id, trigger, scheduled_for.replace(second=0, microsecond=0)
+
+    def _remember(self, key: RunKey) -> None:
+        with self._lock:
+            self._claimed[key] = None
+            if len(self._claimed) > self.cache_size:
+                self._claimed.popitem(last=False)
+
+    def claim(self, group_id: int, trigger: str, scheduled_for: datetime) -> Optional[RunKey]:
+        """حجز التشغيل وإرجاع مفتاحه، أو None إن كان قد حُجز من قبل"""
+        key = self.key(group_id, trigger, scheduled_for)
+        if key in self._claimed:
+            return None
+        try:
+            with get_db() as db:
+                # mention_runs يشير إلى groups: مجموعة لم تُسجل بعد تُضاف أولاً حتى لا يفشل الحجز
+                insert_or_ignore(db, Group, group_id=key[0])
+                claimed = insert_or_ignore(
+                    db, MentionRun, group_id=key[0], trigger=key[1], scheduled_for=key[2],
+                    status="started", created_at=datetime.utcnow()
+                )
+        except Exception as e:
+            # تعذر الوصول للسجل: التشغيل أولى من إسقاط إشارة مطلوبة
+            logger.error(f"فشل في حجز تشغيل الإشارة {key}: {e}")
+            claimed = True
+        self._remember(key)
+        if not claimed:
+            logger.info(f"تجاهل تشغيل مكرر للإشارة {key}")
+            return None
+        return key
+
+    def finish(self, key: RunKey, mention_count: int, success: bool = True) -> None:
+        try:
+            with get_db() as db:
+                db.execute(
+                    update(MentionRun)
+                    .where(
+                        MentionRun.group_id == key[0],
+                        MentionRun.trigger == key[1],
+                        MentionRun.scheduled_for == key[2],
+                    )
+                    .values(
+                        status="done" if success else "failed",
+                        mention_count=mention_count,
+                        finished_at=datetime.utcnow(),
+                    )
+                )
+        except Exception as e:
+            logger.error(f"فشل في تحديث سجل تشغيل الإشارة {key}: {e}")
+
+    def prune(self, retention_days: int) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        try:
+            with get_db() as db:
+                return db.execute(delete(MentionRun).where(MentionRun.created_at < cutoff)).rowcount
+        except Exception as e:
+            logger.error(f"فشل في تنظيف سجل تشغيلات الإشارة: {e}")
+            return 0
+
+
+update_deduplicator = UpdateDeduplicator(config.UPDATE_DEDUP_WINDOW)
+run_ledger = RunLedger()
+
+
+async def drop_duplicate_updates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """معالج يسبق كل المعالجات ويوقف التحديثات المكررة"""
+    if not update_deduplicator.check(update.update_id):
+        raise ApplicationHandlerStop
+
+
+def flush_update_watermark() -> None:
+    """وظيفة الجدولة لحفظ الحد الأعلى للتحديثات دورياً"""
+    update_deduplicator.flush()
+
+
+def prune_run_ledger() -> None:
+    """وظيفة الجدولة لحذف تشغيلات الإشارة القديمة"""
+    removed = run_ledger.prune(config.RUN_LEDGER_RETENTION_DAYS)
+    if removed:
+        logger.info(f"تم حذف {removed} سجل تشغيل قديم")
@@ -1,96 +1,150 @@
-Lfrom telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from functools import lru_cache
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
-def main_menu():
+from callbacks import encode
+from i18n import CATALOGS, catalog
+import config
+
+# لوحات المفاتيح غير قابلة للتعديل في python-telegram-bot لذا يمكن مشاركتها بأمان بين الاستدعاءات
+# وتُبنى مرة واحدة لكل لغة
+
+@lru_cache(maxsize=None)
+def main_menu(lang=config.DEFAULT_LANGUAGE):
+    t = catalog(lang)
     keyboard = [
-        [InlineKeyboardButton("👥 ذكر الجميع", callback_data="mention_all")],
-        [InlineKeyboardButton("⏰ جدولة الذكر", callback_data="scheduling")],
-        [InlineKeyboardButton("⚙️ الإعدادات", callback_data="settings")],
-        [InlineKeyboardButton("📊 الإحصائيات", callback_data="stats")]
+        [InlineKeyboardButton(t("kb.mention_all"), callback_data=encode("mention_all"))],
+        [InlineKeyboardButton(t("kb.scheduling"), callback_data=encode("scheduling"))],
+        [InlineKeyboardButton(t("kb.settings"), callback_data=encode("settings"))],
+        [InlineKeyboardButton(t("kb.stats"), callback_data=encode("stats"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def scheduling_menu():
+@lru_cache(maxsize=None)
+def scheduling_menu(lang=config.DEFAULT_LANGUAGE):
+    t = catalog(lang)
     keyboard = [
-        [InlineKeyboardButton("🕒 تعيين وقت الذكر", callback_data="set_time")],
-        [InlineKeyboardButton("🔔 تفعيل/تعطيل الجدولة", callback_data="toggle_scheduling")],
-        [InlineKeyboardButton("↩️ العودة", callback_data="main_menu")]
+        [InlineKeyboardButton(t("kb.set_time"), callback_data=encode("set_time"))],
+        [InlineKeyboardButton(t("kb.toggle_scheduling"), callback_data=encode("toggle_scheduling"))],
+        [InlineKeyboardButton(t("kb.back"), callback_data=encode("main_menu"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def settings_menu():
+@lru_cache(maxsize=None)
+def settings_menu(lang=config.DEFAULT_LANGUAGE):
+    t = catalog(lang)
     keyboard = [
-        [InlineKeyboardButton("📝 تخصيص الرسالة", callback_data="custom_message")],
-        [InlineKeyboardButton("🛡 صلاحيات البوت", callback_data="check_permissions")],
-        [InlineKeyboardButton("↩️ العودة", callback_data="main_menu")]
+        [InlineKeyboardButton(t("kb.set_language"), callback_data=encode("set_language"))],
+        [InlineKeyboardButton(t("kb.change_time"), callback_data=encode("set_time"))],
+        [InlineKeyboardButton(t("kb.set_message"), callback_data=encode("set_message"))],
+        [InlineKeyboardButton(t("kb.check_permissions"), callback_data=encode("check_permissions"))],
+        [InlineKeyboardButton(t("kb.toggle_bot"), callback_data=encode("toggle_bot"))],
+        [InlineKeyboardButton(t("kb.back"), callback_data=encode("main_menu"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def time_selection_menu(selected_hour=None, selected_minute=None):
+@lru_cache(maxsize=None)
+def time_selection_menu(selected_hour=None, selected_minute=None, lang=config.DEFAULT_LANGUAGE):
+    t = catalog(lang)
     keyboard = []
     row = []
-    
+
     if selected_hour is None:
         for h in range(0, 24):
             emoji = "🌙" if h < 6 else "☀️" if h < 12 else "🌞" if h < 18 else "🌜"
-            row.append(InlineKeyboardButton(f"{emoji}{h:02d}", callback_data=f"hour_{h}")))
+            row.append(InlineKeyboardButton(f"{emoji}{h:02d}", callback_data=encode("hour", h)))
             if len(row) == 4:
                 keyboard.append(row)
                 row = []
         if row:
             keyboard.append(row)
-        keyboard.append([InlineKeyboardButton("↩️ إلغاء", callback_data="scheduling")])
+        keyboard.append([InlineKeyboardButton(t("kb.cancel"), callback_data=encode("scheduling"))])
     elif selected_minute is None:
         for m in range(0, 60, 5):
-            row.append(InlineKeyboardButton(f"{m:02d}", callback_data=f"minute_{selected_hour}_{m}")))
+            row.append(InlineKeyboardButton(f"{m:02d}", callback_data=encode("minute", selected_hour, m)))
             if len(row) == 6:
                 keyboard.append(row)
                 row = []
         if row:
             keyboard.append(row)
-        keyboard.append([InlineKeyboardButton("↩️ رجوع", callback_data="set_time")])
+        keyboard.append([InlineKeyboardButton(t("kb.previous"), callback_data=encode("set_time"))])
     else:
         keyboard = [
-            [InlineKeyboardButton("✅ تأكيد", callback_data=f"confirm_time_{selected_hour}_{selected_minute}")],
-            [InlineKeyboardButton("↩️ إعادة تعيين", callback_data="set_time")]
+            [InlineKeyboardButton(t("kb.confirm"), callback_data=encode("confirm_time", selected_hour, selected_minute))],
+            [InlineKeyboardButton(t("kb.reset"), callback_data=encode("set_time"))]
         ]
     return InlineKeyboardMarkup(keyboard)
 
-def back_button_menu(target="main_menu"):
-    keyboard = [[InlineKeyboardButton("↩️ العودة", callback_data=target)]]
+@lru_cache(maxsize=None)
+def back_button_menu(target="main_menu", lang=config.DEFAULT_LANGUAGE):
+    keyboard = [[InlineKeyboardButton(catalog(lang)("kb.back"), callback_data=encode(target))]]
     return InlineKeyboardMarkup(keyboard)
 
-def group_admin_keyboard():
+@lru_cache(maxsize=None)
+def group_admin_keyboard(lang=config.DEFAULT_LANGUAGE):
+    t = catalog(lang)
     keyboard = [
-        [InlineKeyboardButton("🛡 تحقق من الصلاحيات", callback_data="check_permissions")],
-        [InlineKeyboardButton("📊 تحديث معلومات المجموعة", callback_data="update_group_info")],
-        [InlineKeyboardButton("↩️ القائمة الرئيسية", callback_data="main_menu")]
+        [InlineKeyboardButton(t("kb.verify_permissions"), callback_data=encode("check_permissions"))],
+        [InlineKeyboardButton(t("kb.update_group_info"), callback_data=encode("update_group_info"))],
+        [InlineKeyboardButton(t("kb.main_menu"), callback_data=encode("main_menu"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def member_settings_menu():
+@lru_cache(maxsize=None)
+def member_settings_menu(lang=config.DEFAULT_LANGUAGE):
+    t = catalog(lang)
     keyboard = [
-        [InlineKeyboardButton("📝 تعديل بيانات العضو", callback_data="edit_member")],
-        [InlineKeyboardButton("🛡 صلاحيات العضو", callback_data="check_member_permissions")],
-        [InlineKeyboardButton("↩️ العودة", callback_data="main_menu")]
+        [InlineKeyboardButton(t("kb.edit_member"), callback_data=encode("edit_member"))],
+        [InlineKeyboardButton(t("kb.member_permissions"), callback_data=encode("check_member_permissions"))],
+        [InlineKeyboardButton(t("kb.back"), callback_data=encode("main_menu"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def days_selection_menu(selected_days=None):
+@lru_cache(maxsize=None)
+def days_selection_menu(lang=config.DEFAULT_LANGUAGE):
+    t = catalog(lang)
     keyboard = []
     row = []
     for d in range(1, 31):
-        row.append(InlineKeyboardButton(f"{d} يوم", callback_data=f"day_{d}"))
+        row.append(InlineKeyboardButton(t("kb.days", days=d), callback_data=encode("day", d)))
         if len(row) == 6:
             keyboard.append(row)
             row = []
     if row:
         keyboard.append(row)
-    keyboard.append([InlineKeyboardButton("↩️ رجوع", callback_data="scheduling")])
+    keyboard.append([InlineKeyboardButton(t("kb.previous"), callback_data=encode("scheduling"))])
     return InlineKeyboardMarkup(keyboard)
 
+@lru_cache(maxsize=None)
 def language_selection_menu():
+    # كل لغة تُعرض باسمها الأصلي فاللوحة واحدة لجميع المجموعات
     keyboard = [
-        [InlineKeyboardButton("العربية", callback_data="set_lang_ar")],
-        [InlineKeyboardButton("English", callback_data="set_lang_en")]
+        [InlineKeyboardButton(CATALOGS[code]("language.name"), callback_data=encode("set_lang", code))]
+        for code in config.SUPPORTED_LANGUAGES
     ]
-    return InlineKeyboardMarkup(keyboard)
\ No newline at end of file
+    return InlineKeyboardMarkup(keyboard)
+
+# أزرار صفحات السجل تحمل مؤشر المفتاح نفسه فلا تُخزن مؤقتاً
+def activity_log_keyboard(older=None, newer=None, lang=config.DEFAULT_LANGUAGE):
+    t = catalog(lang)
+    row = []
+    if newer is not None:
+        row.append(InlineKeyboardButton(t("kb.newer"), callback_data=encode("activity_page", 1, *newer)))
+    if older is not None:
+        row.append(InlineKeyboardButton(t("kb.older"), callback_data=encode("activity_page", 0, *older)))
+    return InlineKeyboardMarkup([row]) if row else None
+
+def compile_keyboards() -> int:
+    """بناء اللوحات الثابتة لكل لغة مدعومة عند بدء التشغيل بدلاً من أول طلب"""
+    built = 0
+    for lang in config.SUPPORTED_LANGUAGES:
+        for builder in (main_menu, scheduling_menu, settings_menu, group_admin_keyboard,
+                        member_settings_menu, days_selection_menu):
+            builder(lang)
+            built += 1
+        for target in ("main_menu", "scheduling"):
+            back_button_menu(target, lang)
+            built += 1
+        time_selection_menu(lang=lang)
+        built += 1
+    language_selection_menu()
+    return built + 1
@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from telegram import Update
+from telegram.ext import ContextTypes, ExtBot
+
+logger = logging.getLogger(__name__)
+
+STUB_TOKEN = "123456:STUB-TOKEN-FOR-REPLAY"
+STUB_BOT_ID = 123456
+
+# الحقول التي تحمل بيانات شخصية ويجب إخفاؤها عند التسجيل
+_ID_FIELDS = {"id", "user_id", "chat_id"}
+_NAME_FIELDS = {"username", "first_name", "last_name", "title"}
+
+
+class UpdateRecorder:
+    """تسجيل التحديثات الواردة في ملف JSONL مضغوط قابل للإلحاق"""
+
+    def __init__(self, path: str, anonymize: bool = False, salt: str = "", flush_every: int = 100):
+        self.path = path
+        self.anonymize = anonymize
+        self.salt = salt
+        self.flush_every = flush_every
+        self._buffer: List[str] = []
+        self._started = time.monotonic()
+
+    def _hash_int(self, value: int) -> int:
+        digest = hashlib.sha256(f"{self.salt}:{value}".encode()).digest()
+        hashed = int.from_bytes(digest[:6], "big")
+        return -hashed if value < 0 else hashed
+
+    def _hash_str(self, value: str) -> str:
+        return "u" + hashlib.sha256(f"{self.salt}:{value}".encode()).hexdigest()[:10]
+
+    def _scrub(self, data: Any, key: Optional[str] = None) -> Any:
+        if isinstance(data, dict):
+            return {k: self._scrub(v, k) for k, v in data.items()}
+        if isinstance(data, list):
+            return [self._scrub(item) for item in data]
+        if key in _ID_FIELDS and isinstance(data, int) and data != STUB_BOT_ID:
+            return self._hash_int(data)
+        if key in _NAME_FIELDS and isinstance(data, str):
+            return self._hash_str(data)
+        if key == "text" and isinstance(data, str):
+            # نحتفظ بالأمر نفسه حتى يمر بنفس مسار المعالجة، ونستبدل باقي النص بطول مماثل
+            if data.startswith("/"):
+                command, _, rest = data.partition(" ")
+                return f"{command} {'x' * len(rest)}".rstrip()
+            return "x" * len(data)
+        return data
+
+    async def record(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        data = update.to_dict()
+        if self.anonymize:
+            data = self._scrub(data)
+        entry = {"t": round(time.monotonic() - self._started, 4), "u": data}
+        self._buffer.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        # كل دفعة عضو gzip مستقل، لذا يبقى الملف قابلاً للإلحاق والقراءة بالتتابع
+        with gzip.open(self.path, "ab") as out:
+            out.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def read_recording(path: str) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as source:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _stub_user(user_id: int = STUB_BOT_ID) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": user_id == STUB_BOT_ID, "first_name": "Stub", "username": f"stub{abs(user_id)}"}
+
+
+class StubBot(ExtBot):
+    """بوت وهمي يرد على طلبات API بنتائج ثابتة دون اتصال بالشبكة"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(token=STUB_TOKEN)
+        with self._unfrozen():
+            self.latency = latency
+            self.calls: Dict[str, int] = {}
+            self._message_id = 0
+
+    def _message(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        self._message_id += 1
+        return {
+            "message_id": data.get("message_id") or self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": data.get("chat_id", 0), "type": "supergroup", "title": "Stub"},
+            "from": _stub_user(),
+            "text": data.get("text", ""),
+        }
+
+    async def _do_post(self, endpoint: str, data: Dict[str, Any], **kwargs: Any) -> Any:
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if endpoint == "getMe":
+            return {**_stub_user(), "can_join_groups": True, "can_read_all_group_messages": True,
+                    "supports_inline_queries": False}
+        if endpoint in ("sendMessage", "editMessageText"):
+            return self._message(data)
+        if endpoint == "getChatMember":
+            return {"status": "administrator", "user": _stub_user(data.get("user_id", STUB_BOT_ID)),
+                    "can_be_edited": False, "is_anonymous": False, "can_manage_chat": True,
+                    "can_delete_messages": True, "can_manage_video_chats": True,
+                    "can_restrict_members": True, "can_promote_members": False,
+                    "can_change_info": True, "can_invite_users": True, "can_pin_messages": True}
+        if endpoint == "getChatAdministrators":
+            return [{"status": "creator", "user": _stub_user(1), "is_anonymous": False}]
+        if endpoint == "getChat":
+            return {"id": data.get("chat_id", 0), "type": "supergroup", "title": "Stub"}
+        return True
+
+
+class LoopLagMonitor:
+    """قياس تأخر حلقة الأحداث عبر مؤقت دوري"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def replay(path: str, speed: Optional[float] = 1.0, latency: float = 0.0,
+                 concurrency: int = 256) -> Dict[str, Any]:
+    """إعادة تشغيل التسجيل عبر التطبيق الحقيقي وإرجاع تقرير الأداء
+
+    speed=None يعني أسرع ما يمكن، وإلا تُقسم الفواصل الزمنية الأصلية على speed.
+    يكتب في قاعدة DB_URL الحالية؛ main تضبطها على قاعدة مؤقتة ما لم يُطلب غير ذلك.
+    """
+    from sqlalchemy import event
+    from telegram.ext import ApplicationBuilder
+
+    from database import engine, init_db
+    from handlers import setup_handlers
+
+    queries = 0
+
+    def count_query(*args: Any) -> None:
+        nonlocal queries
+        queries += 1
+
+    event.listen(engine, "before_cursor_execute", count_query)
+    init_db()
+
+    bot = StubBot(latency=latency)
+    application = setup_handlers(ApplicationBuilder().bot(bot).updater(None).build())
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def count_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        nonlocal errors
+        errors += 1
+
+    application.add_error_handler(count_error)
+
+    async def process(update: Update) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await application.process_update(update)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    monitor = LoopLagMonitor()
+    async with application:
+        monitor.start()
+        started = time.perf_counter()
+        tasks = []
+        for entry in read_recording(path):
+            if speed:
+                delay = entry["t"] / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = Update.de_json(entry["u"], bot)
+            tasks.append(asyncio.create_task(process(update)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+
+    event.remove(engine, "before_cursor_execute", count_query)
+    return {
+        "updates": len(latencies),
+        "errors": errors,
+        "duration": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50": _percentile(latencies, 0.5),
+        "latency_p95": _percentile(latencies, 0.95),
+        "latency_p99": _percentile(latencies, 0.99),
+        "db_queries": queries,
+        "db_queries_per_update": queries / len(latencies) if latencies else 0.0,
+        "loop_lag_p95": _percentile(monitor.samples, 0.95),
+        "loop_lag_max": max(monitor.samples, default=0.0),
+        "api_calls": dict(bot.calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="إعادة تشغيل تحديثات مسجلة لاختبار الحمل")
+    parser.add_argument("recording", help="ملف التسجيل (JSONL مضغوط)")
+    parser.add_argument("--speed", type=float, default=1.0, help="مضاعف السرعة، 0 = أسرع ما يمكن")
+    parser.add_argument("--latency", type=float, default=0.0, help="زمن استجابة API الوهمي بالثواني")
+    parser.add_argument("--db-url", help="قاعدة بيانات للاختبار بدلاً من ملف SQLite مؤقت؛ "
+                                            "الإعادة تكتب فيها سجلات وعدادات")
+    args = parser.parse_args()
+
+    # الافتراضي قاعدة مؤقتة تُحذف بعد التقرير حتى لا تكتب الإعادة في قاعدة الإنتاج
+    workdir = None
+    if not args.db_url:
+        workdir = tempfile.mkdtemp(prefix="loadtest-")
+        args.db_url = f"sqlite:///{os.path.join(workdir, 'replay.db')}"
+    # يجب ضبطها قبل استيراد database الذي ينشئ المحرك عند الاستيراد
+    os.environ["DB_URL"] = args.db_url
+    logging.basicConfig(level=logging.WARNING)
+
+    try:
+        report = asyncio.run(replay(args.recording, speed=args.speed or None, latency=args.latency))
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
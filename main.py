@@ -1,38 +1,85 @@
+import asyncio
 import logging
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
+from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, TypeHandler, filters
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from config import Config
+import config
 from database import init_db
 from handlers import setup_handlers
 from scheduler import setup_scheduler
 from utils import update_member_activity, update_group_info
+from quota import mention_quota
+from persistence import bot_persistence
+from transport import build_request, build_get_updates_request
+from reconcile import start_reconciler, stop_reconciler
+from loadtest import UpdateRecorder
+from state import state_backend
+from outbound import outbound_scheduler
+from idempotency import update_deduplicator, drop_duplicate_updates
+from audit import audit_log
+from runtime import install_reload_signal
 
 # إعداد التسجيل
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, Config.LOG_LEVEL),
+    level=getattr(logging, config.LOG_LEVEL),
     handlers=[
-        logging.FileHandler(Config.LOG_FILE),
+        logging.FileHandler(config.LOG_FILE),
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
+recorder = UpdateRecorder(config.RECORD_UPDATES_PATH, config.RECORD_ANONYMIZE, config.RECORD_SALT) \
+    if config.RECORD_UPDATES_PATH else None
+
 async def post_init(application):
     """وظيفة ما بعد التهيئة"""
     # تهيئة قاعدة البيانات
     init_db()
     
+    # استعادة الحد الأعلى لمعرفات التحديثات المعالجة قبل التوقف
+    update_deduplicator.load()
+    
+    # بدء دافئ من لقطة الحالة السابقة؛ القيم تُفك عند أول طلب لها
+    if config.SNAPSHOT_PATH:
+        state_backend.load_snapshot(config.SNAPSHOT_PATH, config.SNAPSHOT_MAX_AGE)
+    
+    # إعادة تحميل إعدادات الأداء عند SIGHUP دون إيقاف الإشارات الجارية
+    install_reload_signal(asyncio.get_running_loop())
+    
     # بدء خدمة الجدولة
-    setup_scheduler()
+    setup_scheduler(application.bot)
+    
+    # بدء مطابقة قوائم الأعضاء في الخلفية
+    start_reconciler(application.bot)
     
     logger.info("تم تهيئة البوت بنجاح")
 
 async def post_stop(application):
     """وظيفة ما بعد التوقف"""
     logger.info("إيقاف البوت...")
+    
+    await stop_reconciler()
+    
+    # حفظ المشرفين والإعدادات وعدادات المعدل المخزنة لبدء دافئ
+    if config.SNAPSHOT_PATH:
+        try:
+            saved = state_backend.save_snapshot(config.SNAPSHOT_PATH)
+            if saved:
+                logger.info(f"تم حفظ لقطة الحالة: {saved} مفتاح")
+        except Exception as e:
+            logger.error(f"فشل في حفظ لقطة الحالة: {e}")
+    await state_backend.close()
+    
+    if recorder:
+        recorder.flush()
+    
+    # حفظ عدادات الإشارات المتبقية في الذاكرة
+    mention_quota.flush()
+    update_deduplicator.flush()
+    audit_log.flush()
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """معالج الأخطاء العام"""
@@ -50,7 +97,11 @@ def main():
     """الدالة الرئيسية لتشغيل البوت"""
     # إنشاء تطبيق البوت
     application = ApplicationBuilder() \
-        .token(Config.BOT_TOKEN) \
+        .token(config.BOT_TOKEN) \
+        .persistence(bot_persistence) \
+        .request(build_request()) \
+        .get_updates_request(build_get_updates_request()) \
+        .rate_limiter(outbound_scheduler) \
         .post_init(post_init) \
         .post_stop(post_stop) \
         .build()
@@ -58,6 +109,13 @@ def main():
     # إعداد معالجات الأوامر
     application = setup_handlers(application)
     
+    # إسقاط التحديثات المكررة قبل وصولها لأي معالج
+    application.add_handler(TypeHandler(Update, drop_duplicate_updates), group=-2)
+    
+    # تسجيل التحديثات الواردة لإعادة تشغيلها في اختبارات الحمل
+    if recorder:
+        application.add_handler(TypeHandler(Update, recorder.record), group=-1)
+    
     # إعداد معالج الأخطاء
     application.add_error_handler(error_handler)
     
@@ -0,0 +1,185 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional
+
+from telegram.ext import BaseRateLimiter
+
+from budget import ApiBudget, api_budget
+import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 512
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    STATUS = 1
+    BULK = 2
+    BACKGROUND = 3
+
+
+# أولوية الطلبات الصادرة من السياق الحالي؛ الافتراضي تفاعلي لأن معظم الطلبات ردود مباشرة
+current_priority: contextvars.ContextVar = contextvars.ContextVar("outbound_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def priority(level: Priority):
+    """تنفيذ طلبات API داخل الكتلة بأولوية محددة"""
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class _Job:
+    __slots__ = ("call", "future", "enqueued", "priority")
+
+    def __init__(self, call: Callable[[], Coroutine[Any, Any, Any]], future: asyncio.Future, level: Priority):
+        self.call = call
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.priority = level
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """جدولة طلبات Bot API حسب الأولوية مع توزيع عادل بين المحادثات
+
+    الطلبات التفاعلية تُخدم أولاً ولها عامل مخصص لا ينتظر خلف الإرسال الجماعي،
+    وباقي الفئات تتقاسم الميزانية بأوزان ثابتة، وداخل كل فئة تتناوب المحادثات.
+    """
+
+    def __init__(self, budget: ApiBudget, workers: int, weights: Dict[Priority, int]):
+        self.budget = budget
+        self.workers = max(workers, 2)
+        self.weights = weights
+        self._queues: Dict[Priority, "OrderedDict[Any, Deque[_Job]]"] = {level: OrderedDict() for level in Priority}
+        self._credits = dict(weights)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._waits: Dict[Priority, Deque[float]] = {level: deque(maxlen=LATENCY_SAMPLES) for level in Priority}
+        self.slo_violations = 0
+
+    async def initialize(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(interactive_only=True))]
+        self._tasks += [loop.create_task(self._worker()) for _ in range(self.workers - 1)]
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queues in self._queues.values():
+            for jobs in queues.values():
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.cancel()
+            queues.clear()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Any:
+        level = Priority(rate_limit_args) if rate_limit_args is not None else current_priority.get()
+        if not self._tasks:
+            return await callback(*args, **kwargs)
+
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(lambda: callback(*args, **kwargs), future, level)
+        self._queues[level].setdefault(data.get("chat_id"), deque()).append(job)
+        self._wakeup.set()
+        return await future
+
+    def _pop_from(self, level: Priority) -> Optional[_Job]:
+        queues = self._queues[level]
+        while queues:
+            chat_id, jobs = next(iter(queues.items()))
+            job = jobs.popleft()
+            # المحادثة التي خُدمت تنتقل لآخر الدور حتى لا تحتكر مجموعة كبيرة الإرسال
+            if jobs:
+                queues.move_to_end(chat_id)
+            else:
+                del queues[chat_id]
+            if not job.future.cancelled():
+                return job
+        return None
+
+    def _next_job(self, interactive_only: bool) -> Optional[_Job]:
+        job = self._pop_from(Priority.INTERACTIVE)
+        if job is not None or interactive_only:
+            return job
+
+        for _ in range(2):
+            for level in (Priority.STATUS, Priority.BULK, Priority.BACKGROUND):
+                if self._credits[level] > 0 and self._queues[level]:
+                    job = self._pop_from(level)
+                    if job is not None:
+                        self._credits[level] -= 1
+                        return job
+            # انتهت أرصدة الفئات المنتظرة: بداية جولة جديدة من الأوزان
+            self._credits = dict(self.weights)
+        return None
+
+    async def _worker(self, interactive_only: bool = False) -> None:
+        while True:
+            job = self._next_job(interactive_only)
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # الاحتياطي لا يتجاوز سعة الدلو وإلا لن تحصل الفئات الأخرى على أي رمز
+            reserve = 0.0 if job.priority == Priority.INTERACTIVE else min(
+                config.INTERACTIVE_API_RESERVE, self.budget.capacity - 1
+            )
+            await self.budget.acquire(reserve=reserve)
+
+            waited = time.monotonic() - job.enqueued
+            self._waits[job.priority].append(waited)
+            if job.priority == Priority.INTERACTIVE and waited > config.INTERACTIVE_LATENCY_SLO:
+                self.slo_violations += 1
+                logger.warning(f"تجاوز رد تفاعلي هدف زمن الاستجابة: {waited * 1000:.0f} مللي ثانية")
+
+            if job.future.cancelled():
+                continue
+            try:
+                result = await job.call()
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for level, waits in self._waits.items():
+            ordered = sorted(waits)
+            result[level.name.lower()] = {
+                "queued": sum(len(jobs) for jobs in self._queues[level].values()),
+                "wait_p50": ordered[len(ordered) // 2] if ordered else 0.0,
+                "wait_p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0,
+            }
+        return result
+
+
+outbound_scheduler = OutboundScheduler(
+    api_budget,
+    workers=config.OUTBOUND_WORKERS,
+    weights={Priority.STATUS: 4, Priority.BULK: 2, Priority.BACKGROUND: 1},
+)
@@ -0,0 +1,242 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set, Tuple
+
+from sqlalchemy import delete, insert, select
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import get_db, PersistentData
+import config
+
+logger = logging.getLogger(__name__)
+
+BOT_KIND = "bot"
+CHAT_KIND = "chat"
+USER_KIND = "user"
+CONVERSATIONS_KEY = "conversations"
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _conversation_kind(name: str) -> str:
+    return f"conversation:{name}"
+
+
+class DatabasePersistence(BasePersistence):
+    """حفظ بيانات البوت والمحادثات والمستخدمين في قاعدة البيانات
+
+    البيانات تُحمّل كسولاً لكل محادثة عند أول تحديث يخصها، والتغييرات تُجمع
+    في الذاكرة ولا تُكتب إلا ما تغير منها دفعة واحدة عند flush_pending.
+    """
+
+    def __init__(self, update_interval: float = config.PERSISTENCE_UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._lock = threading.Lock()
+        # (kind, key) -> آخر نص JSON محفوظ، لتجاهل التحديثات غير المتغيرة
+        self._saved: Dict[Tuple[str, str], str] = {}
+        # (kind, key) -> نص JSON بانتظار الكتابة، أو None للحذف
+        self._pending: Dict[Tuple[str, str], Optional[str]] = {}
+        self._loaded_chats: Set[int] = set()
+        self._loaded_users: Set[int] = set()
+
+    def _load(self, kind: str, key: str) -> Optional[Any]:
+        try:
+            with get_db() as db:
+                data = db.execute(
+                    select(PersistentData.data).where(PersistentData.kind == kind, PersistentData.key == key)
+                ).scalar_one_or_none()
+        except Exception as e:
+            logger.error(f"فشل في تحميل البيانات المحفوظة {kind}/{key}: {e}")
+            return None
+        if data is not None:
+            self._saved[(kind, key)] = _dumps(data)
+        return data
+
+    def _mark(self, kind: str, key: str, data: Any) -> None:
+        """تسجيل البيانات كمعدلة فقط إن اختلفت عن آخر نسخة محفوظة"""
+        encoded = _dumps(data)
+        with self._lock:
+            previous = self._saved.get((kind, key))
+            if previous == encoded or (previous is None and encoded == "{}"):
+                return
+            self._saved[(kind, key)] = encoded
+            self._pending[(kind, key)] = encoded
+
+    def _drop(self, kind: str, key: str) -> None:
+        with self._lock:
+            self._saved.pop((kind, key), None)
+            self._pending[(kind, key)] = None
+
+    # التحميل عند بدء التشغيل: لا شيء يُحمّل مسبقاً عدا بيانات البوت
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return self._load(BOT_KIND, "") or {}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[Any, ...], object]:
+        cutoff = datetime.utcnow() - timedelta(seconds=config.CONVERSATION_TTL)
+        conversations = {}
+        try:
+            with get_db() as db:
+                rows = db.execute(
+                    select(PersistentData.key, PersistentData.data).where(
+                        PersistentData.kind == _conversation_kind(name),
+                        PersistentData.updated_at >= cutoff,
+                    )
+                ).all()
+        except Exception as e:
+            logger.error(f"فشل في تحميل حالات المحادثة {name}: {e}")
+            return conversations
+        for key, state in rows:
+            conversations[tuple(json.loads(key))] = state
+        return conversations
+
+    # التحميل الكسول لكل محادثة ومستخدم
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        if chat_id in self._loaded_chats:
+            return
+        self._loaded_chats.add(chat_id)
+        stored = self._load(CHAT_KIND, str(chat_id))
+        if stored:
+            for key, value in stored.items():
+                chat_data.setdefault(key, value)
+        prune_expired_inputs(chat_data)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        stored = self._load(USER_KIND, str(user_id))
+        if stored:
+            for key, value in stored.items():
+                user_data.setdefault(key, value)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    # تسجيل التغييرات في الذاكرة فقط
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        self._mark(BOT_KIND, "", data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._mark(CHAT_KIND, str(chat_id), data)
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._mark(USER_KIND, str(user_id), data)
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: Tuple[Any, ...], new_state: Optional[object]) -> None:
+        if new_state is None:
+            self._drop(_conversation_kind(name), _dumps(list(key)))
+        else:
+            self._mark(_conversation_kind(name), _dumps(list(key)), new_state)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._loaded_chats.discard(chat_id)
+        self._drop(CHAT_KIND, str(chat_id))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._loaded_users.discard(user_id)
+        self._drop(USER_KIND, str(user_id))
+
+    async def flush(self) -> None:
+        self.flush_pending()
+
+    def flush_pending(self) -> int:
+        """كتابة جميع التغييرات المعلقة في معاملة واحدة"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        by_kind: Dict[str, list] = {}
+        for kind, key in pending:
+            by_kind.setdefault(kind, []).append(key)
+        now = datetime.utcnow()
+        rows = [
+            {"kind": kind, "key": key, "data": json.loads(encoded), "updated_at": now}
+            for (kind, key), encoded in pending.items()
+            if encoded is not None
+        ]
+
+        try:
+            with get_db() as db:
+                for kind, keys in by_kind.items():
+                    db.execute(delete(PersistentData).where(PersistentData.kind == kind, PersistentData.key.in_(keys)))
+                if rows:
+                    db.execute(insert(PersistentData), rows)
+        except Exception as e:
+            logger.error(f"فشل في حفظ بيانات المحادثات: {e}")
+            with self._lock:
+                for item, encoded in pending.items():
+                    self._pending.setdefault(item, encoded)
+            return 0
+        return len(pending)
+
+
+bot_persistence = DatabasePersistence()
+
+
+def flush_persistence() -> None:
+    """وظيفة الجدولة لكتابة بيانات المحادثات المعدلة"""
+    written = bot_persistence.flush_pending()
+    if written:
+        logger.debug(f"تم حفظ {written} سجل من بيانات المحادثات")
+
+
+def set_pending_input(chat_data: Dict[Any, Any], user_id: int, state: str) -> None:
+    """انتظار إدخال نصي من مستخدم محدد داخل هذه المجموعة فقط"""
+    chat_data.setdefault(CONVERSATIONS_KEY, {})[str(user_id)] = {
+        "state": state,
+        "expires": time.time() + config.CONVERSATION_TTL,
+    }
+
+
+def get_pending_input(chat_data: Dict[Any, Any], user_id: int) -> Optional[str]:
+    entry = chat_data.get(CONVERSATIONS_KEY, {}).get(str(user_id))
+    if not entry:
+        return None
+    if entry["expires"] < time.time():
+        clear_pending_input(chat_data, user_id)
+        return None
+    return entry["state"]
+
+
+def clear_pending_input(chat_data: Dict[Any, Any], user_id: int) -> None:
+    conversations = chat_data.get(CONVERSATIONS_KEY)
+    if conversations:
+        conversations.pop(str(user_id), None)
+        if not conversations:
+            del chat_data[CONVERSATIONS_KEY]
+
+
+def prune_expired_inputs(chat_data: Dict[Any, Any]) -> None:
+    """حذف المحادثات المهجورة التي تجاوزت مدة الصلاحية"""
+    conversations = chat_data.get(CONVERSATIONS_KEY)
+    if not conversations:
+        return
+    now = time.time()
+    for user_key in [key for key, entry in conversations.items() if entry["expires"] < now]:
+        del conversations[user_key]
+    if not conversations:
+        del chat_data[CONVERSATIONS_KEY]
@@ -0,0 +1,141 @@
+import heapq
+import logging
+import math
+from typing import AbstractSet, Dict, Hashable, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from telegram import Bot
+
+from budget import api_budget
+from database import get_db, Member, MemberRow
+from i18n import Catalog
+from outbound import Priority, outbound_scheduler
+from quota import mention_quota
+from runtime import runtime_config
+from transport import get_endpoint_stats
+from utils import roster_source, _iterate, filter_members, render_mentions, pack_messages, get_mention_header
+import config
+
+logger = logging.getLogger(__name__)
+
+# زمن إرسال افتراضي قبل توفر قياسات فعلية لـ sendMessage
+DEFAULT_SEND_LATENCY = 0.15
+
+
+class MentionPlan(NamedTuple):
+    """تقدير تكلفة تشغيل إشارة قبل تنفيذه"""
+    members: int
+    messages: int
+    characters: int
+    send_interval: float
+    budget_wait: float
+    duration: float
+    chat_minutes: float
+    quota_used: int
+    quota_limit: int
+
+
+def _send_latency() -> float:
+    stats = get_endpoint_stats().get("sendMessage")
+    if stats and stats["calls"]:
+        return stats["p50"]
+    return DEFAULT_SEND_LATENCY
+
+
+def _budget_wait() -> float:
+    """الانتظار المتوقع قبل أول رسالة: الطلبات غير التفاعلية المنتظرة ونقص الرموز فوق الاحتياطي"""
+    stats = outbound_scheduler.stats()
+    backlog = sum(stats[level.name.lower()]["queued"] for level in Priority if level != Priority.INTERACTIVE)
+    shortfall = max(0.0, config.INTERACTIVE_API_RESERVE + 1 - api_budget.available)
+    return (backlog + shortfall) / api_budget.rate
+
+
+def build_plan(chat_id: int, members: int, messages: int, characters: int) -> MentionPlan:
+    latency = _send_latency()
+    interval = runtime_config.current.MENTION_DELAY + latency
+    # تيليجرام يحد الرسائل لكل مجموعة بالدقيقة، وما يتجاوز ذلك يتباطأ بأخطاء RetryAfter
+    if messages > config.CHAT_MESSAGES_PER_MINUTE:
+        interval = max(interval, 60 / config.CHAT_MESSAGES_PER_MINUTE)
+    budget_wait = _budget_wait()
+    duration = budget_wait + max(messages - 1, 0) * interval + latency if messages else 0.0
+    return MentionPlan(
+        members=members,
+        messages=messages,
+        characters=characters,
+        send_interval=interval,
+        budget_wait=budget_wait,
+        duration=duration,
+        chat_minutes=messages / config.CHAT_MESSAGES_PER_MINUTE,
+        quota_used=mention_quota.count(chat_id),
+        quota_limit=mention_quota.limit,
+    )
+
+
+async def plan_run(bot: Optional[Bot], chat_id: int, members: Iterable[MemberRow] = None,
+                   exclude_ids: Iterable[int] = (),
+                   include_ids: Optional[AbstractSet[int]] = None) -> MentionPlan:
+    """تمرير نفس مراحل خط الإشارة حتى التجميع دون إرسال، ثم تقدير الزمن والتكلفة"""
+    source = roster_source(bot, chat_id) if members is None else _iterate(members)
+    rows = filter_members(source, exclude_ids, include_ids)
+    packed = pack_messages(render_mentions(rows), await get_mention_header(chat_id))
+
+    member_count = message_count = characters = 0
+    async for count, text in packed:
+        member_count += count
+        message_count += 1
+        characters += len(text)
+    return build_plan(chat_id, member_count, message_count, characters)
+
+
+def estimate_run(chat_id: int) -> MentionPlan:
+    """تقدير سريع من عدد الأعضاء فقط، للجدولة حيث لا حاجة لقراءة القائمة كاملة"""
+    with get_db() as db:
+        members = db.execute(
+            select(func.count(Member.id)).where(
+                Member.group_id == chat_id, Member.is_active == True, Member.is_bot == False
+            )
+        ).scalar_one()
+    return build_plan(chat_id, members, math.ceil(members / runtime_config.current.DEFAULT_BATCH_SIZE), 0)
+
+
+def spread_offsets(plans: Sequence[Tuple[Hashable, MentionPlan]], lanes: int) -> Dict[Hashable, float]:
+    """توزيع التشغيلات على عدد محدود من المسارات المتزامنة وإرجاع تأخير بدء كل منها
+
+    الأقصر أولاً، وكل تشغيل يبدأ على المسار الذي يفرغ أولاً، فلا تتكدس
+    التشغيلات الكبيرة في نفس الدقيقة وتبدأ المجموعات الصغيرة في موعدها.
+    """
+    free_at = [0.0] * max(lanes, 1)
+    offsets = {}
+    for key, plan in sorted(plans, key=lambda item: item[1].duration):
+        start = heapq.heappop(free_at)
+        offsets[key] = start
+        heapq.heappush(free_at, start + plan.duration)
+    return offsets
+
+
+def _format_duration(t: Catalog, seconds: float) -> str:
+    if seconds < 60:
+        return t("unit.seconds", value=seconds)
+    if seconds < 3600:
+        return t("unit.minutes", value=seconds / 60)
+    return t("unit.hours", value=seconds / 3600)
+
+
+def format_plan(plan: MentionPlan, t: Catalog) -> str:
+    if plan.quota_limit:
+        quota = t("plan.quota", used=plan.quota_used + 1, limit=plan.quota_limit)
+    else:
+        quota = t("plan.quota_unlimited", used=plan.quota_used + 1)
+    lines = [
+        t("plan.header"),
+        t("plan.members", members=plan.members),
+        t("plan.messages", messages=plan.messages, characters=plan.characters),
+        t("plan.duration", duration=_format_duration(t, plan.duration)),
+        t("plan.interval", interval=plan.send_interval),
+        t("plan.budget_wait", wait=_format_duration(t, plan.budget_wait)),
+        t("plan.chat_limit", minutes=plan.chat_minutes, per_minute=config.CHAT_MESSAGES_PER_MINUTE),
+        quota,
+    ]
+    if plan.quota_limit and plan.quota_used >= plan.quota_limit:
+        lines.append(t("plan.quota_exhausted"))
+    return "\n".join(lines)
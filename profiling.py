@@ -0,0 +1,270 @@
+import asyncio
+import cProfile
+import io
+import logging
+import math
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+from functools import wraps
+from typing import Deque, Dict, List, Optional
+
+from telegram.ext import Application, CommandHandler
+import config
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_LINES = 10
+# أقصر فترة بين العينات؛ الأقصر منها يشغل خيط العينات دون توقف
+MIN_SAMPLE_INTERVAL = 0.001
+
+
+def _output_path(name: str) -> str:
+    os.makedirs(config.PROFILE_PATH, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(config.PROFILE_PATH, f"{name}-{stamp}")
+
+
+class StackSampler:
+    """محلل إحصائي يأخذ عينات من مكدس خيط حلقة الأحداث على فترات ثابتة"""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._target_id: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float) -> None:
+        if not math.isfinite(interval) or interval < MIN_SAMPLE_INTERVAL:
+            raise ValueError(f"فترة أخذ العينات يجب أن تكون {MIN_SAMPLE_INTERVAL * 1000:g} مللي ثانية على الأقل")
+        if self.running:
+            return
+        self.counts.clear()
+        self.samples = 0
+        self._target_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True, name="stack-sampler")
+        self._thread.start()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(self._target_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self) -> Optional[str]:
+        """إيقاف أخذ العينات وكتابة المكدسات بصيغة collapsed المتوافقة مع flamegraph"""
+        if not self.running:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        path = _output_path("stacks") + ".collapsed"
+        with open(path, "w") as out:
+            for stack, count in self.counts.most_common():
+                out.write(f"{stack} {count}\n")
+        return path
+
+    def top(self, limit: int = SUMMARY_LINES) -> List[str]:
+        leaves: Counter = Counter()
+        for stack, count in self.counts.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [f"{leaf}: {count * 100 / max(self.samples, 1):.1f}%" for leaf, count in leaves.most_common(limit)]
+
+
+class HandlerCapture:
+    """التقاط cProfile لعدد محدد من الاستدعاءات التالية لأمر معين"""
+
+    def __init__(self, command: str, invocations: int):
+        self.command = command
+        self.remaining = invocations
+        self.profile = cProfile.Profile()
+        self.path: Optional[str] = None
+        # استدعاء واحد فقط يُقاس في كل لحظة؛ المتزامن معه يعمل دون قياس
+        self.active = False
+
+    def finish(self) -> str:
+        self.path = _output_path(f"handler-{self.command}") + ".pstats"
+        self.profile.dump_stats(self.path)
+        return self.path
+
+    def summary(self) -> str:
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+        return stream.getvalue()
+
+
+class _Suspend:
+    """تمرير ما ينتظره coroutine داخلي إلى المهمة كما هو"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __await__(self):
+        return (yield self.value)
+
+
+async def _profiled(profile: cProfile.Profile, coro):
+    """تشغيل coroutine خطوة بخطوة مع تفعيل المحلل أثناء كل خطوة فقط
+
+    المحلل يقيس كل ما يعمل على الخيط، فتفعيله طوال await يضيف إلى القياس
+    مهاماً أخرى تعمل أثناء الانتظار. هنا يُوقف عند كل تعليق ويُستأنف بعده.
+    """
+    value, error = None, None
+    while True:
+        profile.enable()
+        try:
+            yielded = coro.send(value) if error is None else coro.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            profile.disable()
+        try:
+            value, error = await _Suspend(yielded), None
+        except BaseException as e:
+            # الإلغاء وأخطاء الانتظار تُمرر إلى المعالج ليتعامل معها
+            value, error = None, e
+
+
+class SlowCallbackCollector(logging.Handler):
+    """جمع تحذيرات asyncio عن الاستدعاءات البطيئة في وضع التصحيح"""
+
+    def __init__(self, maxlen: int = 50):
+        super().__init__(level=logging.WARNING)
+        self.records: Deque[str] = deque(maxlen=maxlen)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        message = record.getMessage()
+        if message.startswith("Executing"):
+            self.records.append(message)
+
+
+class Profiler:
+    """نقطة التحكم الموحدة لأدوات القياس التي يفعلها المسؤولون عند الحاجة"""
+
+    def __init__(self):
+        self.sampler = StackSampler()
+        self.captures: Dict[str, HandlerCapture] = {}
+        self.finished: List[HandlerCapture] = []
+        self.slow_callbacks: Optional[SlowCallbackCollector] = None
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+    # أخذ العينات الإحصائي
+
+    def start_sampling(self, interval: float) -> None:
+        self.sampler.start(interval)
+
+    def stop_sampling(self) -> Optional[str]:
+        return self.sampler.stop()
+
+    # cProfile لكل معالج
+
+    def arm_capture(self, command: str, invocations: int) -> None:
+        if invocations < 1:
+            raise ValueError("عدد الاستدعاءات يجب أن يكون 1 على الأقل")
+        self.captures[command] = HandlerCapture(command, invocations)
+
+    def wrap(self, command: str, callback):
+        @wraps(callback)
+        async def wrapped(update, context):
+            capture = self.captures.get(command)
+            if capture is None or capture.active:
+                return await callback(update, context)
+            capture.active = True
+            try:
+                return await _profiled(capture.profile, callback(update, context))
+            finally:
+                capture.active = False
+                capture.remaining -= 1
+                if capture.remaining <= 0 and self.captures.pop(command, None) is capture:
+                    capture.finish()
+                    self.finished.append(capture)
+        return wrapped
+
+    # لقطات الذاكرة
+
+    def memory_snapshot(self) -> List[str]:
+        """أخذ لقطة tracemalloc ومقارنتها بالسابقة"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(config.TRACEMALLOC_FRAMES)
+            self._last_snapshot = tracemalloc.take_snapshot()
+            return []
+        snapshot = tracemalloc.take_snapshot()
+        previous, self._last_snapshot = self._last_snapshot, snapshot
+        snapshot.dump(_output_path("memory") + ".tracemalloc")
+        if previous is None:
+            return [str(stat) for stat in snapshot.statistics("lineno")[:SUMMARY_LINES]]
+        return [str(stat) for stat in snapshot.compare_to(previous, "lineno")[:SUMMARY_LINES]]
+
+    def stop_memory(self) -> None:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._last_snapshot = None
+
+    # كشف الاستدعاءات البطيئة
+
+    def enable_slow_callbacks(self, threshold: float) -> None:
+        if not math.isfinite(threshold) or threshold <= 0:
+            raise ValueError("حد الاستدعاء البطيء يجب أن يكون رقماً موجباً")
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = threshold
+        if self.slow_callbacks is None:
+            self.slow_callbacks = SlowCallbackCollector()
+            logging.getLogger("asyncio").addHandler(self.slow_callbacks)
+
+    def disable_slow_callbacks(self) -> None:
+        asyncio.get_running_loop().set_debug(False)
+        if self.slow_callbacks is not None:
+            logging.getLogger("asyncio").removeHandler(self.slow_callbacks)
+            self.slow_callbacks = None
+
+    def stop_all(self) -> Optional[str]:
+        path = self.stop_sampling()
+        self.stop_memory()
+        self.disable_slow_callbacks()
+        self.captures.clear()
+        return path
+
+    def status(self) -> List[str]:
+        lines = [
+            f"• أخذ العينات: {'يعمل' if self.sampler.running else 'متوقف'} ({self.sampler.samples} عينة)",
+            f"• تتبع الذاكرة: {'يعمل' if tracemalloc.is_tracing() else 'متوقف'}",
+            f"• كشف البطء: {'يعمل' if self.slow_callbacks else 'متوقف'}",
+        ]
+        for command, capture in self.captures.items():
+            lines.append(f"• التقاط /{command}: متبقي {capture.remaining}")
+        for capture in self.finished[-3:]:
+            lines.append(f"• ملف /{capture.command}: {capture.path}")
+        if self.slow_callbacks and self.slow_callbacks.records:
+            lines.append("• آخر الاستدعاءات البطيئة:")
+            lines.extend(f"  {record[:200]}" for record in list(self.slow_callbacks.records)[-5:])
+        return lines
+
+
+profiler = Profiler()
+
+
+def install_handler_hooks(application: Application) -> None:
+    """تغليف معالجات الأوامر حتى يمكن التقاط cProfile لأي أمر عند الطلب"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, CommandHandler):
+                for command in handler.commands:
+                    handler.callback = profiler.wrap(command, handler.callback)
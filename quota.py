@@ -0,0 +1,162 @@
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import select, update
+
+from database import get_db, Group
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or config.TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(config.TIMEZONE)
+
+
+def is_valid_timezone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+class MentionQuota:
+    """عدادات الإشارات اليومية في الذاكرة مع إعادة تعيين كسولة حسب يوم كل مجموعة"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        # group_id -> [مفتاح اليوم, العدد, وقت آخر إشارة]
+        self._counters: Dict[int, List] = {}
+        self._zones: Dict[int, ZoneInfo] = {}
+        self._dirty: set = set()
+
+    def _today(self, group_id: int) -> int:
+        zone = self._zones.get(group_id) or _zone(None)
+        return datetime.now(zone).date().toordinal()
+
+    def _load(self, group_id: int) -> Tuple[List, ZoneInfo]:
+        """قراءة العداد والمنطقة الزمنية من قاعدة البيانات؛ تُستدعى خارج القفل"""
+        row = None
+        try:
+            with get_db() as db:
+                row = db.execute(
+                    select(Group.mention_count_today, Group.last_mention_date, Group.settings)
+                    .where(Group.group_id == group_id)
+                ).first()
+        except Exception as e:
+            logger.error(f"فشل في تحميل عداد الإشارات للمجموعة {group_id}: {e}")
+
+        settings = (row.settings if row else None) or {}
+        zone = _zone(settings.get("timezone"))
+        today = datetime.now(zone).date().toordinal()
+        if row and row.last_mention_date:
+            last = row.last_mention_date.replace(tzinfo=timezone.utc).astimezone(zone)
+            if last.date().toordinal() == today:
+                return [today, row.mention_count_today or 0, row.last_mention_date], zone
+        return [today, 0, None], zone
+
+    def _ensure_loaded(self, group_id: int) -> None:
+        """تحميل العداد عند أول استخدام للمجموعة فقط، دون حجز القفل أثناء الاستعلام"""
+        if group_id in self._counters:
+            return
+        entry, zone = self._load(group_id)
+        with self._lock:
+            # قد يسبقنا خيط آخر إلى التحميل، فتبقى قيمته
+            self._zones.setdefault(group_id, zone)
+            self._counters.setdefault(group_id, entry)
+
+    def _entry(self, group_id: int) -> List:
+        entry = self._counters[group_id]
+        today = self._today(group_id)
+        if entry[0] != today:
+            entry[0], entry[1] = today, 0
+        return entry
+
+    def set_timezone(self, group_id: int, tz_name: Optional[str]) -> None:
+        """تحديث المنطقة الزمنية المستخدمة لحساب يوم المجموعة
+
+        عداد اليوم الجاري ينتقل إلى تاريخ المنطقة الجديدة بعدده، فتبديل المنطقة
+        بين تاريخين مختلفين لا يصفّر الحصة.
+        """
+        self._ensure_loaded(group_id)
+        with self._lock:
+            entry = self._entry(group_id)
+            self._zones[group_id] = _zone(tz_name)
+            entry[0] = self._today(group_id)
+
+    def count(self, group_id: int) -> int:
+        self._ensure_loaded(group_id)
+        with self._lock:
+            return self._entry(group_id)[1]
+
+    def try_acquire(self, group_id: int) -> Optional[int]:
+        """حجز إشارة من الحصة اليومية إن كانت متاحة؛ الفحص والحجز في خطوة واحدة
+
+        يُرجع يوم الحجز، أو None عند بلوغ الحد. تشغيلان متزامنان لا يتجاوزان الحد
+        معاً، والتشغيل الذي لا يرسل شيئاً يعيد الحجز بـ release مع نفس اليوم.
+        """
+        self._ensure_loaded(group_id)
+        with self._lock:
+            entry = self._entry(group_id)
+            if self.limit and entry[1] >= self.limit:
+                return None
+            entry[1] += 1
+            entry[2] = datetime.utcnow()
+            self._dirty.add(group_id)
+            return entry[0]
+
+    def release(self, group_id: int, day: int) -> None:
+        """إعادة حجز لم يُستخدم إلى حصة اليوم الذي حُجز فيه
+
+        حجز من يوم انتهى لا يُعاد، حتى لا يُنقص عداد يوم آخر.
+        """
+        with self._lock:
+            entry = self._counters.get(group_id)
+            if entry and entry[0] == day and entry[1] > 0:
+                entry[1] -= 1
+                self._dirty.add(group_id)
+
+    def flush(self) -> int:
+        """كتابة العدادات المعدلة فقط إلى قاعدة البيانات دفعة واحدة"""
+        with self._lock:
+            rows: List[Tuple[int, int, datetime]] = [
+                (group_id, self._counters[group_id][1], self._counters[group_id][2])
+                for group_id in self._dirty
+            ]
+            self._dirty.clear()
+        if not rows:
+            return 0
+
+        try:
+            with get_db() as db:
+                db.execute(
+                    update(Group),
+                    [
+                        {"group_id": group_id, "mention_count_today": count, "last_mention_date": last}
+                        for group_id, count, last in rows
+                    ],
+                )
+        except Exception as e:
+            logger.error(f"فشل في حفظ عدادات الإشارات: {e}")
+            with self._lock:
+                self._dirty.update(group_id for group_id, _, _ in rows)
+            return 0
+        return len(rows)
+
+
+mention_quota = MentionQuota(config.MAX_MENTIONS_PER_DAY)
+
+
+def flush_quota_counters() -> None:
+    """وظيفة الجدولة لحفظ العدادات دورياً"""
+    flushed = mention_quota.flush()
+    if flushed:
+        logger.debug(f"تم حفظ عدادات {flushed} مجموعة")
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from telegram import Bot
+from telegram.constants import ChatMemberStatus
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from outbound import Priority, priority
+from database import get_db, Member
+import config
+
+logger = logging.getLogger(__name__)
+
+DEPARTED_STATUSES = (ChatMemberStatus.LEFT, ChatMemberStatus.BANNED)
+
+_task: Optional[asyncio.Task] = None
+
+
+def _stale_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(hours=config.RECONCILE_STALE_AFTER)
+
+
+def _stale_filter():
+    return and_(
+        Member.is_active == True,
+        Member.is_bot == False,
+        or_(Member.last_verified == None, Member.last_verified < _stale_cutoff()),
+    )
+
+
+def get_stale_groups() -> List[int]:
+    """المجموعات التي تحتوي أعضاء بحاجة للتحقق، الأقدم تحققاً أولاً"""
+    try:
+        with get_db() as db:
+            oldest = func.min(func.coalesce(Member.last_verified, datetime(1970, 1, 1)))
+            rows = db.execute(
+                select(Member.group_id)
+                .where(_stale_filter())
+                .group_by(Member.group_id)
+                .order_by(oldest)
+            ).all()
+            return [row.group_id for row in rows]
+    except Exception as e:
+        logger.error(f"فشل في جلب المجموعات بحاجة للمطابقة: {e}")
+        return []
+
+
+def get_stale_members(group_id: int, after_id: int, limit: int) -> List[Tuple[int, int]]:
+    """دفعة من (id, user_id) للأعضاء غير المتحقق منهم بترتيب المفتاح"""
+    with get_db() as db:
+        rows = db.execute(
+            select(Member.id, Member.user_id)
+            .where(Member.group_id == group_id, Member.id > after_id, _stale_filter())
+            .order_by(Member.id)
+            .limit(limit)
+        ).all()
+        return [(row.id, row.user_id) for row in rows]
+
+
+def mark_members(present: List[int], departed: List[int]) -> None:
+    """تحديث نتائج الفحص بعبارتي UPDATE مجمعتين"""
+    now = datetime.utcnow()
+    with get_db() as db:
+        if present:
+            db.execute(update(Member).where(Member.id.in_(present)).values(last_verified=now))
+        if departed:
+            db.execute(
+                update(Member).where(Member.id.in_(departed)).values(is_active=False, last_verified=now)
+            )
+
+
+async def _probe(bot: Bot, semaphore: asyncio.Semaphore, chat_id: int, user_id: int) -> Optional[bool]:
+    """True إذا كان العضو موجوداً، False إذا غادر، None إذا تعذر التحديد"""
+    async with semaphore:
+        for _ in range(3):
+            try:
+                with priority(Priority.BACKGROUND):
+                    chat_member = await bot.get_chat_member(chat_id, user_id)
+                return chat_member.status not in DEPARTED_STATUSES
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                if "not found" in str(e).lower() or "participant_id_invalid" in str(e).lower():
+                    return False
+                logger.error(f"فشل في فحص العضو {user_id} في المجموعة {chat_id}: {e}")
+                return None
+            except TelegramError as e:
+                # خطأ شبكة أو وصول لعضو واحد لا يلغي نتائج بقية الدفعة
+                logger.warning(f"تعذر فحص العضو {user_id} في المجموعة {chat_id}: {e}")
+                return None
+        return None
+
+
+async def reconcile_group(bot: Bot, group_id: int) -> Tuple[int, int]:
+    """فحص أعضاء مجموعة واحدة على دفعات وإرجاع (عدد المفحوصين, عدد المغادرين)"""
+    semaphore = asyncio.Semaphore(config.RECONCILE_CONCURRENCY)
+    checked = departed_total = 0
+    after_id = 0
+
+    while True:
+        # استعلامات قاعدة البيانات في خيط منفصل حتى لا تتوقف حلقة الأحداث
+        batch = await asyncio.to_thread(get_stale_members, group_id, after_id, config.RECONCILE_BATCH_SIZE)
+        if not batch:
+            break
+        after_id = batch[-1][0]
+
+        results = await asyncio.gather(
+            *(_probe(bot, semaphore, group_id, user_id) for _, user_id in batch)
+        )
+        present = [member_id for (member_id, _), ok in zip(batch, results) if ok is True]
+        departed = [member_id for (member_id, _), ok in zip(batch, results) if ok is False]
+        await asyncio.to_thread(mark_members, present, departed)
+
+        checked += len(batch)
+        departed_total += len(departed)
+
+        # لم يُحسم أي فحص في الدفعة (البوت أُزيل أو الشبكة متوقفة): تُؤجل بقية المجموعة للجولة التالية
+        if not present and not departed:
+            logger.warning(f"إيقاف مطابقة المجموعة {group_id} مؤقتاً: تعذر فحص دفعة كاملة")
+            break
+
+    return checked, departed_total
+
+
+async def reconcile_rosters(bot: Bot) -> None:
+    """جولة مطابقة كاملة لجميع المجموعات حسب الأقدمية"""
+    for group_id in await asyncio.to_thread(get_stale_groups):
+        try:
+            checked, departed = await reconcile_group(bot, group_id)
+            if checked:
+                logger.info(f"مطابقة المجموعة {group_id}: فحص {checked} عضو، غادر {departed}")
+        except Exception as e:
+            logger.error(f"فشل في مطابقة المجموعة {group_id}: {e}")
+
+
+async def _run_forever(bot: Bot) -> None:
+    while True:
+        try:
+            await reconcile_rosters(bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"فشل في جولة مطابقة الأعضاء: {e}")
+        await asyncio.sleep(config.RECONCILE_INTERVAL)
+
+
+def start_reconciler(bot: Bot) -> None:
+    """بدء عامل المطابقة في الخلفية على حلقة الأحداث الحالية"""
+    global _task
+    if config.RECONCILE_ENABLED and _task is None:
+        _task = asyncio.get_running_loop().create_task(_run_forever(bot))
+
+
+async def stop_reconciler() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,263 @@
+import argparse
+import csv
+import gzip
+import json
+import logging
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, TextIO, Tuple
+
+from sqlalchemy import bindparam, column, func, select, table
+
+from database import engine, insert_or_ignore, upsert, Group, Member
+import config
+
+logger = logging.getLogger(__name__)
+
+# أعمدة ملف القائمة؛ user_id وحده إلزامي
+FIELDS = ("user_id", "username", "first_name", "last_name", "is_bot", "is_admin", "is_active", "last_seen")
+TEXT_FIELDS = ("username", "first_name", "last_name")
+# القيم الافتراضية للأعلام الغائبة عن الملف عند إضافة عضو جديد؛ العضو الموجود يحتفظ بقيمه
+FLAG_DEFAULTS = {"is_bot": False, "is_admin": False, "is_active": True}
+FLAG_FIELDS = tuple(FLAG_DEFAULTS)
+TRUE_VALUES = {"1", "true", "yes", "y", "t"}
+
+# (عدد الصفوف المستوردة، عدد الصفوف المرفوضة)
+Progress = Callable[[int, int], None]
+
+
+class ImportResult(NamedTuple):
+    imported: int
+    rejected: int
+    seconds: float
+
+
+def roster_format(path: str) -> str:
+    """تحديد صيغة الملف من امتداده مع تجاهل .gz"""
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    raise ValueError(f"صيغة ملف غير مدعومة: {path} (المدعوم: csv و jsonl)")
+
+
+def _open_text(path: str, mode: str) -> TextIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", compresslevel=6, encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _flag(value: Any) -> Optional[bool]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value[:100] or None
+
+
+def _timestamp(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def normalize(record: Dict[str, Any], group_id: int) -> Dict[str, Any]:
+    """تحويل سجل من الملف إلى صف جدول الأعضاء، ويرفع ValueError للسجلات غير الصالحة"""
+    user_id = int(record["user_id"])
+    if user_id <= 0:
+        raise ValueError(f"معرف مستخدم غير صالح: {user_id}")
+    username = _text(record.get("username"))
+    return {
+        "group_id": group_id,
+        "user_id": user_id,
+        "username": username.lstrip("@") if username else None,
+        "first_name": _text(record.get("first_name")),
+        "last_name": _text(record.get("last_name")),
+        "is_bot": _flag(record.get("is_bot")),
+        "is_admin": _flag(record.get("is_admin")),
+        "is_active": _flag(record.get("is_active")),
+        "last_seen": _timestamp(record.get("last_seen")),
+    }
+
+
+def read_records(stream: TextIO, fmt: str) -> Iterator[Dict[str, Any]]:
+    """قراءة السجلات سطراً بسطر دون تحميل الملف في الذاكرة"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        if not reader.fieldnames or "user_id" not in reader.fieldnames:
+            raise ValueError("ملف CSV يجب أن يحتوي على ترويسة بعمود user_id")
+        yield from reader
+        return
+    for line in stream:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # يُحسب كصف مرفوض عند التحويل
+                yield {}
+
+
+# نسخة من جدول الأعضاء بلا أنواع: القيم تُحول لصيغة قاعدة البيانات مرة واحدة لكل دفعة
+# بدلاً من تمرير كل صف عبر معالجات الأنواع في SQLAlchemy، وهي أغلب تكلفة الاستيراد
+_members = table(Member.__tablename__, *(column(c.name) for c in Member.__table__.columns))
+# أعمدة بقيم افتراضية ثابتة لكل الصفوف الجديدة في الدفعة
+CONSTANT_FIELDS = ("joined_date", "created_at", "updated_at", "settings")
+
+
+def _bind_processors() -> Dict[str, Callable[[Any], Any]]:
+    processors = {}
+    for name in (*FLAG_FIELDS, "last_seen", *CONSTANT_FIELDS):
+        processor = Member.__table__.c[name].type.bind_processor(engine.dialect)
+        processors[name] = processor or (lambda value: value)
+    return processors
+
+
+def _upsert_statement():
+    # الاستيراد لا يمحو اسماً أو آخر ظهور معروفاً بقيمة فارغة، والعلم الغائب عن السجل
+    # يُدرج بقيمته الافتراضية لكنه لا يغير قيمة عضو موجود (المعامل {علم}_update فارغ)
+    return upsert(
+        _members,
+        ("group_id", "user_id"),
+        keep_existing=(*TEXT_FIELDS, "last_seen"),
+        overwrite=("updated_at",),
+        expressions={
+            name: func.coalesce(bindparam(f"{name}_update"), _members.c[name]) for name in FLAG_FIELDS
+        },
+    )
+
+
+def import_members(group_id: int, records: Iterable[Dict[str, Any]], progress: Optional[Progress] = None,
+                   batch_size: Optional[int] = None) -> ImportResult:
+    """استيراد الأعضاء على دفعات؛ كل دفعة عبارة upsert واحدة في معاملة واحدة"""
+    batch_size = batch_size or config.MEMBER_IMPORT_BATCH
+    started = time.perf_counter()
+    stmt = _upsert_statement()
+    processors = _bind_processors()
+    imported = rejected = 0
+
+    with engine.begin() as conn:
+        insert_or_ignore(conn, Group, group_id=group_id)
+
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        # Postgres يرفض تكرار المعرف داخل عبارة ON CONFLICT واحدة، فتُدمج التكرارات أولاً
+        rows: Dict[int, Dict[str, Any]] = {}
+        now = datetime.utcnow()
+        constants = {name: processors[name](now) for name in ("joined_date", "created_at", "updated_at")}
+        constants["settings"] = processors["settings"]({})
+        for record in chunk:
+            try:
+                row = normalize(record, group_id)
+            except (KeyError, TypeError, ValueError):
+                rejected += 1
+                continue
+            for name, default in FLAG_DEFAULTS.items():
+                value = row[name]
+                row[f"{name}_update"] = processors[name](value)
+                row[name] = processors[name](default if value is None else value)
+            row["last_seen"] = processors["last_seen"](row["last_seen"])
+            row.update(constants)
+            previous = rows.get(row["user_id"])
+            if previous is not None:
+                # نفس منطق upsert: القيم الفارغة لا تمحو ما سبقها في الملف
+                for name in (*TEXT_FIELDS, "last_seen", *(f"{flag}_update" for flag in FLAG_FIELDS)):
+                    if row[name] is None:
+                        row[name] = previous[name]
+                for flag in FLAG_FIELDS:
+                    if row[f"{flag}_update"] is not None:
+                        row[flag] = row[f"{flag}_update"]
+            rows[row["user_id"]] = row
+        if rows:
+            with engine.begin() as conn:
+                conn.execute(stmt, list(rows.values()))
+            imported += len(rows)
+        if progress:
+            progress(imported, rejected)
+
+    return ImportResult(imported, rejected, time.perf_counter() - started)
+
+
+def import_file(group_id: int, path: str, progress: Optional[Progress] = None) -> ImportResult:
+    fmt = roster_format(path)
+    with _open_text(path, "r") as stream:
+        result = import_members(group_id, read_records(stream, fmt), progress)
+    logger.info(
+        f"تم استيراد {result.imported} عضو للمجموعة {group_id} "
+        f"({result.rejected} مرفوض) في {result.seconds:.1f} ثانية"
+    )
+    return result
+
+
+def _export_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_roster(group_id: int) -> Iterator[Tuple[Any, ...]]:
+    """قراءة قائمة أعضاء المجموعة بالتدفق من المؤشر"""
+    columns = [getattr(Member, name) for name in FIELDS]
+    query = select(*columns).where(Member.group_id == group_id).order_by(Member.id)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=config.MEMBER_STREAM_BATCH).execute(query)
+        for row in result:
+            yield tuple(row)
+
+
+def export_members(group_id: int, out: TextIO, fmt: str) -> int:
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        for row in iter_roster(group_id):
+            writer.writerow([_export_value(value) if value is not None else "" for value in row])
+            count += 1
+    else:
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        for row in iter_roster(group_id):
+            out.write(encode({name: _export_value(value) for name, value in zip(FIELDS, row)}) + "\n")
+            count += 1
+    return count
+
+
+def export_file(group_id: int, path: str) -> int:
+    with _open_text(path, "w") as out:
+        return export_members(group_id, out, roster_format(path))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="استيراد وتصدير قوائم أعضاء المجموعات")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="استيراد قائمة أعضاء من CSV أو JSONL (يدعم .gz)")
+    import_parser.add_argument("group", type=int)
+    import_parser.add_argument("path")
+    export_parser = subparsers.add_parser("export", help="تصدير قائمة أعضاء مجموعة إلى CSV أو JSONL")
+    export_parser.add_argument("group", type=int)
+    export_parser.add_argument("path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL))
+    if args.command == "import":
+        def report(imported: int, rejected: int) -> None:
+            logger.info(f"تقدم الاستيراد: {imported} عضو، {rejected} مرفوض")
+        result = import_file(args.group, args.path, report)._asdict()
+    else:
+        result = {"path": args.path, "members": export_file(args.group, args.path)}
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
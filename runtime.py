@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import signal
+import threading
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from dotenv import dotenv_values, find_dotenv
+
+from audit import log_activity
+from budget import api_budget
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Knob(NamedTuple):
+    """إعداد قابل للتعديل أثناء التشغيل مع نوعه وحدوده المسموحة"""
+    type: type
+    minimum: float
+    maximum: float
+
+
+KNOBS: Dict[str, Knob] = {
+    "DEFAULT_BATCH_SIZE": Knob(int, 1, 50),
+    "MENTION_DELAY": Knob(float, 0.0, 60.0),
+    "RATE_LIMIT_PER_USER": Knob(int, 1, 1000),
+    "RATE_LIMIT_PER_GROUP": Knob(int, 1, 10000),
+    "CACHE_TIMEOUT": Knob(int, 0, 86400),
+    "API_BUDGET_PER_SECOND": Knob(float, 0.1, 100.0),
+    "API_BUDGET_BURST": Knob(float, 1.0, 1000.0),
+}
+
+
+class RuntimeConfig(NamedTuple):
+    """لقطة غير قابلة للتعديل من إعدادات الأداء؛ التغيير يستبدل اللقطة كاملة"""
+    DEFAULT_BATCH_SIZE: int
+    MENTION_DELAY: float
+    RATE_LIMIT_PER_USER: int
+    RATE_LIMIT_PER_GROUP: int
+    CACHE_TIMEOUT: int
+    API_BUDGET_PER_SECOND: float
+    API_BUDGET_BURST: float
+
+
+def parse_value(name: str, raw) -> float:
+    """تحويل قيمة نصية إلى نوع الإعداد والتحقق من حدوده"""
+    knob = KNOBS.get(name)
+    if knob is None:
+        raise ValueError(f"إعداد غير معروف: {name}")
+    try:
+        value = knob.type(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"قيمة غير صالحة لـ {name}: {raw!r}")
+    if not knob.minimum <= value <= knob.maximum:
+        raise ValueError(f"{name} يجب أن يكون بين {knob.minimum:g} و {knob.maximum:g}")
+    return value
+
+
+Listener = Callable[[RuntimeConfig, RuntimeConfig], None]
+
+
+class LiveConfig:
+    """إعدادات الأداء الحالية مع إمكانية استبدالها دون إعادة التشغيل
+
+    القراء يأخذون `current` ويقرؤون منها، فإما أن يروا اللقطة القديمة كاملة
+    أو الجديدة كاملة. المستمعون (مثل ميزانية API) يُبلغون بعد الاستبدال مباشرة.
+    التغييرات لا تُحفظ؛ إعادة التشغيل تعود لقيم البيئة.
+    """
+
+    def __init__(self, initial: RuntimeConfig):
+        self._current = initial
+        self._lock = threading.Lock()
+        self._listeners: List[Listener] = []
+
+    @property
+    def current(self) -> RuntimeConfig:
+        return self._current
+
+    def subscribe(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    def update(self, changes: Mapping[str, object]) -> Dict[str, Tuple[float, float]]:
+        """التحقق من جميع القيم أولاً ثم تطبيقها معاً، وإرجاع ما تغير فعلاً"""
+        parsed = {name: parse_value(name, raw) for name, raw in changes.items()}
+        with self._lock:
+            old = self._current
+            diff = {name: (getattr(old, name), value) for name, value in parsed.items() if getattr(old, name) != value}
+            if not diff:
+                return {}
+            new = old._replace(**{name: value for name, (_, value) in diff.items()})
+            self._current = new
+            for listener in self._listeners:
+                try:
+                    listener(old, new)
+                except Exception as e:
+                    logger.error(f"فشل في تطبيق الإعدادات الجديدة على {listener.__name__}: {e}")
+        return diff
+
+
+runtime_config = LiveConfig(RuntimeConfig(**{name: getattr(config, name) for name in KNOBS}))
+
+
+def _resize_api_budget(old: RuntimeConfig, new: RuntimeConfig) -> None:
+    if (old.API_BUDGET_PER_SECOND, old.API_BUDGET_BURST) != (new.API_BUDGET_PER_SECOND, new.API_BUDGET_BURST):
+        api_budget.configure(new.API_BUDGET_PER_SECOND, new.API_BUDGET_BURST)
+
+
+runtime_config.subscribe(_resize_api_budget)
+
+
+async def apply_changes(changes: Mapping[str, object], user_id: int = 0, chat_id: int = 0,
+                        source: str = "command") -> Dict[str, Tuple[float, float]]:
+    """تطبيق التغييرات وتسجيل كل تغيير في سجل النشاط؛ القيم غير الصالحة تُسجل كمحاولة فاشلة"""
+    try:
+        diff = runtime_config.update(changes)
+    except ValueError as e:
+        await log_activity(user_id, chat_id, "config_change", {"source": source, "changes": dict(changes)}, False, str(e))
+        raise
+    for name, (old, new) in diff.items():
+        logger.info(f"تم تغيير {name} من {old} إلى {new} ({source})")
+        await log_activity(user_id, chat_id, "config_change", {"source": source, "key": name, "old": old, "new": new})
+    return diff
+
+
+def read_environment(path: Optional[str] = None) -> Dict[str, str]:
+    """قيم الإعدادات من ملف .env ثم متغيرات بيئة العملية التي تتقدم عليه كما عند البدء
+
+    متغيرات بيئة العملية لا تتغير بعد بدئها، فالملف هو مصدر التعديل عند إعادة التحميل
+    لكل إعداد غير معرف في البيئة.
+    """
+    values: Dict[str, str] = {}
+    path = path or find_dotenv(usecwd=True)
+    if path:
+        values.update({name: value for name, value in dotenv_values(path).items()
+                       if name in KNOBS and value is not None})
+    values.update({name: os.environ[name] for name in KNOBS
+                   if name in config.PROCESS_ENV_KEYS and name in os.environ})
+    return values
+
+
+async def reload_from_environment(user_id: int = 0, chat_id: int = 0, source: str = "sighup") -> Dict[str, Tuple[float, float]]:
+    return await apply_changes(read_environment(), user_id, chat_id, source)
+
+
+async def _reload_on_signal() -> None:
+    try:
+        diff = await reload_from_environment()
+        logger.info(f"إعادة تحميل الإعدادات: {len(diff)} تغيير")
+    except ValueError as e:
+        logger.error(f"رفض إعادة تحميل الإعدادات: {e}")
+
+
+def install_reload_signal(loop: asyncio.AbstractEventLoop) -> bool:
+    """إعادة تحميل الإعدادات عند استقبال SIGHUP (غير متاح على Windows)"""
+    if not hasattr(signal, "SIGHUP"):
+        return False
+    loop.add_signal_handler(signal.SIGHUP, lambda: loop.create_task(_reload_on_signal()))
+    return True
@@ -1,96 +1,210 @@
+import asyncio
 import logging
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime, time
-from typing import Dict, Any
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import date, datetime, time
+from typing import Dict, Any, Optional, Set
+from zoneinfo import ZoneInfo
+from telegram import Bot
+
+from sqlalchemy import select
 
 from database import get_db, Group, Member, log_mention
-from utils import get_chat_members_safe, mention_all_members
+from utils import mention_all_members
+from backup import scheduled_backup
+from quota import mention_quota, flush_quota_counters
+from persistence import flush_persistence
+from idempotency import run_ledger, flush_update_watermark, prune_run_ledger
+from tags import refresh_rule_tags
+from audit import flush_audit_log, archive_audit_log
+from cleanup import scheduled_cleanup
+from planner import estimate_run, spread_offsets
 import config
 
 logger = logging.getLogger(__name__)
-scheduler = BackgroundScheduler(timezone=config.TIMEZONE)
+scheduler = AsyncIOScheduler(timezone=config.TIMEZONE)
+
+# مراجع التشغيلات الجارية حتى لا تُجمع قبل انتهائها
+_running_runs: Set[asyncio.Task] = set()
+
+async def _run_scheduled(bot: Bot, group_id: int, run_key, reservation: int, delay: float):
+    """تنفيذ تشغيل مجدول واحد بعد التأخير المخصص له"""
+    if delay:
+        await asyncio.sleep(delay)
+    try:
+        # إرسال الإشارات أثناء قراءة الأعضاء
+        mentioned_count, successful_batches = await mention_all_members(bot, group_id)
+        run_ledger.finish(run_key, mentioned_count, success=bool(mentioned_count))
+        
+        if not mentioned_count:
+            mention_quota.release(group_id, reservation)
+            return
+        
+        # تسجيل العملية
+        log_mention(group_id, 0, "scheduled", mentioned_count, [])
+        
+        logger.info(f"تم ذكر {mentioned_count} عضو في المجموعة {group_id}")
+    except Exception as e:
+        logger.error(f"فشل في الذكر التلقائي للمجموعة {group_id}: {e}")
+        run_ledger.finish(run_key, 0, success=False)
+        mention_quota.release(group_id, reservation)
+
+def is_scheduled_day(settings: Dict[str, Any], today: date) -> bool:
+    """هل يوافق اليوم إعدادات الجدولة: التفعيل وأيام الأسبوع والتكرار كل عدة أيام"""
+    if not settings.get("scheduling_enabled", True):
+        return False
+    
+    # التحقق من أيام الأسبوع المحددة
+    mention_days = settings.get("mention_days")
+    if mention_days and today.weekday() not in mention_days:
+        return False
+    
+    # التكرار كل N يوم يُحسب من يوم اختيار الإعداد
+    every_days = settings.get("mention_every_days") or 1
+    since = settings.get("mention_every_days_since")
+    if every_days > 1 and since:
+        return (today - date.fromisoformat(since)).days % every_days == 0
+    return True
 
-async def scheduled_mention_all():
+async def scheduled_mention_all(bot: Bot):
     """وظيفة جدولة الذكر التلقائي"""
     try:
-        now = datetime.now().time()
-        current_time = now.strftime("%H:%M")
-        current_weekday = datetime.now().weekday()
+        now = datetime.now(ZoneInfo(config.TIMEZONE))
         
+        # أعمدة فقط: الكائنات لا تُقرأ بعد إغلاق الجلسة
         with get_db() as db:
-            groups = db.query(Group).filter(
-                Group.is_active == True,
-                Group.mention_time == current_time
+            groups = db.execute(
+                select(Group.group_id, Group.settings).where(
+                    Group.is_active == True,
+                    Group.mention_hour == now.hour,
+                    Group.mention_minute == now.minute
+                )
             ).all()
         
+        claimed = []
         for group in groups:
             try:
-                # التحقق من أيام الأسبوع المحددة
-                if group.mention_days and current_weekday not in group.mention_days:
+                if not is_scheduled_day(group.settings or {}, now.date()):
                     continue
                 
-                # التحقق من الحد اليومي للإشارات
-                if not group.can_mention_today():
+                # حجز إشارة من الحد اليومي
+                reservation = mention_quota.try_acquire(group.group_id)
+                if reservation is None:
                     logger.info(f"تخطي مجموعة {group.group_id} - تجاوز الحد اليومي")
                     continue
                 
-                # جلب الأعضاء
-                members = await get_chat_members_safe(None, group.group_id)
-                
-                if not members:
+                # منع التكرار عند تشغيل أكثر من نسخة من البوت أو إعادة تشغيل المهمة
+                run_key = run_ledger.claim(group.group_id, "scheduled", now)
+                if run_key is None:
+                    mention_quota.release(group.group_id, reservation)
                     continue
                 
-                # إرسال الإشارات
-                mentioned_count, successful_batches = await mention_all_members(None, group.group_id, members)
-                
-                # تسجيل العملية
-                mentioned_ids = [member["id"] for member in members[:mentioned_count]]
-                await log_mention(
-                    group.group_id, 0, "scheduled", "all", 
-                    mentioned_count, mentioned_ids, 
-                    "ذكر تلقائي"
-                )
-                
-                logger.info(f"تم ذكر {mentioned_count} عضو في المجموعة {group.group_id}")
+                claimed.append((group.group_id, run_key, reservation, estimate_run(group.group_id)))
                 
             except Exception as e:
                 logger.error(f"فشل في الذكر التلقائي للمجموعة {group.group_id}: {e}")
                 continue
+        
+        # توزيع التشغيلات على مسارات محدودة حتى لا تتكدس المجموعات الكبيرة في نفس الدقيقة
+        offsets = spread_offsets([(group_id, plan) for group_id, _, _, plan in claimed], config.SCHEDULED_RUN_LANES)
+        for group_id, run_key, reservation, plan in claimed:
+            if offsets[group_id]:
+                logger.info(f"تأجيل الذكر التلقائي للمجموعة {group_id} {offsets[group_id]:.0f} ثانية "
+                            f"({plan.messages} رسالة متوقعة)")
+            task = asyncio.create_task(_run_scheduled(bot, group_id, run_key, reservation, offsets[group_id]))
+            _running_runs.add(task)
+            task.add_done_callback(_running_runs.discard)
                 
     except Exception as e:
         logger.error(f"فشل في الذكر التلقائي: {e}")
 
-def setup_scheduler():
+def setup_scheduler(bot: Bot):
     """إعداد الجدولة"""
     try:
         # جدولة الذكر التلقائي كل دقيقة للتحقق من المواعيد
         scheduler.add_job(
             scheduled_mention_all,
             trigger=CronTrigger(minute="*"),
+            args=[bot],
             id="scheduled_mention_all",
             replace_existing=True
         )
         
-        # إعادة تعيين العدادات اليومية في منتصف الليل
+        # حفظ عدادات الإشارات اليومية دورياً (تُعاد تهيئتها كسولاً عند تغير اليوم)
+        scheduler.add_job(
+            flush_quota_counters,
+            trigger=IntervalTrigger(seconds=config.QUOTA_FLUSH_INTERVAL),
+            id="flush_quota_counters",
+            replace_existing=True
+        )
+        
+        # كتابة بيانات المحادثات المعدلة دفعة واحدة
+        scheduler.add_job(
+            flush_persistence,
+            trigger=IntervalTrigger(seconds=config.PERSISTENCE_FLUSH_INTERVAL),
+            id="flush_persistence",
+            replace_existing=True
+        )
+        
+        # حفظ الحد الأعلى لمعرفات التحديثات المعالجة
         scheduler.add_job(
-            reset_daily_counters,
-            trigger=CronTrigger(hour=0, minute=0),
-            id="reset_daily_counters",
+            flush_update_watermark,
+            trigger=IntervalTrigger(seconds=config.PERSISTENCE_FLUSH_INTERVAL),
+            id="flush_update_watermark",
             replace_existing=True
         )
         
+        # حذف سجلات تشغيل الإشارة القديمة
+        scheduler.add_job(
+            prune_run_ledger,
+            trigger=IntervalTrigger(hours=6),
+            id="prune_run_ledger",
+            replace_existing=True
+        )
+        
+        # إعادة حساب الوسوم المبنية على قواعد مثل active:7
+        scheduler.add_job(
+            refresh_rule_tags,
+            trigger=IntervalTrigger(seconds=config.TAG_REFRESH_INTERVAL),
+            id="refresh_rule_tags",
+            replace_existing=True
+        )
+        
+        # كتابة سجل النشاط على دفعات وأرشفة الأجزاء القديمة يومياً
+        scheduler.add_job(
+            flush_audit_log,
+            trigger=IntervalTrigger(seconds=config.AUDIT_FLUSH_INTERVAL),
+            id="flush_audit_log",
+            replace_existing=True
+        )
+        scheduler.add_job(
+            archive_audit_log,
+            trigger=CronTrigger(hour=3, minute=30),
+            id="archive_audit_log",
+            replace_existing=True
+        )
+        
+        # حذف رسائل الإشارة المنتهية مهلتها بطلبات deleteMessages مجمعة
+        scheduler.add_job(
+            scheduled_cleanup,
+            trigger=IntervalTrigger(seconds=config.CLEANUP_INTERVAL),
+            args=[bot],
+            id="scheduled_cleanup",
+            replace_existing=True
+        )
+        
+        # النسخ الاحتياطي الدوري لقاعدة البيانات
+        if config.BACKUP_ENABLED:
+            scheduler.add_job(
+                scheduled_backup,
+                trigger=IntervalTrigger(hours=config.BACKUP_INTERVAL),
+                id="scheduled_backup",
+                replace_existing=True
+            )
+        
         scheduler.start()
         logger.info("تم بدء خدمة الجدولة")
         
     except Exception as e:
         logger.error(f"فشل في إعداد الجدولة: {e}")
-
-def reset_daily_counters():
-    """إعادة تعيين عدادات الإشارات اليومية"""
-    try:
-        with get_db() as db:
-            db.query(Group).update({Group.mention_count_today: 0})
-        logger.info("تم إعادة تعيين العدادات اليومية")
-    except Exception as e:
-        logger.error(f"فشل في إعادة تعيين العدادات: {e}")
\ No newline at end of file
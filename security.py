@@ -4,7 +4,10 @@ from telegram import Update
 from telegram.ext import ContextTypes
 import logging
 
-from database import check_rate_limit, log_activity
+from audit import log_activity
+from i18n import catalog, translator
+from runtime import runtime_config
+from state import check_rate_limit
 from utils import is_user_group_admin
 import config
 
@@ -15,7 +18,7 @@ def admin_required(func: Callable[[Update, ContextTypes], Coroutine[Any, Any, No
     @wraps(func)
     async def wrapped(update: Update, context: ContextTypes, *args, **kwargs):
         if not update.effective_chat or not update.effective_user:
-            await update.message.reply_text("❌ هذا الأمر متاح فقط في المجموعات.")
+            await update.message.reply_text(catalog(None)("error.groups_only"))
             return
         
         user_id = update.effective_user.id
@@ -24,7 +27,8 @@ def admin_required(func: Callable[[Update, ContextTypes], Coroutine[Any, Any, No
         # التحقق من أن المستخدم مشرف في المجموعة
         is_admin = await is_user_group_admin(context.bot, chat_id, user_id)
         if not is_admin and user_id not in config.ADMIN_IDS:
-            await update.message.reply_text("❌ تحتاج إلى صلاحية المشرف لاستخدام هذا الأمر.")
+            t = await translator(chat_id)
+            await update.message.reply_text(t("error.admin_required"))
             await log_activity(user_id, chat_id, func.__name__, {}, False, "ليس مشرفاً")
             return
         
@@ -35,6 +39,20 @@ def admin_required(func: Callable[[Update, ContextTypes], Coroutine[Any, Any, No
     
     return wrapped
 
+def bot_admin_required(func: Callable[[Update, ContextTypes], Coroutine[Any, Any, None]]):
+    """ديكوراتور لقصر الأمر على مسؤولي البوت المحددين في ADMIN_IDS"""
+    @wraps(func)
+    async def wrapped(update: Update, context: ContextTypes, *args, **kwargs):
+        if not update.effective_user or update.effective_user.id not in config.ADMIN_IDS:
+            if update.message:
+                t = await translator(update.effective_chat.id if update.effective_chat else None)
+                await update.message.reply_text(t("error.bot_admins_only"))
+            return
+        
+        return await func(update, context, *args, **kwargs)
+    
+    return wrapped
+
 def rate_limit(limit_type: str = "user"):
     """ديكوراتور للتحكم في معدل الاستخدام"""
     def decorator(func: Callable[[Update, ContextTypes], Coroutine[Any, Any, None]]):
@@ -49,14 +67,14 @@ def rate_limit(limit_type: str = "user"):
             
             # التحقق من معدل الاستخدام
             if limit_type == "user":
-                allowed = check_rate_limit(user_id, chat_id, command_name)
-                limit = config.RATE_LIMIT_PER_USER
+                limit = runtime_config.current.RATE_LIMIT_PER_USER
+                allowed = await check_rate_limit(user_id, chat_id, command_name, limit)
             else:
-                allowed = check_rate_limit(0, chat_id, f"group_{command_name}")
-                limit = config.RATE_LIMIT_PER_GROUP
+                limit = runtime_config.current.RATE_LIMIT_PER_GROUP
+                allowed = await check_rate_limit(0, chat_id, f"group_{command_name}", limit)
             
             if not allowed:
-                message = f"❌ لقد تجاوزت الحد المسموح ({limit} في الدقيقة). يرجى الانتظار قليلاً."
+                message = (await translator(chat_id))("error.rate_limited", limit=limit)
                 if update.callback_query:
                     await update.callback_query.answer(message, show_alert=True)
                 else:
@@ -0,0 +1,144 @@
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MBSNAP"
+VERSION = 1
+# MAGIC، الإصدار، وقت الإنشاء، عدد السجلات، طول البيانات، CRC32 للبيانات
+HEADER = struct.Struct("<6sHdIQI")
+# طول المفتاح، علامة الضغط، وقت الانتهاء (0 بلا مهلة)، طول القيمة
+RECORD = struct.Struct("<HBdI")
+COMPRESS_ABOVE = 1024
+
+# (القيمة، وقت الانتهاء بساعة النظام أو None)
+Entry = Tuple[str, Optional[float]]
+
+
+class SnapshotError(Exception):
+    """ملف لقطة تالف أو بإصدار غير مدعوم"""
+
+
+def write_snapshot(path: str, entries: Iterable[Tuple[str, str, Optional[float]]]) -> int:
+    """كتابة مفاتيح الحالة إلى ملف ثنائي مع ترويسة إصدار ومجموع تحقق
+
+    الكتابة إلى ملف مؤقت ثم استبداله حتى لا تبقى لقطة نصف مكتوبة عند الانهيار.
+    """
+    body = bytearray()
+    count = 0
+    for key, value, expires_at in entries:
+        raw_key = key.encode("utf-8")
+        raw_value = value.encode("utf-8")
+        compressed = len(raw_value) > COMPRESS_ABOVE
+        if compressed:
+            raw_value = zlib.compress(raw_value, 1)
+        body += RECORD.pack(len(raw_key), compressed, expires_at or 0.0, len(raw_value))
+        body += raw_key
+        body += raw_value
+        count += 1
+
+    header = HEADER.pack(MAGIC, VERSION, time.time(), count, len(body), zlib.crc32(body))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(header)
+        out.write(body)
+    os.replace(tmp_path, path)
+    return count
+
+
+class Snapshot:
+    """لقطة محملة بـ mmap: تُقرأ ترويسات السجلات فقط عند الفتح وتُفك القيم عند أول طلب"""
+
+    def __init__(self, path: str, max_age: float):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SnapshotError("ملف اللقطة فارغ")
+        try:
+            self.created_at = self._check_header(max_age)
+            self._index = self._build_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _check_header(self, max_age: float) -> float:
+        if len(self._map) < HEADER.size:
+            raise SnapshotError("ملف اللقطة أقصر من الترويسة")
+        magic, version, created_at, self._count, length, checksum = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"إصدار لقطة غير مدعوم: {magic!r} v{version}")
+        if len(self._map) != HEADER.size + length:
+            raise SnapshotError("طول اللقطة لا يطابق الترويسة")
+        if zlib.crc32(memoryview(self._map)[HEADER.size:]) != checksum:
+            raise SnapshotError("مجموع التحقق للقطة غير صحيح")
+        if time.time() - created_at > max_age:
+            raise SnapshotError(f"اللقطة قديمة ({time.time() - created_at:.0f} ثانية)")
+        return created_at
+
+    def _build_index(self) -> Dict[str, Tuple[int, int, bool, Optional[float]]]:
+        index = {}
+        now = time.time()
+        offset = HEADER.size
+        for _ in range(self._count):
+            key_length, compressed, expires_at, value_length = RECORD.unpack_from(self._map, offset)
+            offset += RECORD.size
+            key = self._map[offset:offset + key_length].decode("utf-8")
+            offset += key_length
+            if not expires_at or expires_at > now:
+                index[key] = (offset, value_length, bool(compressed), expires_at or None)
+            offset += value_length
+        return index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _decode(self, offset: int, length: int, compressed: bool) -> str:
+        raw = self._map[offset:offset + length]
+        return (zlib.decompress(raw) if compressed else raw).decode("utf-8")
+
+    def take(self, key: str) -> Optional[Entry]:
+        """إخراج قيمة من اللقطة مرة واحدة، أو None إن لم توجد أو انتهت مهلتها"""
+        location = self._index.pop(key, None)
+        if location is None:
+            return None
+        offset, length, compressed, expires_at = location
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return self._decode(offset, length, compressed), expires_at
+
+    def discard(self, key: str) -> None:
+        self._index.pop(key, None)
+
+    def remaining(self) -> Iterator[Tuple[str, str, Optional[float]]]:
+        """القيم التي لم تُطلب بعد، لإعادة كتابتها في اللقطة التالية"""
+        now = time.time()
+        for key, (offset, length, compressed, expires_at) in list(self._index.items()):
+            if expires_at is None or expires_at > now:
+                yield key, self._decode(offset, length, compressed), expires_at
+
+    def close(self) -> None:
+        self._index = {}
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def open_snapshot(path: str, max_age: float) -> Optional[Snapshot]:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = Snapshot(path, max_age)
+    except (SnapshotError, OSError, struct.error, UnicodeDecodeError) as e:
+        logger.warning(f"تجاهل لقطة الحالة {path}: {e}")
+        return None
+    logger.info(f"تم تحميل لقطة الحالة: {len(snapshot)} مفتاح")
+    return snapshot
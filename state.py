@@ -0,0 +1,283 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from snapshot import Snapshot, open_snapshot, write_snapshot
+import config
+
+logger = logging.getLogger(__name__)
+
+class StateBackend:
+    """واجهة الحالة المشتركة بين نسخ البوت: عدادات ذرية ومفاتيح بمهلة
+
+    منع تكرار التشغيلات المجدولة بين النسخ يتم في سجل التشغيلات بقاعدة البيانات (idempotency).
+    """
+
+    async def incr_window(self, key: str, ttl: int) -> int:
+        """زيادة عداد نافذة زمنية ذرياً؛ تبدأ المهلة عند أول زيادة"""
+        raise NotImplementedError
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None, nx: bool = False) -> bool:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    def save_snapshot(self, path: str) -> int:
+        """حفظ الحالة لبدء دافئ بعد إعادة التشغيل؛ لا شيء للحالة المشتركة خارج العملية"""
+        return 0
+
+    def load_snapshot(self, path: str, max_age: float) -> int:
+        return 0
+
+
+class MemoryStateBackend(StateBackend):
+    """تنفيذ داخل الذاكرة لنسخة واحدة من البوت"""
+
+    def __init__(self, sweep_every: int = 1000):
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._writes = 0
+        self._sweep_every = sweep_every
+        self._snapshot: Optional[Snapshot] = None
+
+    def _alive(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is None:
+            entry = self._from_snapshot(key)
+            if entry is None:
+                return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def _from_snapshot(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        if self._snapshot is None:
+            return None
+        entry = self._snapshot.take(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        # أوقات الانتهاء في اللقطة بساعة النظام وتُحول إلى الساعة الرتيبة
+        expires = time.monotonic() + (expires_at - time.time()) if expires_at is not None else None
+        self._data[key] = (value, expires)
+        return self._data[key]
+
+    def _write(self, key: str, value: str, ttl: Optional[float]) -> None:
+        if self._snapshot is not None:
+            self._snapshot.discard(key)
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._writes += 1
+        if self._writes % self._sweep_every == 0:
+            now = time.monotonic()
+            for expired in [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]:
+                del self._data[expired]
+
+    async def incr_window(self, key: str, ttl: int) -> int:
+        entry = self._alive(key)
+        if entry is None:
+            self._write(key, "1", ttl)
+            return 1
+        value = int(entry[0]) + 1
+        self._data[key] = (str(value), entry[1])
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._alive(key)
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None, nx: bool = False) -> bool:
+        if nx and self._alive(key) is not None:
+            return False
+        self._write(key, value, ttl)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+        if self._snapshot is not None:
+            self._snapshot.discard(key)
+
+    def _entries(self) -> Iterator[Tuple[str, str, Optional[float]]]:
+        now, wall = time.monotonic(), time.time()
+        for key, (value, expires) in self._data.items():
+            if expires is None:
+                yield key, value, None
+            elif expires > now:
+                yield key, value, wall + (expires - now)
+        if self._snapshot is not None:
+            yield from self._snapshot.remaining()
+
+    def save_snapshot(self, path: str) -> int:
+        count = write_snapshot(path, self._entries())
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+        return count
+
+    def load_snapshot(self, path: str, max_age: float) -> int:
+        snapshot = open_snapshot(path, max_age)
+        if snapshot is None:
+            return 0
+        if self._snapshot is not None:
+            self._snapshot.close()
+        self._snapshot = snapshot
+        return len(snapshot)
+
+
+class RedisError(Exception):
+    """خطأ أعاده خادم Redis"""
+
+
+class RedisStateBackend(StateBackend):
+    """تنفيذ عبر بروتوكول Redis (RESP) باتصال واحد وأوامر مجمعة في رحلة واحدة"""
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _encode(args: Sequence[Any]) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("انقطع الاتصال بخادم Redis")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            return RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            count = int(payload)
+            if count < 0:
+                return None
+            return [await self._read_reply() for _ in range(count)]
+        raise RedisError(f"رد غير متوقع من Redis: {line!r}")
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            await self._send(setup)
+
+    async def _send(self, commands: List[Sequence[Any]]) -> List[Any]:
+        self._writer.write(b"".join(self._encode(command) for command in commands))
+        await self._writer.drain()
+        replies = [await asyncio.wait_for(self._read_reply(), self.timeout) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def pipeline(self, *commands: Sequence[Any]) -> List[Any]:
+        """إرسال عدة أوامر دفعة واحدة وقراءة ردودها في رحلة واحدة"""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._send(list(commands))
+                except (ConnectionError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    await self._reset()
+                    if attempt:
+                        raise
+
+    async def _reset(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def incr_window(self, key: str, ttl: int) -> int:
+        # SET NX يبدأ النافذة بمهلتها مرة واحدة، وINCR في نفس الرحلة
+        _, value = await self.pipeline(("SET", key, 0, "EX", ttl, "NX"), ("INCR", key))
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        (value,) = await self.pipeline(("GET", key))
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None, nx: bool = False) -> bool:
+        command: List[Any] = ["SET", key, value]
+        if ttl:
+            command += ["EX", ttl]
+        if nx:
+            command.append("NX")
+        (reply,) = await self.pipeline(command)
+        return reply == "OK"
+
+    async def delete(self, key: str) -> None:
+        await self.pipeline(("DEL", key))
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._reset()
+
+
+def create_backend(url: str) -> StateBackend:
+    if url.startswith(("redis://", "rediss://")):
+        return RedisStateBackend(url)
+    return MemoryStateBackend()
+
+
+state_backend = create_backend(config.STATE_BACKEND_URL)
+
+
+async def check_rate_limit(user_id: int, group_id: int, command: str, limit: int) -> bool:
+    """التحقق من معدل الاستخدام بعداد نافذة دقيقة مشترك بين النسخ"""
+    try:
+        count = await state_backend.incr_window(f"rl:{group_id}:{user_id}:{command}", 60)
+        return count <= limit
+    except Exception as e:
+        logger.error(f"Rate limit check failed: {e}")
+        return True
+
+
+async def get_cached_json(key: str) -> Optional[Any]:
+    try:
+        value = await state_backend.get(key)
+    except Exception as e:
+        logger.error(f"فشل في قراءة التخزين المؤقت المشترك: {e}")
+        return None
+    return json.loads(value) if value is not None else None
+
+
+async def set_cached_json(key: str, value: Any, ttl: int) -> None:
+    try:
+        await state_backend.set(key, json.dumps(value, ensure_ascii=False, separators=(",", ":")), ttl=ttl)
+    except Exception as e:
+        logger.error(f"فشل في الكتابة إلى التخزين المؤقت المشترك: {e}")
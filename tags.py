@@ -0,0 +1,250 @@
+import logging
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+
+from database import engine, get_db, Member, MemberTag
+import config
+
+logger = logging.getLogger(__name__)
+
+TAG_CACHE_SIZE = 512
+MAX_TAG_NAME = 32
+
+# الوسوم المحجوزة تُحسب من جدول الأعضاء عند الطلب ولا تُخزن
+BUILTIN_TAGS = ("all", "admins", "bots", "active", "new")
+
+
+class TagError(ValueError):
+    """خطأ في اسم وسم أو تعبير وسوم، رسالته صالحة لعرضها للمستخدم"""
+
+
+def encode_ids(ids: Iterable[int]) -> bytes:
+    """تخزين المعرفات كمصفوفة مرتبة بفروق متتالية مضغوطة"""
+    ordered = sorted(set(ids))
+    deltas = array("q", [b - a for a, b in zip([0] + ordered, ordered)])
+    return zlib.compress(deltas.tobytes())
+
+
+def decode_ids(blob: bytes) -> FrozenSet[int]:
+    deltas = array("q")
+    deltas.frombytes(zlib.decompress(blob))
+    return frozenset(accumulate(deltas))
+
+
+def _parse_rule(rule: str) -> Tuple[str, Optional[int]]:
+    name, _, arg = rule.partition(":")
+    if name not in BUILTIN_TAGS:
+        raise TagError(f"قاعدة غير معروفة: {rule}")
+    if name in ("active", "new"):
+        try:
+            days = int(arg) if arg else 7
+        except ValueError:
+            raise TagError(f"عدد أيام غير صحيح في القاعدة: {rule}")
+        return name, max(days, 1)
+    return name, None
+
+
+def evaluate_rule(group_id: int, rule: str) -> FrozenSet[int]:
+    """حساب أعضاء قاعدة مثل active:7 بقراءة عمود المعرف فقط"""
+    name, days = _parse_rule(rule)
+    query = select(Member.user_id).where(Member.group_id == group_id, Member.is_active == True)
+    if name == "bots":
+        query = query.where(Member.is_bot == True)
+    else:
+        query = query.where(Member.is_bot == False)
+    if name == "admins":
+        query = query.where(Member.is_admin == True)
+    elif name == "active":
+        query = query.where(Member.last_seen >= datetime.utcnow() - timedelta(days=days))
+    elif name == "new":
+        query = query.where(Member.joined_date >= datetime.utcnow() - timedelta(days=days))
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=config.MEMBER_STREAM_BATCH).execute(query)
+        return frozenset(user_id for partition in result.partitions() for (user_id,) in partition)
+
+
+def validate_name(name: str) -> str:
+    name = name.lstrip("#").lower()
+    if not name or len(name) > MAX_TAG_NAME or not all(c.isalnum() or c == "_" for c in name):
+        raise TagError("اسم الوسم يجب أن يتكون من حروف وأرقام و _ فقط")
+    if name in BUILTIN_TAGS:
+        raise TagError(f"الوسم #{name} محجوز")
+    return name
+
+
+def parse_expression(tokens: List[str]) -> List[Tuple[str, str]]:
+    """تحويل ['#devs', '-#bots', '&#active'] إلى [('+', 'devs'), ('-', 'bots'), ('&', 'active')]"""
+    terms = []
+    for token in tokens:
+        op = token[0] if token[:1] in ("+", "-", "&") else "+"
+        name = token[1:] if op == token[:1] else token
+        if not name.startswith("#") or len(name) < 2:
+            raise TagError(f"تعبير غير صحيح: {token}")
+        terms.append((op, name[1:].lower()))
+    if not terms:
+        raise TagError("حدد وسماً واحداً على الأقل، مثال: /mention #devs -#bots")
+    if terms[0][0] != "+":
+        raise TagError("يجب أن يبدأ التعبير بوسم بدون - أو &")
+    return terms
+
+
+class TagStore:
+    """وسوم الأعضاء لكل مجموعة مع ذاكرة مؤقتة لمجموعات المعرفات المفكوكة
+
+    كل وسم يُخزن كمصفوفة معرفات مرتبة ومضغوطة، ويُفك مرة واحدة إلى frozenset
+    تبقى في الذاكرة، فيصبح الاتحاد والتقاطع والفرق عمليات على مجموعات جاهزة.
+    """
+
+    def __init__(self, cache_size: int = TAG_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[int, str], FrozenSet[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: Tuple[int, str], ids: FrozenSet[int]) -> None:
+        with self._lock:
+            self._cache[key] = ids
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, key: Tuple[int, str]) -> None:
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def get(self, group_id: int, name: str) -> Optional[FrozenSet[int]]:
+        key = (group_id, name)
+        ids = self._cache.get(key)
+        if ids is not None:
+            return ids
+        with get_db() as db:
+            blob = db.execute(
+                select(MemberTag.members).where(MemberTag.group_id == group_id, MemberTag.name == name)
+            ).scalar_one_or_none()
+        if blob is None:
+            return None
+        ids = decode_ids(blob)
+        self._remember(key, ids)
+        return ids
+
+    def save(self, group_id: int, name: str, ids: Iterable[int], rule: Optional[str] = None) -> int:
+        ids = frozenset(ids)
+        with get_db() as db:
+            tag = db.query(MemberTag).filter(MemberTag.group_id == group_id, MemberTag.name == name).first()
+            if tag is None:
+                tag = MemberTag(group_id=group_id, name=name)
+                db.add(tag)
+            tag.members = encode_ids(ids)
+            tag.member_count = len(ids)
+            if rule is not None:
+                tag.rule = rule
+        self._remember((group_id, name), ids)
+        return len(ids)
+
+    def add(self, group_id: int, name: str, user_ids: Iterable[int]) -> int:
+        return self.save(group_id, name, (self.get(group_id, name) or frozenset()) | set(user_ids))
+
+    def remove(self, group_id: int, name: str, user_ids: Iterable[int]) -> int:
+        current = self.get(group_id, name)
+        if current is None:
+            raise TagError(f"الوسم #{name} غير موجود")
+        return self.save(group_id, name, current - set(user_ids))
+
+    def delete(self, group_id: int, name: str) -> bool:
+        with get_db() as db:
+            removed = db.execute(
+                delete(MemberTag).where(MemberTag.group_id == group_id, MemberTag.name == name)
+            ).rowcount
+        self._forget((group_id, name))
+        return bool(removed)
+
+    def list(self, group_id: int) -> List[Tuple[str, int, Optional[str]]]:
+        with get_db() as db:
+            rows = db.execute(
+                select(MemberTag.name, MemberTag.member_count, MemberTag.rule)
+                .where(MemberTag.group_id == group_id)
+                .order_by(MemberTag.name)
+            ).all()
+        return [(row.name, row.member_count, row.rule) for row in rows]
+
+    def set_rule(self, group_id: int, name: str, rule: str) -> int:
+        """ربط الوسم بقاعدة وتحديث أعضائه منها فوراً"""
+        _parse_rule(rule)
+        return self.save(group_id, name, evaluate_rule(group_id, rule), rule=rule)
+
+    def refresh_rules(self) -> int:
+        """إعادة حساب كل الوسوم المرتبطة بقواعد"""
+        with get_db() as db:
+            rows = db.execute(
+                select(MemberTag.group_id, MemberTag.name, MemberTag.rule).where(MemberTag.rule != None)
+            ).all()
+        for row in rows:
+            try:
+                self.save(row.group_id, row.name, evaluate_rule(row.group_id, row.rule))
+            except Exception as e:
+                logger.error(f"فشل في تحديث الوسم #{row.name} للمجموعة {row.group_id}: {e}")
+        return len(rows)
+
+    def resolve(self, group_id: int, tokens: List[str]) -> FrozenSet[int]:
+        """تقييم تعبير وسوم من اليسار إلى اليمين وإرجاع معرفات الأعضاء"""
+        builtins: Dict[str, FrozenSet[int]] = {}
+        result: FrozenSet[int] = frozenset()
+        for op, name in parse_expression(tokens):
+            base = name.partition(":")[0]
+            if base in BUILTIN_TAGS:
+                if name not in builtins:
+                    builtins[name] = evaluate_rule(group_id, name)
+                ids = builtins[name]
+            else:
+                ids = self.get(group_id, name)
+                if ids is None:
+                    raise TagError(f"الوسم #{name} غير موجود")
+            if op == "+":
+                result = result | ids
+            elif op == "-":
+                result = result - ids
+            else:
+                result = result & ids
+        return result
+
+
+tag_store = TagStore()
+
+
+def resolve_user_refs(group_id: int, refs: List[str]) -> Tuple[List[int], List[str]]:
+    """تحويل @username أو معرفات رقمية إلى معرفات أعضاء، مع إرجاع ما لم يُعرف"""
+    ids, usernames, unknown = [], {}, []
+    for ref in refs:
+        if ref.lstrip("-").isdigit():
+            ids.append(int(ref))
+        else:
+            usernames[ref.lstrip("@").lower()] = ref
+    if usernames:
+        with get_db() as db:
+            rows = db.execute(
+                select(Member.user_id, Member.username)
+                .where(Member.group_id == group_id, Member.username != None)
+                # أسماء مستخدمي Telegram لا تميز حالة الأحرف
+                .where(func.lower(Member.username).in_([func.lower(name) for name in usernames]))
+            ).all()
+        found = {row.username.lower(): row.user_id for row in rows}
+        for key, ref in usernames.items():
+            if key in found:
+                ids.append(found[key])
+            else:
+                unknown.append(ref)
+    return ids, unknown
+
+
+def refresh_rule_tags() -> None:
+    """وظيفة الجدولة لتحديث الوسوم المبنية على قواعد"""
+    refreshed = tag_store.refresh_rules()
+    if refreshed:
+        logger.debug(f"تم تحديث {refreshed} وسم مبني على قاعدة")
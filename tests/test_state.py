@@ -0,0 +1,166 @@
+import asyncio
+import time
+import unittest
+
+from state import MemoryStateBackend, RedisError, RedisStateBackend
+
+
+class FakeRedis:
+    """خادم صغير يتحدث بروتوكول RESP ويدعم الأوامر التي تستخدمها الواجهة فقط"""
+
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.commands = []
+        self.connections = 0
+        self.writers = []
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{port}/2"
+
+    async def stop(self) -> None:
+        self.drop_connections()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def drop_connections(self) -> None:
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2].decode())
+        return args
+
+    async def _serve(self, reader, writer) -> None:
+        self.connections += 1
+        self.writers.append(writer)
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                self.commands.append(args)
+                writer.write(self._execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _alive(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    def _execute(self, args) -> bytes:
+        name = args[0].upper()
+        if name == "AUTH":
+            return b"+OK\r\n" if args[1] == self.password else b"-WRONGPASS invalid password\r\n"
+        if name == "SELECT":
+            return b"+OK\r\n"
+        if name == "GET":
+            entry = self._alive(args[1])
+            if entry is None:
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(entry[0].encode()), entry[0].encode())
+        if name == "SET":
+            key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+            if "NX" in options and self._alive(key) is not None:
+                return b"$-1\r\n"
+            ttl = int(args[3 + options.index("EX") + 1]) if "EX" in options else None
+            self.data[key] = (value, time.monotonic() + ttl if ttl else None)
+            return b"+OK\r\n"
+        if name == "INCR":
+            entry = self._alive(args[1]) or ("0", None)
+            if not entry[0].lstrip("-").isdigit():
+                return b"-ERR value is not an integer or out of range\r\n"
+            value = int(entry[0]) + 1
+            self.data[args[1]] = (str(value), entry[1])
+            return b":%d\r\n" % value
+        if name == "DEL":
+            return b":%d\r\n" % (self.data.pop(args[1], None) is not None)
+        return b"-ERR unknown command\r\n"
+
+
+class RedisStateBackendTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakeRedis(password="secret")
+        self.backend = RedisStateBackend(await self.server.start())
+
+    async def asyncTearDown(self):
+        await self.backend.close()
+        await self.server.stop()
+
+    async def test_connect_authenticates_and_selects_database(self):
+        await self.backend.get("missing")
+        self.assertEqual(self.server.commands[:2], [["AUTH", "secret"], ["SELECT", "2"]])
+
+    async def test_incr_window_counts_and_sets_ttl_once(self):
+        self.assertEqual(await self.backend.incr_window("rl:1", 60), 1)
+        expires = self.server.data["rl:1"][1]
+        self.assertEqual(await self.backend.incr_window("rl:1", 60), 2)
+        self.assertEqual(await self.backend.incr_window("rl:1", 60), 3)
+        self.assertEqual(self.server.data["rl:1"][1], expires)
+        self.assertAlmostEqual(expires - time.monotonic(), 60, delta=1)
+
+    async def test_incr_window_is_one_round_trip(self):
+        writes = []
+        await self.backend.get("warm-up")
+        write = self.backend._writer.write
+        self.backend._writer.write = lambda data: (writes.append(data), write(data))[1]
+        await self.backend.incr_window("rl:2", 60)
+        self.assertEqual(len(writes), 1)
+        self.assertIn(b"SET", writes[0])
+        self.assertIn(b"INCR", writes[0])
+
+    async def test_set_get_delete(self):
+        self.assertTrue(await self.backend.set("k", "قيمة", ttl=30))
+        self.assertEqual(await self.backend.get("k"), "قيمة")
+        self.assertFalse(await self.backend.set("k", "other", nx=True))
+        self.assertEqual(await self.backend.get("k"), "قيمة")
+        await self.backend.delete("k")
+        self.assertIsNone(await self.backend.get("k"))
+
+    async def test_reconnects_after_connection_drop(self):
+        await self.backend.set("k", "v")
+        self.server.drop_connections()
+        await asyncio.sleep(0)
+        self.assertEqual(await self.backend.get("k"), "v")
+        self.assertEqual(self.server.connections, 2)
+
+    async def test_error_reply_raises(self):
+        await self.backend.set("k", "not-a-number")
+        with self.assertRaises(RedisError):
+            await self.backend.incr_window("k", 60)
+
+
+class MemoryStateBackendTest(unittest.IsolatedAsyncioTestCase):
+    async def test_incr_window_expires(self):
+        backend = MemoryStateBackend()
+        self.assertEqual(await backend.incr_window("rl", 1), 1)
+        self.assertEqual(await backend.incr_window("rl", 1), 2)
+        backend._data["rl"] = (backend._data["rl"][0], time.monotonic() - 1)
+        self.assertEqual(await backend.incr_window("rl", 1), 1)
+
+    async def test_set_nx(self):
+        backend = MemoryStateBackend()
+        self.assertTrue(await backend.set("k", "a", nx=True))
+        self.assertFalse(await backend.set("k", "b", nx=True))
+        self.assertEqual(await backend.get("k"), "a")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from telegram.error import NetworkError
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 512
+
+
+class CircuitOpenError(NetworkError):
+    """رفض فوري للطلب لأن الدائرة مفتوحة لهذه الطريقة"""
+
+
+class CircuitBreaker:
+    """قاطع دائرة لكل طريقة API: يرفض الطلبات بسرعة عند تكرار الفشل"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        # في الحالة نصف المفتوحة نسمح بطلب تجريبي ونعيد العد
+        if self.state == "half_open":
+            self.opened_at = time.monotonic()
+            return True
+        return self.opened_at is None
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"فتح قاطع الدائرة بعد {self.failures} محاولات فاشلة")
+            self.opened_at = time.monotonic()
+
+
+class EndpointStats:
+    """إحصائيات زمن الاستجابة لطريقة API واحدة"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.samples: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, elapsed: float, failed: bool) -> None:
+        self.calls += 1
+        self.errors += failed
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.samples.append(elapsed)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "avg": self.total_time / self.calls if self.calls else 0.0,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "max": self.max_time,
+        }
+
+
+_stats: Dict[str, EndpointStats] = {}
+
+
+def get_endpoint_stats() -> Dict[str, Dict[str, float]]:
+    """إحصائيات جميع طرق API المستدعاة منذ بدء التشغيل"""
+    return {method: stats.as_dict() for method, stats in sorted(_stats.items())}
+
+
+def _http_version() -> str:
+    if config.HTTP_VERSION != "2":
+        return "1.1"
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("مكتبة h2 غير مثبتة، سيتم استخدام HTTP/1.1")
+        return "1.1"
+    return "2"
+
+
+class TunedRequest(HTTPXRequest):
+    """طبقة نقل مع مهلات لكل طريقة وقاطع دائرة وقياس زمن الاستجابة"""
+
+    def __init__(self, connection_pool_size: int, read_timeout: float,
+                 method_timeouts: Optional[Dict[str, float]] = None, use_breaker: bool = True):
+        super().__init__(
+            connection_pool_size=connection_pool_size,
+            read_timeout=read_timeout,
+            write_timeout=config.REQUEST_TIMEOUT,
+            connect_timeout=config.CONNECT_TIMEOUT,
+            pool_timeout=config.POOL_TIMEOUT,
+            http_version=_http_version(),
+        )
+        self._method_timeouts = method_timeouts or {}
+        self._use_breaker = use_breaker
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def _breaker(self, method: str) -> CircuitBreaker:
+        breaker = self._breakers.get(method)
+        if breaker is None:
+            breaker = self._breakers[method] = CircuitBreaker(
+                config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RESET_TIMEOUT
+            )
+        return breaker
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        stats = _stats.get(api_method) or _stats.setdefault(api_method, EndpointStats())
+        breaker = self._breaker(api_method) if self._use_breaker else None
+
+        if breaker is not None and not breaker.allow():
+            stats.rejected += 1
+            raise CircuitOpenError(f"قاطع الدائرة مفتوح للطريقة {api_method}")
+
+        if read_timeout is BaseRequest.DEFAULT_NONE and api_method in self._method_timeouts:
+            read_timeout = self._method_timeouts[api_method]
+
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(
+                url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+            )
+        except NetworkError:
+            stats.record(time.perf_counter() - started, True)
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+
+        # أخطاء الخادم فقط تُحتسب على قاطع الدائرة؛ 4xx تعني طلباً خاطئاً لا خدمة متدهورة
+        failed = code >= 500
+        stats.record(time.perf_counter() - started, failed)
+        if breaker is not None:
+            if failed:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return code, payload
+
+
+def build_request() -> TunedRequest:
+    """طبقة النقل لطلبات البوت العادية"""
+    return TunedRequest(
+        connection_pool_size=config.CONNECTION_POOL_SIZE,
+        read_timeout=config.REQUEST_TIMEOUT,
+        method_timeouts={
+            "sendMessage": config.SEND_MESSAGE_TIMEOUT,
+            "getChatMember": config.GET_CHAT_MEMBER_TIMEOUT,
+        },
+    )
+
+
+def build_get_updates_request() -> TunedRequest:
+    """طبقة نقل منفصلة لـ getUpdates حتى لا يحجز الاستطلاع الطويل اتصالات الإرسال"""
+    return TunedRequest(
+        connection_pool_size=1,
+        read_timeout=config.GET_UPDATES_TIMEOUT,
+        use_breaker=False,
+    )
@@ -1,16 +1,19 @@
 import asyncio
 import logging
-import cachetools
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import AbstractSet, List, Dict, Any, Optional, Tuple, AsyncIterator, Iterable
 from telegram import Bot
 from telegram.constants import ChatMemberStatus, ParseMode
+from sqlalchemy import select
 
-from database import get_db, Group, Member
+from database import get_db, Group, Member, MemberRow, iter_member_rows, fetch_member_rows
+from outbound import Priority, priority
+from cleanup import schedule_deletions
+from runtime import runtime_config
+from state import get_cached_json, set_cached_json, state_backend
 import config
 
 logger = logging.getLogger(__name__)
-cache = cachetools.TTLCache(maxsize=100, ttl=config.CACHE_TIMEOUT)
 
 async def is_user_group_admin(bot: Bot, chat_id: int, user_id: int) -> bool:
     """التحقق من أن المستخدم هو مشرف في المجموعة"""
@@ -47,55 +50,89 @@ async def has_bot_permissions(bot: Bot, chat_id: int, permissions: List[str]) ->
         logger.error(f"فشل في التحقق من صلاحيات البوت: {e}")
         return False
 
-async def get_chat_members_safe(bot: Bot, chat_id: int, force_update: bool = False) -> List[Dict[str, Any]]:
+async def get_admin_rows(bot: Bot, chat_id: int, force_update: bool = False) -> List[MemberRow]:
+    """مشرفو المجموعة (دون البوتات) مع التخزين المؤقت لتجنب get_chat_administrators المتكرر"""
+    cache_key = f"admins:{chat_id}"
+    if not force_update:
+        cached = await get_cached_json(cache_key)
+        if cached is not None:
+            return [MemberRow._make(row) for row in cached]
+    
+    admins = await bot.get_chat_administrators(chat_id)
+    rows = [
+        MemberRow(admin.user.id, admin.user.username, admin.user.first_name, admin.user.last_name)
+        for admin in admins if not admin.user.is_bot
+    ]
+    await set_cached_json(cache_key, rows, runtime_config.current.CACHE_TIMEOUT)
+    return rows
+
+async def get_group_settings(chat_id: int) -> Dict[str, Any]:
+    """إعدادات المجموعة ولغتها (المفتاح language) من التخزين المؤقت أو قاعدة البيانات"""
+    cache_key = f"settings:{chat_id}"
+    cached = await get_cached_json(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        with get_db() as db:
+            row = db.execute(
+                select(Group.settings, Group.group_language).where(Group.group_id == chat_id)
+            ).one_or_none()
+    except Exception as e:
+        logger.error(f"فشل في جلب إعدادات المجموعة: {e}")
+        return {}
+    settings = dict(row.settings or {}) if row else {}
+    settings["language"] = (row.group_language if row else None) or config.DEFAULT_LANGUAGE
+    await set_cached_json(cache_key, settings, runtime_config.current.CACHE_TIMEOUT)
+    return settings
+
+async def invalidate_group_settings(chat_id: int) -> None:
+    try:
+        await state_backend.delete(f"settings:{chat_id}")
+    except Exception as e:
+        logger.error(f"فشل في إبطال إعدادات المجموعة المخزنة: {e}")
+
+async def invalidate_members_cache(chat_id: int) -> None:
+    try:
+        await state_backend.delete(f"members:{chat_id}")
+    except Exception as e:
+        logger.error(f"فشل في إبطال قائمة الأعضاء المخزنة: {e}")
+
+async def get_chat_members_safe(bot: Bot, chat_id: int, force_update: bool = False) -> List[MemberRow]:
     """جلب أعضاء المجموعة بطريقة آمنة مع التخزين المؤقت"""
-    cache_key = f"members_{chat_id}"
-    if not force_update and cache_key in cache:
-        return cache[cache_key]
+    cache_key = f"members:{chat_id}"
+    if not force_update:
+        cached = await get_cached_json(cache_key)
+        if cached is not None:
+            return [MemberRow._make(row) for row in cached]
     
     members_list = []
     
     try:
         # محاولة جلب المشرفين أولاً
-        admins = await bot.get_chat_administrators(chat_id)
-        for admin in admins:
-            user = admin.user
-            if not user.is_bot:
-                members_list.append({
-                    "id": user.id,
-                    "username": user.username,
-                    "first_name": user.first_name,
-                    "last_name": user.last_name,
-                    "is_bot": user.is_bot,
-                    "is_admin": True
-                })
+        members_list = await get_admin_rows(bot, chat_id, force_update)
     except Exception as e:
         logger.error(f"فشل في جلب المشرفين: {e}")
     
     # استخدام بيانات قاعدة البيانات كبديل
     if not members_list:
         try:
-            with get_db() as db:
-                db_members = db.query(Member).filter(
-                    Member.group_id == chat_id, 
-                    Member.is_bot == False
-                ).all()
-                
-                for member in db_members:
-                    members_list.append({
-                        "id": member.user_id,
-                        "username": member.username,
-                        "first_name": member.first_name,
-                        "last_name": member.last_name,
-                        "is_bot": member.is_bot,
-                        "is_admin": member.is_admin
-                    })
+            members_list = list(iter_member_rows(chat_id, include_bots=False))
         except Exception as e:
             logger.error(f"فشل في جلب الأعضاء من قاعدة البيانات: {e}")
     
-    cache[cache_key] = members_list
+    await set_cached_json(cache_key, members_list, runtime_config.current.CACHE_TIMEOUT)
     return members_list
 
+def format_member_mention(member: MemberRow) -> str:
+    """نص الإشارة لعضو واحد حسب MENTION_FORMAT"""
+    if config.MENTION_FORMAT == "id":
+        name = (member.first_name or str(member.user_id)).replace("[", "").replace("]", "")
+        return f"[{name}](tg://user?id={member.user_id})"
+    if member.username:
+        return f"@{member.username}"
+    return member.first_name or str(member.user_id)
+
 def format_mention_text(custom_message: str, mentions: List[str]) -> str:
     """تنسيق نص الإشارة مع الرسالة المخصصة"""
     if not mentions:
@@ -112,69 +149,155 @@ def format_mention_text(custom_message: str, mentions: List[str]) -> str:
     
     return full_text
 
-async def mention_members_batch(bot: Bot, chat_id: int, members: List[Member], custom_message: str = None) -> int:
+async def get_mention_header(chat_id: int) -> str:
+    """الرسالة المخصصة للمجموعة أو الرسالة الافتراضية"""
+    settings = await get_group_settings(chat_id)
+    return settings.get("custom_message") or config.DEFAULT_MENTION_MESSAGE
+
+async def _send_mention_message(bot: Bot, chat_id: int, text: str) -> Optional[int]:
+    """إرسال رسالة إشارة وإرجاع معرفها، أو None عند الفشل"""
+    try:
+        with priority(Priority.BULK):
+            message = await bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                parse_mode=ParseMode.MARKDOWN if config.MENTION_FORMAT == "id" else None
+            )
+        return message.message_id
+    except Exception as e:
+        logger.error(f"فشل في إرسال الإشارات: {e}")
+        return None
+
+async def _schedule_auto_delete(chat_id: int, message_ids: List[int]) -> None:
+    """جدولة حذف رسائل الإشارة إذا فعّلت المجموعة الحذف التلقائي"""
+    ttl_minutes = (await get_group_settings(chat_id)).get("auto_delete_minutes")
+    if ttl_minutes and message_ids:
+        await asyncio.to_thread(schedule_deletions, chat_id, message_ids, ttl_minutes)
+
+async def mention_members_batch(bot: Bot, chat_id: int, members: List[MemberRow], custom_message: str = None) -> int:
     """إرسال منشن لمجموعة من الأعضاء في دفعة واحدة"""
     if not members:
         return 0
     
     if custom_message is None:
-        group = get_group(chat_id)
-        custom_message = group.custom_message if group else config.DEFAULT_MESSAGE
+        custom_message = await get_mention_header(chat_id)
     
     # تجهيز نصوص الإشارات
-    mention_texts = [member.get_mention_text() for member in members]
+    mention_texts = [format_member_mention(member) for member in members]
     message = format_mention_text(custom_message, mention_texts)
     
-    try:
-        # إرسال الرسالة
-        await bot.send_message(
-            chat_id=chat_id,
-            text=message,
-            parse_mode=ParseMode.MARKDOWN if config.MENTION_FORMAT == "id" else None
-        )
-        return len(members)
-    except Exception as e:
-        logger.error(f"فشل في إرسال الإشارات: {e}")
+    message_id = await _send_mention_message(bot, chat_id, message)
+    if message_id is None:
         return 0
+    await _schedule_auto_delete(chat_id, [message_id])
+    return len(members)
 
-async def mention_all_members(bot: Bot, chat_id: int, members: List[Member] = None) -> Tuple[int, int]:
-    """إرسال منشن لجميع الأعضاء على دفعات"""
-    if members is None:
-        members_data = await get_chat_members_safe(bot, chat_id)
-        members = []
-        for data in members_data:
-            member = Member(
-                user_id=data["id"],
-                username=data["username"],
-                first_name=data["first_name"],
-                last_name=data["last_name"],
-                is_bot=data["is_bot"],
-                is_admin=data["is_admin"]
-            )
-            members.append(member)
+# مراحل خط الإشارة: كل مرحلة مولّد غير متزامن يسحب من السابقة عند الحاجة فقط،
+# لذا تبقى الذاكرة ثابتة مهما كان عدد الأعضاء وتخرج أول رسالة فور امتلاء أول دفعة.
+
+async def _stream_db_members(chat_id: int) -> AsyncIterator[MemberRow]:
+    """قراءة الأعضاء من قاعدة البيانات على دفعات قصيرة بترتيب المفتاح
+
+    كل دفعة استعلام مستقل في خيط التنفيذ يُعيد الاتصال فوراً، فلا يبقى مؤشر
+    أو معاملة قراءة مفتوحة أثناء انتظار الإرسال والتأخير بين الرسائل.
+    الدفعة التالية تُجلب أثناء استهلاك الحالية.
+    """
+    def fetch(after_id: int):
+        return fetch_member_rows(chat_id, after_id, config.PIPELINE_CHUNK_SIZE, include_bots=False)
     
-    if not members:
-        return 0, 0
+    pending = asyncio.ensure_future(asyncio.to_thread(fetch, 0))
+    try:
+        while True:
+            try:
+                rows, after_id = await pending
+            except Exception as e:
+                logger.error(f"فشل في جلب الأعضاء من قاعدة البيانات: {e}")
+                return
+            if len(rows) < config.PIPELINE_CHUNK_SIZE:
+                pending = None
+            else:
+                pending = asyncio.ensure_future(asyncio.to_thread(fetch, after_id))
+            for row in rows:
+                yield row
+            if pending is None:
+                return
+    finally:
+        # المستهلك توقف مبكراً: الدفعة المجلوبة مسبقاً لا تُستخدم
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+async def roster_source(bot: Optional[Bot], chat_id: int) -> AsyncIterator[MemberRow]:
+    """المشرفون من Telegram أولاً ثم باقي الأعضاء من قاعدة البيانات دون تكرار"""
+    admin_ids = set()
+    if bot is not None:
+        try:
+            for row in await get_admin_rows(bot, chat_id):
+                admin_ids.add(row.user_id)
+                yield row
+        except Exception as e:
+            logger.error(f"فشل في جلب المشرفين: {e}")
     
-    # تقسيم الأعضاء إلى دفعات
-    batch_size = config.DEFAULT_BATCH_SIZE
-    batches = [members[i:i + batch_size] for i in range(0, len(members), batch_size)]
+    async for row in _stream_db_members(chat_id):
+        if row.user_id not in admin_ids:
+            yield row
+
+async def _iterate(members: Iterable[MemberRow]) -> AsyncIterator[MemberRow]:
+    for member in members:
+        yield member
+
+async def filter_members(rows: AsyncIterator[MemberRow], exclude_ids: Iterable[int] = (),
+                         include_ids: Optional[AbstractSet[int]] = None) -> AsyncIterator[MemberRow]:
+    excluded = set(exclude_ids)
+    async for row in rows:
+        if row.user_id not in excluded and (include_ids is None or row.user_id in include_ids):
+            yield row
+
+async def render_mentions(rows: AsyncIterator[MemberRow]) -> AsyncIterator[Tuple[MemberRow, str]]:
+    async for row in rows:
+        yield row, format_member_mention(row)
+
+async def pack_messages(rendered: AsyncIterator[Tuple[MemberRow, str]], header: str) -> AsyncIterator[Tuple[int, str]]:
+    """تجميع الإشارات في رسائل لا تتجاوز حجم الدفعة ولا الحد الأقصى للطول"""
+    mentions: List[str] = []
+    length = len(header) + 2
+    async for _, mention in rendered:
+        if mentions and (len(mentions) >= runtime_config.current.DEFAULT_BATCH_SIZE or
+                         length + len(mention) + 1 > config.MAX_MESSAGE_LENGTH):
+            yield len(mentions), format_mention_text(header, mentions)
+            mentions = []
+            length = len(header) + 2
+        mentions.append(mention)
+        length += len(mention) + 1
+    if mentions:
+        yield len(mentions), format_mention_text(header, mentions)
+
+async def send_messages(bot: Bot, chat_id: int, packed: AsyncIterator[Tuple[int, str]]) -> Tuple[int, int]:
+    """إرسال الرسائل المجمعة مع احترام ميزانية API والتأخير بين الدفعات"""
     total_mentioned = 0
-    successful_batches = 0
+    message_ids = []
+    first = True
     
-    for batch in batches:
-        try:
-            mentioned_count = await mention_members_batch(bot, chat_id, batch)
-            total_mentioned += mentioned_count
-            successful_batches += 1
-            
-            # تأخير بين الدفعات
-            await asyncio.sleep(config.MENTION_DELAY)
-        except Exception as e:
-            logger.error(f"فشل في إرسال دفعة الإشارات: {e}")
-            continue
+    async for count, text in packed:
+        # تأخير بين الدفعات
+        if not first:
+            await asyncio.sleep(runtime_config.current.MENTION_DELAY)
+        first = False
+        message_id = await _send_mention_message(bot, chat_id, text)
+        if message_id is not None:
+            total_mentioned += count
+            message_ids.append(message_id)
     
-    return total_mentioned, successful_batches
+    await _schedule_auto_delete(chat_id, message_ids)
+    return total_mentioned, len(message_ids)
+
+async def mention_all_members(bot: Bot, chat_id: int, members: Iterable[MemberRow] = None,
+                              exclude_ids: Iterable[int] = (),
+                              include_ids: Optional[AbstractSet[int]] = None) -> Tuple[int, int]:
+    """إرسال منشن لجميع الأعضاء على دفعات عبر خط معالجة متدفق"""
+    source = roster_source(bot, chat_id) if members is None else _iterate(members)
+    rows = filter_members(source, exclude_ids, include_ids)
+    packed = pack_messages(render_mentions(rows), await get_mention_header(chat_id))
+    return await send_messages(bot, chat_id, packed)
 
 async def update_member_activity(bot: Bot, user_id: int, chat_id: int, is_admin: bool = False) -> None:
     """تحديث نشاط العضو في قاعدة البيانات"""
@@ -195,6 +318,8 @@ async def update_member_activity(bot: Bot, user_id: int, chat_id: int, is_admin:
                 member.last_name = user.last_name or member.last_name
                 member.username = user.username or member.username
                 member.is_admin = is_admin
+                member.is_active = True
+                member.last_verified = datetime.utcnow()
             else:
                 member = Member(
                     user_id=user_id,
@@ -203,7 +328,8 @@ async def update_member_activity(bot: Bot, user_id: int, chat_id: int, is_admin:
                     first_name=user.first_name,
                     last_name=user.last_name,
                     is_bot=user.is_bot,
-                    is_admin=is_admin
+                    is_admin=is_admin,
+                    last_verified=datetime.utcnow()
                 )
                 db.add(member)
     except Exception as e: